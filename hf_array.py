@@ -4,9 +4,14 @@
 
 提供各种数组操作、DataFrame转换和时间序列合并等功能。
 """
-from typing import List, Union, Optional, Tuple, Any
+from typing import List, Union, Optional, Tuple, Any, Callable, Iterable
+import os
+import shutil
+import tempfile
+from concurrent.futures import ProcessPoolExecutor
 import numpy as np
 import pandas as pd
+import pyarrow.parquet as pq
 from functools import reduce
 from copy import copy
 
@@ -58,6 +63,143 @@ def value_change_and_change_to_merge(
 
 
 
+def segmented_accumulate(
+    values: np.ndarray,
+    starts: np.ndarray,
+    ufunc: np.ufunc = np.add
+) -> np.ndarray:
+    """
+    分段累积运算（每段从头开始累加或累乘）
+
+    各段按长度分桶（同桶长度相差不超过2倍），每桶排成补齐单位元的矩阵后
+    沿行做ufunc.accumulate。逐行累积的顺序与Python逐个累加完全相同，
+    结果不受其他段数值大小的影响。
+
+    Args:
+        values: 值数组，同一段的元素必须相邻
+        starts: 布尔数组，标识每段的第一个元素
+        ufunc: 累积运算，需要有单位元，例如np.add或np.multiply
+
+    Returns:
+        np.ndarray: 分段累积结果
+    """
+    values = np.asarray(values)
+    starts = np.asarray(starts, dtype=bool)
+    n = len(values)
+    out = np.empty(n, dtype=values.dtype)
+    if n == 0:
+        return out
+
+    seg_starts = np.flatnonzero(starts)
+    if len(seg_starts) == 0 or seg_starts[0] != 0:
+        seg_starts = np.r_[0, seg_starts]
+    seg_lens = np.diff(np.r_[seg_starts, n])
+    buckets = np.ceil(np.log2(seg_lens)).astype(np.int64)
+
+    for k in np.unique(buckets):
+        sel = buckets == k
+        width = 2 ** int(k)
+        cols = np.arange(width)
+        valid = cols[None, :] < seg_lens[sel][:, None]
+        idx = (seg_starts[sel][:, None] + cols[None, :])[valid]
+        mat = np.full(valid.shape, ufunc.identity, dtype=values.dtype)
+        mat[valid] = values[idx]
+        out[idx] = ufunc.accumulate(mat, axis=1)[valid]
+
+    return out
+
+
+def _get_group_order(codes: np.ndarray) -> Tuple[Union[np.ndarray, slice], np.ndarray]:
+    """
+    计算把同组的行排在一起（组内保持原有顺序）的行顺序
+
+    Args:
+        codes: 分组编码数组
+
+    Returns:
+        Tuple: (行顺序，已按组排列时为slice(None)), 排序后每组第一行的布尔标识)
+    """
+    n = len(codes)
+    # 已按组排列时（编码不减）无需重排
+    if n > 1 and (codes[1:] < codes[:-1]).any():
+        order = np.argsort(codes, kind='stable')
+    else:
+        order = slice(None)
+    codes = codes[order]
+    group_start = np.ones(n, dtype=bool)
+    group_start[1:] = codes[1:] != codes[:-1]
+    return order, group_start
+
+
+def value_change_and_change_to_merge_by_group(
+    a_change: np.ndarray,
+    a_change_to: np.ndarray,
+    groups: Optional[np.ndarray] = None,
+    init_value: Union[float, int, dict, pd.Series] = 0
+) -> Tuple[np.ndarray, np.ndarray]:
+    """
+    按分组批量合并变化值和目标值数组（value_change_and_change_to_merge的向量化版本）
+
+    每组内按原有行顺序处理：变化值为缺失的行是重置点，余额重置为目标值；
+    其余行在余额上累加变化值（此时目标值被忽略）。重置点把每组切分为若干段，
+    段内余额用分段累加计算，结果与逐组调用value_change_and_change_to_merge一致。
+
+    Args:
+        a_change: 变化值数组
+        a_change_to: 目标值数组
+        groups: 分组键数组，为None时整体视为一组
+        init_value: 初始值，可以是标量，或以分组键为键的dict/Series
+
+    Returns:
+        Tuple[np.ndarray, np.ndarray]: 与输入行顺序一致的变化值数组和目标值数组
+
+    Raises:
+        ValueError: 当数组长度不匹配，或存在变化值与目标值同时缺失的行时（一次列出全部行号）
+    """
+    if len(a_change) != len(a_change_to):
+        raise ValueError(f'change length {len(a_change)} is not equal to change_to length {len(a_change_to)}')
+
+    change = pd.to_numeric(pd.Series(a_change), errors='raise').to_numpy(dtype=np.float64, na_value=np.nan)
+    change_to = pd.to_numeric(pd.Series(a_change_to), errors='raise').to_numpy(dtype=np.float64, na_value=np.nan)
+    reset = np.isnan(change)
+    missing = np.flatnonzero(reset & np.isnan(change_to))
+    if len(missing) > 0:
+        raise ValueError(f'missing value at index {", ".join(str(item) for item in missing)}')
+
+    n = len(change)
+    if groups is None:
+        codes = np.zeros(n, dtype=np.int64)
+        uniques = pd.Index([None])
+    else:
+        codes, uniques = pd.factorize(np.asarray(groups), use_na_sentinel=False)
+
+    if isinstance(init_value, (dict, pd.Series)):
+        init = pd.Series(uniques).map(init_value).to_numpy(dtype=np.float64, na_value=np.nan)
+    else:
+        init = np.full(len(uniques), init_value, dtype=np.float64)
+
+    order, group_start = _get_group_order(codes)
+    codes = codes[order]
+    c, t, r = change[order], change_to[order], reset[order]
+    init_rows = init[codes]
+
+    # 重置行取目标值；组首的非重置行从初始值开始累加
+    d = np.where(r, t, c)
+    first = group_start & ~r
+    d[first] = init_rows[first] + c[first]
+    balance = segmented_accumulate(d, group_start | r)
+
+    previous = np.empty(n, dtype=np.float64)
+    previous[1:] = balance[:-1]
+    previous[group_start] = init_rows[group_start]
+
+    re_a_change = np.empty(n, dtype=np.float64)
+    re_a_change_to = np.empty(n, dtype=np.float64)
+    re_a_change[order] = np.where(r, t - previous, c)
+    re_a_change_to[order] = balance
+    return re_a_change, re_a_change_to
+
+
 def prod(array: List[Union[float, int]]) -> Union[float, int]:
     """
     计算数组的乘积
@@ -73,6 +215,96 @@ def prod(array: List[Union[float, int]]) -> Union[float, int]:
     return reduce(lambda x, y: x * y, array)
 
 
+def group_cumprod(
+    values: np.ndarray,
+    groups: Optional[np.ndarray] = None,
+    resets: Optional[np.ndarray] = None,
+    log_space: bool = False,
+    errors: str = 'raise',
+    return_flags: bool = False
+) -> Union[np.ndarray, Tuple[np.ndarray, dict]]:
+    """
+    按分组计算累积乘积（prod的分组累积版本），例如逐期连乘增长因子或折现因子
+
+    每组内按原有行顺序连乘，遇到重置标记行时从该行的值重新开始。
+    普通模式逐个相乘，与对每段调用prod的结果一致；log_space模式累加对数绝对值
+    并单独跟踪符号，长链条下不会在中间步骤溢出。
+
+    Args:
+        values: 值数组
+        groups: 分组键数组，为None时整体视为一组；可以直接使用sumprod_timeseries对齐后的分组编号
+        resets: 布尔数组，标识从该行重新开始连乘的行
+        log_space: 是否在对数空间计算
+        errors: 结果上溢（inf）或下溢（由非零因子乘出0或次正规数）时的处理方式
+            - 'raise': 抛出OverflowError
+            - 'ignore': 不处理
+        return_flags: 是否同时返回上溢和下溢标识
+
+    Returns:
+        np.ndarray或Tuple[np.ndarray, dict]: 与输入行顺序一致的累积乘积；
+            return_flags为True时同时返回{'overflow': 布尔数组, 'underflow': 布尔数组}
+
+    Raises:
+        OverflowError: errors为'raise'且出现上溢或下溢时
+        ValueError: 当errors不支持时
+    """
+    if errors not in ('raise', 'ignore'):
+        raise ValueError(f'unsupported errors: {errors}')
+
+    values = np.asarray(values, dtype=np.float64)
+    n = len(values)
+    if groups is None:
+        codes = np.zeros(n, dtype=np.int64)
+    else:
+        codes = pd.factorize(np.asarray(groups), use_na_sentinel=False)[0]
+
+    order, starts = _get_group_order(codes)
+    x = values[order]
+    if resets is not None:
+        starts = starts | np.asarray(resets, dtype=bool)[order]
+
+    # 段内已出现零因子的行，结果为0不算下溢；整数计数用全局cumsum减段首偏移即可精确得到
+    seg_ids = np.cumsum(starts) - 1
+    seg_starts = np.flatnonzero(starts)
+
+    def count_in_segment(flag):
+        counts = np.cumsum(flag, dtype=np.int64)
+        return counts - (counts[seg_starts] - flag[seg_starts])[seg_ids]
+
+    has_zero = count_in_segment(x == 0) > 0
+    finite = count_in_segment(~np.isfinite(x)) == 0
+
+    with np.errstate(over='ignore', under='ignore', invalid='ignore', divide='ignore'):
+        if log_space:
+            log_abs = segmented_accumulate(np.log(np.abs(x)), starts)
+            negative = count_in_segment(x < 0) % 2 == 1
+            res = np.where(negative, -1., 1.) * np.exp(log_abs)
+            overflow = finite & (log_abs > np.log(np.finfo(np.float64).max))
+            underflow = finite & ~has_zero & (log_abs < np.log(np.finfo(np.float64).tiny))
+        else:
+            res = segmented_accumulate(x, starts, np.multiply)
+            overflow = finite & np.isinf(res)
+            underflow = finite & ~has_zero & (np.abs(res) < np.finfo(np.float64).tiny)
+
+    out = np.empty(n, dtype=np.float64)
+    out[order] = res
+    flags = {'overflow': np.empty(n, dtype=bool), 'underflow': np.empty(n, dtype=bool)}
+    flags['overflow'][order] = overflow
+    flags['underflow'][order] = underflow
+
+    if errors == 'raise':
+        for key, flag in flags.items():
+            if flag.any():
+                rows = np.flatnonzero(flag)
+                raise OverflowError(
+                    f'cumulative product {key} in {len(rows)} rows, at index {", ".join(str(item) for item in rows[:10])}'
+                )
+
+    if return_flags:
+        return out, flags
+    return out
+
+
 def get_crop_from_df(
     df: pd.DataFrame,
     anchor_x: int = 0,
@@ -100,33 +332,37 @@ def get_crop_from_df(
     anchor_x -= 1
 
     if vertical:
-        # 垂直处理时交换坐标
+        # 垂直处理时交换坐标，按转置后的坐标取主键行和表头列
         anchor_x, anchor_y = anchor_y, anchor_x
-        df_data = df.values.T
-    else:
-        df_data = df.values
+
+    # 负的起点直接交给iloc切片，与原先numpy切片的截断方式一致（如-len-1视为0）
+    def get_vector(row, start):
+        # 转置后的第row行、从start列开始的值
+        if vertical:
+            return df.iloc[start:, row].to_numpy()
+        return df.iloc[row, start:].to_numpy()
+
+    def get_column(col, start):
+        # 转置后的第col列、从start行开始的值
+        if vertical:
+            return df.iloc[col, start:].to_numpy()
+        return df.iloc[start:, col].to_numpy()
+
+    def count_until_na(values):
+        # 第一个空值之前的元素个数
+        na = pd.isna(values)
+        return int(na.argmax()) if na.any() else len(values)
 
     # 计算行数
     if pk_index is None:
         row_count = 1
     else:
-        row_count = 0
-        for r, value in enumerate(df_data[anchor_x:, anchor_y + pk_index]):
-            if pd.isna(value):
-                row_count = r
-                break
-            row_count = r + 1
+        row_count = count_until_na(get_column(anchor_y + pk_index, anchor_x))
 
     # 计算列数和列名
-    cols = []
-    col_count = 0
-    for c, col_name in enumerate(df_data[anchor_x + col_offset, anchor_y:]):
-        if pd.isna(col_name):
-            col_count = c
-            break
-        cols.append(col_name)
-    else:
-        col_count = len(df_data[anchor_x + col_offset, anchor_y:])
+    header = get_vector(anchor_x + col_offset, anchor_y)
+    col_count = count_until_na(header)
+    cols = list(header[:col_count])
 
     # 裁剪数据
     if vertical:
@@ -140,6 +376,76 @@ def get_crop_from_df(
     return result
 
 
+def find_blocks(df: pd.DataFrame) -> List[Tuple[int, int, int, int]]:
+    """
+    查找表中所有被空行、空列隔开的矩形数据块
+
+    先计算一次非空掩码，再反复按全空的行、列切分（XY-cut），直到每块内部
+    不再有全空的行或列。每次切分都是对掩码子矩阵的向量化any运算。
+
+    Args:
+        df: 源DataFrame，例如读入的整张工作表
+
+    Returns:
+        List[Tuple[int, int, int, int]]: 各数据块的(起始行, 结束行, 起始列, 结束列)，
+            左闭右开，按起始行、起始列排序
+    """
+    mask = df.notna().to_numpy()
+
+    def split(flags):
+        # 非空行（列）的连续段，左闭右开
+        idx = np.flatnonzero(flags)
+        if len(idx) == 0:
+            return []
+        breaks = np.flatnonzero(np.diff(idx) > 1)
+        starts = np.r_[idx[0], idx[breaks + 1]]
+        ends = np.r_[idx[breaks] + 1, idx[-1] + 1]
+        return list(zip(starts, ends))
+
+    blocks = []
+    stack = [(0, mask.shape[0], 0, mask.shape[1])]
+    while stack:
+        r0, r1, c0, c1 = stack.pop()
+        sub = mask[r0:r1, c0:c1]
+        row_parts = split(sub.any(axis=1))
+        col_parts = split(sub.any(axis=0))
+        if len(row_parts) == 1 and len(col_parts) == 1:
+            (rs, re), (cs, ce) = row_parts[0], col_parts[0]
+            blocks.append((int(r0 + rs), int(r0 + re), int(c0 + cs), int(c0 + ce)))
+            continue
+        # 先按空行切分，只有一段时再按空列切分
+        if len(row_parts) > 1:
+            for rs, re in row_parts:
+                stack.append((r0 + rs, r0 + re, c0, c1))
+        else:
+            for cs, ce in col_parts:
+                stack.append((r0, r1, c0 + cs, c0 + ce))
+
+    return sorted(blocks, key=lambda b: (b[0], b[2]))
+
+
+def get_blocks_from_df(df: pd.DataFrame, header: bool = True) -> List[pd.DataFrame]:
+    """
+    裁剪表中所有矩形数据块
+
+    Args:
+        df: 源DataFrame
+        header: 是否把每块的第一行作为列名
+
+    Returns:
+        List[pd.DataFrame]: 各数据块，顺序同find_blocks
+    """
+    res = []
+    for r0, r1, c0, c1 in find_blocks(df):
+        block = df.iloc[r0:r1, c0:c1]
+        if header:
+            columns = list(block.iloc[0])
+            block = block.iloc[1:]
+            block.columns = columns
+        res.append(block.reset_index(drop=True))
+    return res
+
+
 def flatten(lst: List[Any]) -> List[Any]:
     """
     扁平化嵌套列表
@@ -161,12 +467,172 @@ def flatten(lst: List[Any]) -> List[Any]:
     return result
 
 
+def group_ffill_index(present: np.ndarray, group_ids: np.ndarray) -> np.ndarray:
+    """
+    计算分组向前填充时每行取值的来源行号
+
+    group_ids需按分组连续排列。非观测行先置为所在分组起点的前一行，
+    再做一次maximum.accumulate，组内的最大值即组内最近一个观测行，
+    不会跨组取到前一组的观测。
+
+    Args:
+        present: 布尔数组，标识每行是否有观测值
+        group_ids: 分组编号数组，同组的行必须相邻
+
+    Returns:
+        np.ndarray: 每行的来源行号，组内此前没有观测时为-1
+    """
+    present = np.asarray(present, dtype=bool)
+    group_ids = np.asarray(group_ids)
+    n = len(present)
+    if n == 0:
+        return np.zeros(0, dtype=np.int64)
+
+    new_group = np.ones(n, dtype=bool)
+    new_group[1:] = group_ids[1:] != group_ids[:-1]
+    group_start = np.maximum.accumulate(np.where(new_group, np.arange(n), 0))
+
+    rows = np.where(present, np.arange(n), group_start - 1)
+    rows = np.maximum.accumulate(rows)
+    rows[rows < group_start] = -1
+    return rows
+
+
+def align_timeseries(
+    dfs: List[pd.DataFrame],
+    index: Optional[Union[str, List[str]]],
+    axis_cols: List[str],
+    output_axis_col: Optional[str] = None,
+    duplicates: str = 'raise'
+) -> Tuple[pd.DataFrame, List[np.ndarray], List[pd.DataFrame]]:
+    """
+    对齐多个时间序列DataFrame的(索引, 轴)键
+
+    轴列保持原始的数值或日期类型。每个DataFrame的键先编码为
+    (分组编号, 轴排名)组合成的整数并各自排序，合并后做一次稳定排序
+    （对已排序的多段数据相当于k路归并）得到并集，再用searchsorted
+    计算每个DataFrame的行在并集中的位置。
+
+    Args:
+        dfs: DataFrame列表
+        index: 索引列名或列名列表
+        axis_cols: 每个DataFrame对应的轴列名
+        output_axis_col: 输出轴列名，默认为'_axis_col'
+        duplicates: 某个DataFrame中存在重复的(索引, 轴)键时的处理方式
+            - 'raise': 抛出异常
+            - 'product': 同一键的各DataFrame行做笛卡尔积，与逐对外连接的结果一致：
+              前面的DataFrame在外层，同一键内保持原始行顺序
+
+    Returns:
+        Tuple[pd.DataFrame, List[np.ndarray], List[pd.DataFrame]]:
+            按(索引, 轴)排序的并集键、每个DataFrame在并集每行对应的行号（缺失为-1）、
+            预处理（去掉全空行并重命名轴列）后的DataFrame列表
+
+    Raises:
+        ValueError: duplicates为'raise'且某个DataFrame中存在重复的(索引, 轴)键时
+    """
+    if duplicates not in ('raise', 'product'):
+        print(f'duplicates must be "raise" or "product", got {duplicates}')
+        raise ValueError(f'unsupported duplicates: {duplicates}')
+
+    # 处理索引参数
+    if index is None:
+        index_ = []
+    elif isinstance(index, str):
+        index_ = [index]
+    else:
+        index_ = list(index)
+
+    if output_axis_col is None:
+        output_axis_col = '_axis_col'
+
+    frames = [
+        df.dropna(how='all').rename(columns={axis_cols[i]: output_axis_col}).reset_index(drop=True)
+        for i, df in enumerate(dfs)
+    ]
+    sizes = [len(df) for df in frames]
+    offsets = np.cumsum([0] + sizes)
+    keys = pd.concat([df[[*index_, output_axis_col]] for df in frames], ignore_index=True)
+
+    # 分组编号：逐列排序编码后按混合进制组合，编号顺序即索引列的字典序
+    factorized = [pd.factorize(keys[col], sort=True, use_na_sentinel=False) for col in index_]
+    radix = [max(len(uniques), 1) for _, uniques in factorized]
+    if np.prod(np.array(radix, dtype=np.float64)) >= 2 ** 62:
+        raise ValueError('too many distinct index keys to encode')
+    group_codes = np.zeros(len(keys), dtype=np.int64)
+    for (codes_k, _), radix_k in zip(factorized, radix):
+        group_codes = group_codes * radix_k + codes_k
+
+    axis_codes, axis_values = pd.factorize(keys[output_axis_col], sort=True, use_na_sentinel=False)
+    width = max(len(axis_values), 1)
+    # 组合键可能溢出时，先把分组编码压缩为连续编号
+    if np.prod(np.array(radix, dtype=np.float64)) * width >= 2 ** 62:
+        group_codes, group_values = pd.factorize(group_codes, sort=True)
+        group_values = np.asarray(group_values)
+    else:
+        group_values = None
+    codes = group_codes.astype(np.int64) * width + axis_codes
+
+    # 各DataFrame内部先排序，合并后的稳定排序按已排序段归并
+    orders, parts = [], []
+    for i in range(len(frames)):
+        order = np.argsort(codes[offsets[i]: offsets[i + 1]], kind='stable')
+        part = codes[offsets[i]: offsets[i + 1]][order]
+        if duplicates == 'raise' and len(part) > 1 and (part[1:] == part[:-1]).any():
+            raise ValueError(f'duplicated index and axis keys in dataframe {i}')
+        orders.append(order)
+        parts.append(part)
+    union = np.sort(np.concatenate(parts), kind='stable') if parts else np.zeros(0, dtype=np.int64)
+    if len(union) > 1:
+        union = union[np.r_[True, union[1:] != union[:-1]]]
+
+    # 有序查询的searchsorted访存连续，比乱序查询快得多
+    indexers = []
+    if duplicates == 'raise':
+        for order, part in zip(orders, parts):
+            indexer = np.full(len(union), -1, dtype=np.int64)
+            indexer[np.searchsorted(union, part)] = order
+            indexers.append(indexer)
+    else:
+        # 每个键展开为各DataFrame行数（缺失按1行）之积的行，按混合进制取出各DataFrame的行号
+        starts = [np.searchsorted(part, union, side='left') for part in parts]
+        counts = [np.searchsorted(part, union, side='right') - st for part, st in zip(parts, starts)]
+        sizes = [np.maximum(c, 1) for c in counts]
+        n_rows = np.prod(sizes, axis=0) if sizes else np.zeros(len(union), dtype=np.int64)
+        owner = np.repeat(np.arange(len(union)), n_rows)
+        pos = np.arange(len(owner)) - np.repeat(np.cumsum(n_rows) - n_rows, n_rows)
+        stride = np.ones(len(owner), dtype=np.int64)
+        for order, st, c, size in reversed(list(zip(orders, starts, counts, sizes))):
+            digit = (pos // stride) % size[owner]
+            stride = stride * size[owner]
+            rows = np.where(c[owner] > 0, st[owner] + digit, len(order))
+            indexers.append(np.append(order, -1)[rows])
+        indexers = indexers[::-1]
+        union = union[owner]
+
+    # 由并集的整数键还原索引列和轴列
+    union_groups = union // width
+    if group_values is not None:
+        union_groups = group_values[union_groups]
+    result = {}
+    for k in range(len(index_) - 1, -1, -1):
+        union_groups, codes_k = np.divmod(union_groups, radix[k])
+        result[index_[k]] = np.asarray(factorized[k][1])[codes_k]
+    result[output_axis_col] = np.asarray(axis_values)[union % width]
+    union_keys = pd.DataFrame(result, columns=[*index_, output_axis_col])
+    for col in union_keys.columns:
+        union_keys[col] = union_keys[col].astype(keys[col].dtype)
+
+    return union_keys, indexers, frames
+
+
 def merge_timeseries(
     dfs: List[pd.DataFrame],
     index: Optional[Union[str, List[str]]],
     axis_cols: List[str],
     mask_original_na: Optional[Any] = None,
-    output_axis_col: Optional[str] = None
+    output_axis_col: Optional[str] = None,
+    engine: str = 'merge'
 ) -> pd.DataFrame:
     """
     合并多个时间序列DataFrame
@@ -179,9 +645,16 @@ def merge_timeseries(
         axis_cols: 每个DataFrame对应的轴列名
         mask_original_na: 用于填充缺失值的临时值，因为之后需要filldown
         output_axis_col: 输出轴列名，默认为'_axis_col'
+        engine: 合并方式
+            - 'merge': 轴列转为字符串后逐对外连接（原实现）
+            - 'kway': 轴列保持原始类型，一次对齐全部DataFrame的键后按行号取值，
+              输出列顺序与'merge'一致，行按(索引, 轴)的原始类型排序
         
     Returns:
         pd.DataFrame: 合并后的DataFrame
+
+    Raises:
+        ValueError: engine为'kway'时，值列重名或某个DataFrame中存在重复的(索引, 轴)键
     """
     # 处理索引参数
     if index is None:
@@ -194,6 +667,31 @@ def merge_timeseries(
     if output_axis_col is None:
         output_axis_col = '_axis_col'
 
+    if engine == 'kway':
+        union_keys, indexers, frames = align_timeseries(
+            dfs=dfs, index=index_, axis_cols=axis_cols, output_axis_col=output_axis_col
+        )
+        key_cols = [*index_, output_axis_col]
+        result = {}
+        for df, indexer in zip(frames, indexers):
+            for col in df.columns:
+                if col in key_cols:
+                    if col not in result:
+                        result[col] = union_keys[col].to_numpy()
+                    continue
+                if col in result:
+                    raise ValueError(f'duplicated value column: {col}')
+                values = df[col]
+                if mask_original_na is not None:
+                    values = values.astype(object).where(values.notna(), mask_original_na)
+                result[col] = pd.api.extensions.take(values.to_numpy(), indexer, allow_fill=True)
+        result = pd.DataFrame(result)
+        for col in key_cols:
+            result[col] = result[col].astype(union_keys[col].dtype)
+        return result
+    elif engine != 'merge':
+        raise ValueError(f'unsupported engine: {engine}')
+
     # 复制并预处理DataFrame
     dfs_copy = [df.copy().dropna(how='all') for df in dfs]
     
@@ -211,4 +709,404 @@ def merge_timeseries(
         dfs_copy
     )
 
-    return result
\ No newline at end of file
+    return result
+
+
+def _searchsorted_unordered(a: np.ndarray, v: np.ndarray, side: str = 'left') -> np.ndarray:
+    """
+    对乱序的查询值先排序再searchsorted
+
+    有序查询时访存连续，大数组上比直接用乱序查询快数倍。
+    """
+    order = np.argsort(v)
+    res = np.empty(len(v), dtype=np.int64)
+    res[order] = np.searchsorted(a, v[order], side=side)
+    return res
+
+
+def asof_join(
+    left: pd.DataFrame,
+    rights: Union[pd.DataFrame, List[pd.DataFrame]],
+    index: Optional[Union[str, List[str]]],
+    left_on: str,
+    right_ons: Optional[Union[str, List[str]]] = None,
+    direction: str = 'backward',
+    tolerance: Optional[Any] = None,
+    allow_exact_matches: bool = True
+) -> pd.DataFrame:
+    """
+    按分组把阶梯序列在事件时点的取值附加到事件表上
+
+    对每个右表，按(分组, 轴)排序后把轴值编码为排名，与分组编号组合成整数键；
+    每个事件只需在右表键上做一次searchsorted，不生成轴的并集，
+    复杂度为O((n + m) log m)。事件表保持原有行顺序。
+
+    Args:
+        left: 事件表
+        rights: 一个或多个阶梯序列表
+        index: 索引列名或列名列表，为None时不分组
+        left_on: 事件表的轴列名
+        right_ons: 每个右表的轴列名，为None时与left_on相同
+        direction: 匹配方向
+            - 'backward': 不晚于事件时点的最后一行
+            - 'forward': 不早于事件时点的第一行
+            - 'nearest': 距离最近的一行，距离相同时取backward
+        tolerance: 最大允许距离，日期轴可以是Timedelta或其字符串
+        allow_exact_matches: 是否允许匹配轴值与事件相同的行
+
+    Returns:
+        pd.DataFrame: 事件表附加各右表值列后的DataFrame，未匹配的值为缺失
+
+    Raises:
+        ValueError: 当direction不支持或值列重名时
+    """
+    if direction not in ('backward', 'forward', 'nearest'):
+        raise ValueError(f'unsupported direction: {direction}')
+
+    # 处理索引参数
+    if index is None:
+        index_ = []
+    elif isinstance(index, str):
+        index_ = [index]
+    else:
+        index_ = list(index)
+
+    if isinstance(rights, pd.DataFrame):
+        rights = [rights]
+    if right_ons is None:
+        right_ons = [left_on] * len(rights)
+    elif isinstance(right_ons, str):
+        right_ons = [right_ons] * len(rights)
+
+    result = left.reset_index(drop=True)
+    x = result[left_on].to_numpy()
+
+    for right, right_on in zip(rights, right_ons):
+        right = right.dropna(subset=[right_on]).reset_index(drop=True)
+        value_cols = [col for col in right.columns if col not in index_ and col != right_on]
+        for col in value_cols:
+            if col in result.columns:
+                raise ValueError(f'duplicated value column: {col}')
+
+        # 事件表和右表共同编码分组
+        n, m = len(result), len(right)
+        if index_:
+            group_codes = pd.concat(
+                [result[index_], right[index_]], ignore_index=True
+            ).groupby(index_, sort=False, dropna=False).ngroup().to_numpy().astype(np.int64)
+        else:
+            group_codes = np.zeros(n + m, dtype=np.int64)
+        left_groups, right_groups = group_codes[:n], group_codes[n:]
+
+        # 右表轴值编码为排名并按(分组, 排名)排序
+        rx = right[right_on].to_numpy()
+        if x.dtype.kind == 'M' or rx.dtype.kind == 'M':
+            rx = rx.astype('datetime64[ns]')
+            lx = x.astype('datetime64[ns]')
+            left_valid = ~np.isnat(lx)
+        else:
+            lx = x
+            left_valid = ~pd.isna(lx)
+        uniques, ranks = np.unique(rx, return_inverse=True)
+        width = len(uniques) + 1
+        keys = right_groups * width + ranks.reshape(-1)
+        order = np.argsort(keys, kind='stable')
+        keys = keys[order]
+        rx = rx[order]
+
+        lx_ = np.where(left_valid, lx, lx[left_valid][0] if left_valid.any() else lx)
+        base = left_groups * width
+
+        def search_backward():
+            rank = _searchsorted_unordered(uniques, lx_, side='right' if allow_exact_matches else 'left')
+            pos = _searchsorted_unordered(keys, base + rank, side='left') - 1
+            ok = pos >= 0
+            ok[ok] = keys[pos[ok]] // width == left_groups[ok]
+            return pos, ok
+
+        def search_forward():
+            rank = _searchsorted_unordered(uniques, lx_, side='left' if allow_exact_matches else 'right')
+            pos = _searchsorted_unordered(keys, base + rank, side='left')
+            ok = pos < len(keys)
+            ok[ok] = keys[pos[ok]] // width == left_groups[ok]
+            return pos, ok
+
+        if direction == 'backward':
+            pos, ok = search_backward()
+        elif direction == 'forward':
+            pos, ok = search_forward()
+        else:
+            pos_b, ok_b = search_backward()
+            pos_f, ok_f = search_forward()
+            dist_b = np.abs(lx_ - rx[np.clip(pos_b, 0, max(m - 1, 0))]) if m > 0 else None
+            dist_f = np.abs(rx[np.clip(pos_f, 0, max(m - 1, 0))] - lx_) if m > 0 else None
+            use_f = ok_f & (~ok_b | (dist_f < dist_b)) if m > 0 else ok_f
+            pos = np.where(use_f, pos_f, pos_b)
+            ok = ok_b | ok_f
+
+        ok &= left_valid
+        if tolerance is not None and m > 0:
+            if lx.dtype.kind == 'M':
+                tolerance_ = pd.Timedelta(tolerance).to_timedelta64()
+            else:
+                tolerance_ = tolerance
+            dist = np.abs(rx[np.clip(pos, 0, m - 1)] - lx_)
+            ok &= dist <= tolerance_
+
+        indexer = np.where(ok, order[np.clip(pos, 0, max(m - 1, 0))] if m > 0 else -1, -1)
+        for col in value_cols:
+            result[col] = pd.api.extensions.take(right[col].to_numpy(), indexer, allow_fill=True)
+
+    return result
+
+
+def iter_frame_chunks(
+    source: Union[pd.DataFrame, str, Iterable[pd.DataFrame]],
+    chunk_size: int = 1000000
+) -> Iterable[pd.DataFrame]:
+    """
+    按块读取输入数据
+
+    空的DataFrame或parquet文件产出一个空块，保留列和dtype。
+
+    Args:
+        source: DataFrame、parquet文件路径或产出DataFrame块的可迭代对象
+        chunk_size: 读取parquet文件或切分DataFrame时每块的行数
+
+    Returns:
+        Iterable[pd.DataFrame]: 依次产出的DataFrame块
+    """
+    if isinstance(source, pd.DataFrame):
+        for i in range(0, max(len(source), 1), chunk_size):
+            yield source.iloc[i: i + chunk_size]
+    elif isinstance(source, (str, os.PathLike)):
+        file = pq.ParquetFile(source)
+        if file.metadata.num_rows == 0:
+            yield file.schema_arrow.empty_table().to_pandas()
+            return
+        for batch in file.iter_batches(batch_size=chunk_size):
+            yield batch.to_pandas()
+    else:
+        yield from source
+
+
+def _partition_keys(chunk: pd.DataFrame, index: List[str]) -> pd.DataFrame:
+    """
+    把索引列转换为与dtype无关的表示，用于计算分片哈希
+
+    不同输入中相等的键（如int64的5与float64的5.0、不同精度的同一时间）必须落在同一分片，
+    而hash_pandas_object的结果依赖dtype。数值和布尔列统一转换为float64，日期转换为
+    UTC下的秒数，对象列先推断类型再按上述规则处理。不同的键落在同一分片不影响结果。
+
+    Args:
+        chunk: 输入数据块
+        index: 索引列名列表
+
+    Returns:
+        pd.DataFrame: 转换后的索引列
+    """
+    keys = {}
+    for col in index:
+        values = chunk[col]
+        if isinstance(values.dtype, pd.CategoricalDtype):
+            values = pd.Series(np.asarray(values), index=values.index)
+        values = values.infer_objects()
+        if isinstance(values.dtype, pd.DatetimeTZDtype):
+            values = values.dt.tz_convert(None)
+        if values.dtype.kind in 'mM':
+            values = values.to_numpy().astype(values.dtype.str[:3] + '[s]').astype('int64').astype(np.float64)
+        elif pd.api.types.is_bool_dtype(values.dtype) or pd.api.types.is_numeric_dtype(values.dtype):
+            values = values.to_numpy(dtype=np.float64, na_value=np.nan)
+        else:
+            values = values.to_numpy(dtype=object)
+        keys[col] = values
+    return pd.DataFrame(keys)
+
+
+def partition_frames(
+    sources: List[Union[pd.DataFrame, str, Iterable[pd.DataFrame]]],
+    index: Union[str, List[str]],
+    n_partitions: int,
+    folder: str,
+    chunk_size: int = 1000000
+) -> List[List[List[str]]]:
+    """
+    按索引列哈希把多个输入分片写入parquet文件
+
+    输入按块读取，每块按索引列的哈希值分到n_partitions个分片，同一索引的行
+    在所有输入中落在同一分片（与各输入中索引列的dtype无关），内存占用只取决于块的大小。
+
+    Args:
+        sources: 输入列表，元素为DataFrame、parquet文件路径或产出DataFrame块的可迭代对象
+        index: 索引列名或列名列表
+        n_partitions: 分片数
+        folder: 分片文件目录
+        chunk_size: 每块的行数
+
+    Returns:
+        List[List[List[str]]]: 分片文件路径，shards[p][i]为第p个分片中第i个输入的文件列表
+    """
+    index_ = [index] if isinstance(index, str) else list(index)
+    if not index_:
+        raise ValueError('index is required for partitioning')
+
+    shards = [[[] for _ in sources] for _ in range(n_partitions)]
+    for i, source in enumerate(sources):
+        for k, chunk in enumerate(iter_frame_chunks(source, chunk_size=chunk_size)):
+            keys = _partition_keys(chunk, index_)
+            parts = pd.util.hash_pandas_object(keys, index=False).to_numpy() % n_partitions
+            order = np.argsort(parts, kind='stable')
+            bounds = np.searchsorted(parts[order], np.arange(n_partitions + 1))
+            for p in range(n_partitions):
+                if bounds[p + 1] == bounds[p]:
+                    continue
+                path = os.path.join(folder, f'part_{p}_input_{i}_chunk_{k}.parquet')
+                chunk.iloc[order[bounds[p]: bounds[p + 1]]].to_parquet(path, index=False)
+                shards[p][i].append(path)
+
+            # 记录空块的表结构，保证每个分片都能读到所有列
+            if k == 0:
+                path = os.path.join(folder, f'schema_input_{i}.parquet')
+                chunk.iloc[:0].to_parquet(path, index=False)
+                for p in range(n_partitions):
+                    shards[p][i].insert(0, path)
+
+    return shards
+
+
+def _read_shard(paths: List[str]) -> pd.DataFrame:
+    """
+    读取一个分片中某个输入的全部文件
+    """
+    frames = [pd.read_parquet(path) for path in paths]
+    if not frames:
+        return pd.DataFrame()
+    return pd.concat(frames, ignore_index=True)
+
+
+def _run_shard(
+    func: Callable,
+    paths: List[List[str]],
+    kwargs: dict,
+    output_path: Optional[str]
+) -> Union[pd.DataFrame, str]:
+    """
+    在一个分片上执行func，output_path不为空时把结果写入parquet文件并返回路径
+    """
+    res = func(dfs=[_read_shard(item) for item in paths], **kwargs)
+    if output_path is None:
+        return res
+    res.to_parquet(output_path, index=False)
+    return output_path
+
+
+def apply_partitioned(
+    func: Callable,
+    dfs: List[Union[pd.DataFrame, str, Iterable[pd.DataFrame]]],
+    index: Union[str, List[str]],
+    n_partitions: int = 16,
+    n_jobs: int = 1,
+    folder: Optional[str] = None,
+    output_folder: Optional[str] = None,
+    chunk_size: int = 1000000,
+    **kwargs
+) -> Union[pd.DataFrame, List[str]]:
+    """
+    按索引列分片后逐片执行时间序列函数，用于超出内存的数据
+
+    func需要接受dfs参数（每个输入在该分片中的DataFrame）和index参数，
+    例如merge_timeseries或sumprod_timeseries。同一索引的所有行位于同一分片，
+    因此逐片计算的结果与整体计算一致；峰值内存取决于单个分片的大小。
+
+    Args:
+        func: 处理单个分片的函数，多进程时必须是可序列化的模块级函数
+        dfs: 输入列表，元素为DataFrame、parquet文件路径或产出DataFrame块的可迭代对象
+        index: 索引列名或列名列表
+        n_partitions: 分片数
+        n_jobs: 进程数，大于1时用进程池并行处理分片
+        folder: 分片文件目录，为None时使用临时目录并在结束后删除
+        output_folder: 结果目录，不为None时每个分片的结果写入该目录并返回文件路径列表，
+            否则合并为一个DataFrame返回（按分片顺序，不做全局排序）
+        chunk_size: 分片时每块读取的行数
+        **kwargs: 传给func的其他参数
+
+    Returns:
+        Union[pd.DataFrame, List[str]]: 合并后的结果，或各分片结果文件的路径列表
+    """
+    temp_folder = None
+    if folder is None:
+        folder = temp_folder = tempfile.mkdtemp(prefix='hf_partition_')
+    else:
+        os.makedirs(folder, exist_ok=True)
+    if output_folder is not None:
+        os.makedirs(output_folder, exist_ok=True)
+
+    try:
+        shards = partition_frames(dfs, index=index, n_partitions=n_partitions, folder=folder, chunk_size=chunk_size)
+        # 只有表结构文件的分片没有数据，跳过；全部为空时在空表上执行一次，保留结果的列和dtype
+        tasks = [
+            (p, paths) for p, paths in enumerate(shards)
+            if any(len(item) > 1 for item in paths)
+        ]
+        if not tasks and shards:
+            tasks = [(0, shards[0])]
+        output_paths = [
+            None if output_folder is None else os.path.join(output_folder, f'part_{p}.parquet')
+            for p, _ in tasks
+        ]
+        kwargs = dict(kwargs, index=index)
+
+        if n_jobs > 1:
+            with ProcessPoolExecutor(max_workers=n_jobs) as executor:
+                futures = [
+                    executor.submit(_run_shard, func, paths, kwargs, output_path)
+                    for (p, paths), output_path in zip(tasks, output_paths)
+                ]
+                results = [future.result() for future in futures]
+        else:
+            results = [
+                _run_shard(func, paths, kwargs, output_path)
+                for (p, paths), output_path in zip(tasks, output_paths)
+            ]
+    finally:
+        if temp_folder is not None:
+            shutil.rmtree(temp_folder, ignore_errors=True)
+
+    if output_folder is not None:
+        return results
+    if not results:
+        return pd.DataFrame()
+    return pd.concat(results, ignore_index=True)
+
+
+def merge_timeseries_partitioned(
+    dfs: List[Union[pd.DataFrame, str, Iterable[pd.DataFrame]]],
+    index: Union[str, List[str]],
+    axis_cols: List[str],
+    n_partitions: int = 16,
+    n_jobs: int = 1,
+    folder: Optional[str] = None,
+    output_folder: Optional[str] = None,
+    **kwargs
+) -> Union[pd.DataFrame, List[str]]:
+    """
+    分片执行merge_timeseries，参数同apply_partitioned
+
+    Args:
+        dfs: 输入列表，元素为DataFrame、parquet文件路径或产出DataFrame块的可迭代对象
+        index: 索引列名或列名列表
+        axis_cols: 每个输入对应的轴列名
+        n_partitions: 分片数
+        n_jobs: 进程数
+        folder: 分片文件目录
+        output_folder: 结果目录
+        **kwargs: 其他参数，chunk_size传给apply_partitioned，其余传给merge_timeseries，例如engine
+
+    Returns:
+        Union[pd.DataFrame, List[str]]: 合并后的结果，或各分片结果文件的路径列表
+    """
+    return apply_partitioned(
+        merge_timeseries, dfs, index=index, n_partitions=n_partitions, n_jobs=n_jobs,
+        folder=folder, output_folder=output_folder, axis_cols=axis_cols, **kwargs
+    )
+
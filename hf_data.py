@@ -12,7 +12,8 @@
 """
 
 import json
-from typing import Set, List
+from functools import lru_cache
+from typing import Set, List, Tuple
 from datetime import datetime as dt
 import numpy as np
 
@@ -229,9 +230,8 @@ def get_nodes(relation_info):
     Returns:
         list: 排序后的节点列表
     """
-    res = list(set(sum(relation_info, start=[])))
-    res = sorted([item for item in res if item])
-    return res
+    res = {item for relation in relation_info for item in relation if item}
+    return sorted(res)
 
 
 def get_graph(relation_info):
@@ -258,6 +258,8 @@ def get_graph(relation_info):
 def get_related_nodes(graph, node, visited=None):
     """
     获取与指定节点相关的所有节点（包括父节点和子节点）
+
+    每次调用都会扫描整个图，需要反复查询时使用Graph.related
     
     Args:
         graph: 图结构
@@ -309,29 +311,325 @@ def depth_first_search(
     stack.append(node)
 
 
+def _find_cycle(parents, remaining):
+    """
+    在剩余节点中沿父节点回溯，找出一个具体的环
+
+    Args:
+        parents: 节点编号到父节点编号列表的映射
+        remaining: 拓扑排序后仍未输出的节点编号集合
+
+    Returns:
+        list: 环上的节点编号，首尾为同一节点
+    """
+    node = min(remaining)
+    path = []
+    position = {}
+    while node not in position:
+        position[node] = len(path)
+        path.append(node)
+        node = next(p for p in parents[node] if p in remaining)
+    return path[position[node]:] + [node]
+
+
+@lru_cache(maxsize=32)
+def _topological_levels(relations: Tuple[Tuple]) -> Tuple[Tuple[str]]:
+    """
+    Kahn算法分层拓扑排序，结果按关系元组缓存
+
+    Args:
+        relations: 关系信息元组，每个元素为(node, parent)
+
+    Returns:
+        tuple: 各层节点，层内按名称排序
+    """
+    # 节点编号，并建立父子双向邻接表
+    nodes = get_nodes(relations)
+    node_index = {node: i for i, node in enumerate(nodes)}
+    parents = [set() for _ in nodes]
+    children = [set() for _ in nodes]
+    for node, parent in relations:
+        if not node or not parent:
+            continue
+        i, j = node_index[node], node_index[parent]
+        parents[i].add(j)
+        children[j].add(i)
+
+    in_degree = [len(ps) for ps in parents]
+    level = [i for i, d in enumerate(in_degree) if d == 0]
+    levels = []
+    n_done = 0
+    while level:
+        levels.append(tuple(nodes[i] for i in level))
+        n_done += len(level)
+        next_level = []
+        for i in level:
+            for j in children[i]:
+                in_degree[j] -= 1
+                if in_degree[j] == 0:
+                    next_level.append(j)
+        # 编号与名称同序，层内排序即按名称排序
+        level = sorted(next_level)
+
+    if n_done < len(nodes):
+        remaining = {i for i, d in enumerate(in_degree) if d > 0}
+        cycle = [nodes[i] for i in _find_cycle(parents, remaining)]
+        print(f'cycle detected: {" -> ".join(map(str, cycle))}')
+        print(f'nodes not sorted: {sorted(nodes[i] for i in remaining)}')
+        raise ValueError(f'relation_info contains a cycle: {cycle}')
+
+    return tuple(levels)
+
+
+def topological_levels(relation_info: list, reverse=False) -> List[List[str]]:
+    """
+    分层拓扑排序
+
+    同一层内的节点之间没有依赖关系，可以并行处理；每层的父节点都在前面的层中。
+    使用Kahn算法迭代实现，复杂度O(V+E)，相同的relation_info直接返回缓存结果。
+
+    Args:
+        relation_info: 关系信息列表，每个元素为[node, parent]格式
+        reverse: 是否反转层的顺序（子节点在前）
+
+    Returns:
+        list: 各层节点列表，层内按名称排序
+
+    Raises:
+        ValueError: 关系中存在环时抛出，信息中包含环上的节点
+    """
+    levels = _topological_levels(tuple(tuple(relation) for relation in relation_info))
+    if reverse:
+        levels = reversed(levels)
+    return [list(level) for level in levels]
+
+
 def topological_sort(relation_info: list, reverse=False) -> List[str]:
     """
     拓扑排序算法
-    
+
+    结果为topological_levels各层依次拼接，父节点总在子节点之前。
+
     Args:
         relation_info: 关系信息列表
         reverse: 是否反转排序结果
-        
+
     Returns:
         list: 拓扑排序结果
-    """
-    nodes = get_nodes(relation_info=relation_info)
-    graph = get_graph(relation_info=relation_info)
-    visited = set()
-    stack = []
-    for node in nodes:
-        if node not in visited:
-            depth_first_search(node, graph, visited, stack)
 
+    Raises:
+        ValueError: 关系中存在环时抛出
+    """
+    levels = topological_levels(relation_info=relation_info)
+    res = [node for level in levels for node in level]
     if reverse:
-        return [node for node in reversed(stack)]
-    else:
-        return [node for node in stack]
+        res.reverse()
+    return res
+
+
+class Graph:
+    """
+    依赖关系图
+
+    由relation_info一次性构建节点的父、子双向邻接表，祖先、后代、相关节点和
+    连通分量的查询结果都会缓存，重复查询时直接返回。
+    """
+
+    def __init__(self, relation_info):
+        """
+        初始化依赖关系图
+
+        Args:
+            relation_info: 关系信息列表，每个元素为[node, parent]格式
+        """
+        self.nodes = get_nodes(relation_info)
+        self._parents = {node: set() for node in self.nodes}
+        self._children = {node: set() for node in self.nodes}
+        for node, parent in relation_info:
+            if node and parent:
+                self._parents[node].add(parent)
+                self._children[parent].add(node)
+        self._ancestors = {}
+        self._descendants = {}
+        self._related = {}
+        self._components = None
+
+    @classmethod
+    def from_graph(cls, graph):
+        """
+        由get_graph生成的邻接表构建
+
+        Args:
+            graph: 图结构，key为节点，value为父节点列表
+
+        Returns:
+            Graph: 依赖关系图
+        """
+        relation_info = [[node, None] for node in graph]
+        relation_info += [[node, parent] for node, parents in graph.items() for parent in parents]
+        return cls(relation_info)
+
+    def __contains__(self, node):
+        return node in self._parents
+
+    def __len__(self):
+        return len(self.nodes)
+
+    def parents(self, node) -> List[str]:
+        """直接父节点"""
+        return sorted(self._parents[node])
+
+    def children(self, node) -> List[str]:
+        """直接子节点"""
+        return sorted(self._children[node])
+
+    def _closure(self, node, adjacency, cache):
+        """
+        沿邻接表迭代遍历得到的可达节点集合（不含自身），遇到已缓存的节点直接合并
+
+        Args:
+            node: 起始节点
+            adjacency: 父节点或子节点邻接表
+            cache: 对应的结果缓存
+
+        Returns:
+            frozenset: 可达节点集合
+        """
+        if node in cache:
+            return cache[node]
+        res = set()
+        stack = list(adjacency[node])
+        while stack:
+            current = stack.pop()
+            if current in res:
+                continue
+            res.add(current)
+            if current in cache:
+                res |= cache[current]
+            else:
+                stack.extend(adjacency[current])
+        res.discard(node)
+        cache[node] = frozenset(res)
+        return cache[node]
+
+    def ancestors(self, node) -> List[str]:
+        """
+        所有祖先节点（直接或间接依赖的节点）
+
+        Args:
+            node: 目标节点
+
+        Returns:
+            list: 排序后的祖先节点列表
+        """
+        return sorted(self._closure(node, self._parents, self._ancestors))
+
+    def descendants(self, node) -> List[str]:
+        """
+        所有后代节点（直接或间接依赖该节点的节点）
+
+        Args:
+            node: 目标节点
+
+        Returns:
+            list: 排序后的后代节点列表
+        """
+        return sorted(self._closure(node, self._children, self._descendants))
+
+    def related(self, node) -> List[str]:
+        """
+        相关节点，结果与get_related_nodes一致
+
+        包括节点本身、其直接父节点、所有后代节点以及各后代节点的直接父节点，
+        即该节点变化后需要重新加载的表及其输入。
+
+        Args:
+            node: 目标节点
+
+        Returns:
+            list: 排序后的相关节点列表
+        """
+        if node not in self._related:
+            descendants = self._closure(node, self._children, self._descendants)
+            res = {node} | self._parents[node] | descendants
+            for descendant in descendants:
+                res |= self._parents[descendant]
+            self._related[node] = sorted(res)
+        return list(self._related[node])
+
+    def connected_components(self) -> List[List[str]]:
+        """
+        连通分量（忽略边的方向）
+
+        Returns:
+            list: 各连通分量的排序节点列表，按分量中最小的节点排序
+        """
+        if self._components is None:
+            components = []
+            visited = set()
+            for node in self.nodes:
+                if node in visited:
+                    continue
+                component = []
+                visited.add(node)
+                stack = [node]
+                while stack:
+                    current = stack.pop()
+                    component.append(current)
+                    for neighbor in self._parents[current] | self._children[current]:
+                        if neighbor not in visited:
+                            visited.add(neighbor)
+                            stack.append(neighbor)
+                components.append(sorted(component))
+            self._components = components
+        return [list(component) for component in self._components]
+
+    def to_relation_info(self) -> List[list]:
+        """
+        转换为关系信息列表，没有父节点的节点记为[node, None]
+
+        Returns:
+            list: 关系信息列表
+        """
+        res = []
+        for node in self.nodes:
+            if self._parents[node]:
+                res += [[node, parent] for parent in sorted(self._parents[node])]
+            else:
+                res.append([node, None])
+        return res
+
+    def subgraph(self, nodes) -> 'Graph':
+        """
+        由指定节点导出的子图，只保留两端都在节点集合中的边
+
+        Args:
+            nodes: 节点集合
+
+        Returns:
+            Graph: 子图
+        """
+        nodes = set(nodes) & set(self.nodes)
+        relation_info = []
+        for node in sorted(nodes):
+            parents = self._parents[node] & nodes
+            if parents:
+                relation_info += [[node, parent] for parent in sorted(parents)]
+            else:
+                relation_info.append([node, None])
+        return Graph(relation_info)
+
+    def topological_sort(self, reverse=False) -> List[str]:
+        """
+        拓扑排序，同topological_sort
+
+        Args:
+            reverse: 是否反转排序结果
+
+        Returns:
+            list: 拓扑排序结果
+        """
+        return topological_sort(self.to_relation_info(), reverse=reverse)
 
 
 def construct_nested_dict(path_list):
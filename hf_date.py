@@ -5,10 +5,15 @@
 """
 
 import re
+import json
+from bisect import bisect_right
+import hashlib
 import pandas as pd
 import numpy as np
 from numpy import datetime64
 from datetime import datetime as dt
+from functools import lru_cache
+from calendar import monthrange
 from dateutil.relativedelta import relativedelta
 
 import sys
@@ -23,8 +28,11 @@ parent_dir = os.path.dirname(current_dir)
 if parent_dir not in sys.path:
     sys.path.append(parent_dir)
 
+from helper_function.hf_file import mkdir
 from helper_function.hf_func import profile_line_by_line
-from helper_function.hf_math import crop, grid_pos, nd_array_crop
+from helper_function.hf_math import (
+    crop, grid_pos, nd_array_crop_into, nd_array_crop_reduce, crop_memory_budget
+)
 from helper_function.hf_number import is_number
 
 # 星期缩写映射
@@ -89,6 +97,138 @@ def to_dt(date):
             return None
 
 
+# to_dt_array 支持的字符串日期格式，值为提取年、月、日的正则
+date_formats = {
+    'Y/M/D': r'^(\d{4})/(\d{1,2})/(\d{1,2})$',
+    '%F': r'^(\d{4})-(\d{2})-(\d{2})$',
+    '%Y%m%d': r'^(\d{4})(\d{2})(\d{2})$',
+}
+
+
+def _to_ns(values):
+    """
+    将任意精度的datetime64数组转换为datetime64[ns]
+
+    pandas 3 解析出的日期可能是秒、毫秒或微秒精度，直接astype('datetime64[ns]')
+    会让超出纳秒范围（约1677-09-21至2262-04-11）的日期（如9999-12-31）静默溢出。
+    这里通过转换后再转回原精度比较来识别溢出，溢出的值置为NaT。
+
+    Args:
+        values: datetime64数组
+
+    Returns:
+        tuple: (datetime64[ns]数组, 超出范围的布尔掩码)
+    """
+    values = np.asarray(values)
+    res = values.astype('datetime64[ns]')
+    overflow = ~np.isnat(values) & (res.astype(values.dtype) != values)
+    res[overflow] = np.datetime64('NaT')
+    return res, overflow
+
+
+def _parse_datetime_objects(values):
+    """
+    解析datetime、Timestamp、datetime64对象，带时区的值先转换为UTC再去掉时区
+
+    Args:
+        values: 对象数组
+
+    Returns:
+        tuple: (datetime64[ns]数组, 超出范围的布尔掩码)
+    """
+    has_tz = np.array([getattr(v, 'tzinfo', None) is not None for v in values], dtype=bool)
+    res = np.empty(len(values), dtype='datetime64[us]')
+    if (~has_tz).any():
+        res[~has_tz] = pd.to_datetime(pd.Series(values[~has_tz])).values.astype('datetime64[us]')
+    if has_tz.any():
+        res[has_tz] = pd.to_datetime(
+            pd.Series(values[has_tz]), utc=True
+        ).dt.tz_localize(None).values.astype('datetime64[us]')
+    return _to_ns(res)
+
+
+def to_dt_array(dates, return_report=False):
+    """
+    批量将日期转换为datetime64数组
+
+    先对输入去重，再按格式分组，每种格式用一次向量化解析完成，
+    支持'Y/M/D'、'%F'、'%Y%m%d'字符串以及datetime、Timestamp、datetime64。
+    无法识别的值以及超出datetime64[ns]范围的值（如9999-12-31）转换为NaT，
+    并汇总为一条错误报告，而不是逐个打印。带时区的值先转换为UTC再去掉时区。
+
+    Args:
+        dates: 日期列表、numpy数组或Series
+        return_report: 是否同时返回解析报告
+
+    Returns:
+        numpy.ndarray或pd.Series: datetime64[ns]数组，输入为Series时返回同索引的Series；
+            return_report为True时返回(结果, 报告)，报告包含各格式的数量、错误数量和错误样例
+    """
+    index = dates.index if isinstance(dates, pd.Series) else None
+    values = np.asarray(dates.values if index is not None else dates)
+
+    report = {'formats': {}, 'n_errors': 0, 'errors': []}
+    if values.dtype.kind == 'M':
+        res, overflow = _to_ns(values)
+        report['formats']['datetime64'] = int((~np.isnat(res)).sum())
+        if overflow.any():
+            report['n_errors'] = int(overflow.sum())
+            report['errors'] = values[overflow][:10].tolist()
+            print('date out of range: %d values, e.g. %s' % (
+                report['n_errors'], ', '.join([str(item) for item in report['errors']])
+            ))
+    else:
+        values = values.astype(object)
+        codes, uniques = pd.factorize(values, use_na_sentinel=True)
+        counts = np.bincount(codes[codes >= 0], minlength=len(uniques))
+        parsed = np.full(len(uniques), np.datetime64('NaT'), dtype='datetime64[ns]')
+        # 'nan' 与空字符串视为缺失值，不计入错误
+        missing = np.array([isinstance(u, str) and u in ('nan', '') for u in uniques], dtype=bool)
+        pending = ~missing
+
+        # datetime、Timestamp、datetime64 对象
+        is_dt = np.array([isinstance(u, (dt, datetime64)) for u in uniques], dtype=bool)
+        if is_dt.any():
+            parsed[is_dt] = _parse_datetime_objects(uniques[is_dt])[0]
+            report['formats']['datetime'] = int(counts[is_dt][~np.isnat(parsed[is_dt])].sum())
+            pending &= ~is_dt
+
+        is_str = pending & np.array([isinstance(u, str) for u in uniques], dtype=bool)
+        for fmt, pattern in date_formats.items():
+            if not is_str.any():
+                break
+            pos = np.flatnonzero(is_str)
+            ymd = pd.Series(uniques[pos]).str.extract(pattern)
+            matched = ymd.notna().all(axis=1).values
+            if not matched.any():
+                continue
+            ymd = ymd[matched].astype('int64')
+            ymd.columns = ['year', 'month', 'day']
+            parsed[pos[matched]] = _to_ns(pd.to_datetime(ymd, errors='coerce').values)[0]
+            report['formats'][fmt] = int(counts[pos[matched]][~np.isnat(parsed[pos[matched]])].sum())
+            is_str[pos[matched]] = False
+            pending[pos[matched]] = False
+
+        # 格式可识别但日期非法（如2021/2/30）或超出范围的值同样计为错误
+        invalid = pending | (~missing & np.isnat(parsed))
+        res = parsed[codes]
+        res[codes < 0] = np.datetime64('NaT')
+
+        if invalid.any():
+            report['n_errors'] = int(counts[invalid].sum())
+            report['errors'] = uniques[invalid][:10].tolist()
+            print('date not recognizable or out of range: %d values, e.g. %s' % (
+                report['n_errors'], ', '.join([str(item) for item in report['errors']])
+            ))
+
+    if index is not None:
+        res = pd.Series(res, index=index, name=dates.name)
+
+    if return_report:
+        return res, report
+    return res
+
+
 def np_date_to_dt(np_date):
     """
     将numpy.datetime64转换为datetime对象
@@ -274,7 +414,7 @@ def is_satisfy_day_string(date: dt, day_string, vacation_calendar=None):
     
     Args:
         date: 要检查的日期
-        day_string: 日期条件字符串，可以是数字、星期缩写或't+数字'表示第几个工作日
+        day_string: 日期条件字符串，可以是数字、星期缩写或't+数字'表示第几个工作日，'t-1'表示最后一个工作日
         vacation_calendar: 假期日历
         
     Returns:
@@ -287,23 +427,12 @@ def is_satisfy_day_string(date: dt, day_string, vacation_calendar=None):
     elif day_string in weekday_abbr.keys():
         return date.weekday() == weekday_abbr[day_string]
     elif day_string[0] == 't' and is_number(day_string[1:]):
-        # 处理第几个工作日的逻辑
-        runner = 0
-        runner_date = dt(date.year, date.month, 1)
-        target_t_day = int(day_string[1:]) - 1
-        while runner <= target_t_day:
-            if not vacation_calendar:
-                if runner_date.weekday() in [5, 6]:
-                    pass
-                else:
-                    runner += 1
-            else:
-                if vacation_calendar[runner_date]:
-                    pass
-                else:
-                    runner += 1
-            runner_date += relativedelta(days=1)
-        return date == runner_date - relativedelta(days=1)
+        # 查工作日索引表判断是否为第几个工作日，负数表示倒数
+        day = np.datetime64(pd.Timestamp(date), 'D')
+        if pd.Timestamp(day) != pd.Timestamp(date):
+            return False
+        table = get_nth_workday_table(day, day, vacation_calendar)
+        return bool(table.mask([day], [int(day_string[1:])])[0])
     else:
         print('day param is not valid: %s' % day_string)
         return False
@@ -315,7 +444,7 @@ def is_satisfy_hour_string(date: dt, hour_string):
     
     Args:
         date: 要检查的日期
-        hour_string: 小时条件字符串，'h'表示任意小时
+        hour_string: 小时条件字符串，'h'表示任意小时，'Nh'表示每N小时
         
     Returns:
         bool: 是否满足条件
@@ -325,7 +454,7 @@ def is_satisfy_hour_string(date: dt, hour_string):
     elif is_number(hour_string):
         return str(date.hour) == hour_string
     elif hour_string[-1] == 'h' and is_number(hour_string[:-1]):
-        return date.hour % int(hour_string) == 0
+        return date.hour % int(hour_string[:-1]) == 0
     else:
         return False
 
@@ -336,7 +465,7 @@ def is_satisfy_minute_string(date: dt, minute_string):
     elif is_number(minute_string):
         return str(date.minute) == minute_string
     elif minute_string[-1] == 'm' and is_number(minute_string[:-1]):
-        return date.minute % int(minute_string) == 0
+        return date.minute % int(minute_string[:-1]) == 0
     else:
         return False
 
@@ -347,38 +476,1263 @@ def is_satisfy_second_string(date: dt, second_string):
     elif is_number(second_string):
         return str(date.second) == second_string
     elif second_string[-1] == 's' and is_number(second_string[:-1]):
-        return date.second % int(second_string) == 0
+        return date.second % int(second_string[:-1]) == 0
     else:
         return False
 
 
-def gen_date_series(date_string, start, end):
+def _civil_from_days(z):
+    """
+    由1970-01-01起的天数推算公历年、月、日
+
+    Args:
+        z: int64天数数组
+
+    Returns:
+        tuple: (年, 月, 日)
+    """
+    z = z + 719468
+    era = z // 146097
+    doe = z - era * 146097
+    yoe = (doe - doe // 1460 + doe // 36524 - doe // 146096) // 365
+    doy = doe - (365 * yoe + yoe // 4 - yoe // 100)
+    mp = (5 * doy + 2) // 153
+    day = doy - (153 * mp + 2) // 5 + 1
+    month = np.where(mp < 10, mp + 3, mp - 9)
+    year = yoe + era * 400 + (month <= 2)
+    return year, month, day
+
+
+# 预计算分量表覆盖的日期范围
+civil_table_range = (np.datetime64('1900-01-01', 'D'), np.datetime64('2200-01-01', 'D'))
+
+
+@lru_cache(maxsize=1)
+def get_civil_table():
+    """
+    获取预计算的年、月、日、星期分量表
+
+    Returns:
+        tuple: (年, 月, 日, 星期)，下标为距civil_table_range起点的天数
+    """
+    first, last = civil_table_range
+    z = np.arange(first.astype('int64'), last.astype('int64'))
+    year, month, day = _civil_from_days(z)
+    return year.astype('int16'), month.astype('int8'), day.astype('int8'), ((z + 3) % 7).astype('int8')
+
+
+def split_dt64(dates):
+    """
+    将日期数组拆分为年、月、日、星期分量
+
+    常用范围内的日期直接查预计算分量表，其余日期用整数运算推算，
+    避免datetime64在月、年精度间的慢速转换。
+
+    Args:
+        dates: 日期数组，可以是datetime64数组、DatetimeIndex、Series或datetime列表
+
+    Returns:
+        tuple: (按日截断的datetime64[D]数组, 年, 月, 日, 星期)，星期一为0
+    """
+    days = np.asarray(dates, dtype='datetime64[D]')
+    z = days.astype('int64')
+    pos = z - civil_table_range[0].astype('int64')
+    if len(z) > 0 and pos.min() >= 0 and pos.max() < len(get_civil_table()[0]):
+        year, month, day, weekday = (item[pos] for item in get_civil_table())
+    else:
+        year, month, day = _civil_from_days(z)
+        # 1970-01-01 为星期四
+        weekday = (z + 3) % 7
+    return days, year, month, day, weekday
+
+
+def isin_small(a, values):
+    """
+    判断数组元素是否属于少量候选值
+
+    候选值很少时逐个比较比numpy.isin的排序算法更快。
+
+    Args:
+        a: 数组
+        values: 候选值列表
+
+    Returns:
+        numpy.ndarray: 布尔数组
+    """
+    res = np.zeros(np.shape(a), dtype=bool)
+    for v in values:
+        res |= a == v
+    return res
+
+
+def get_vacation_mask(days, vacation_calendar):
+    """
+    从假期日历中批量查询日期是否为假期
+
+    Args:
+        days: datetime64[D]数组
+        vacation_calendar: 假期日历，key为日期，value为是否放假；也可以是BusinessCalendar
+
+    Returns:
+        numpy.ndarray: 布尔数组，True表示放假
+
+    Raises:
+        KeyError: 日期在日历范围之外时
+    """
+    if isinstance(vacation_calendar, BusinessCalendar):
+        return ~vacation_calendar.is_workday(days)
+
+    if len(days) * 8 < len(vacation_calendar):
+        # 查询日期远少于日历天数时直接查字典
+        return np.array(
+            [vacation_calendar[item] for item in days.astype('datetime64[s]').astype(dt)],
+            dtype=bool
+        )
+
+    cal_days = np.array(list(vacation_calendar.keys()), dtype='datetime64[D]')
+    cal_values = np.array(list(vacation_calendar.values()), dtype=bool)
+    order = np.argsort(cal_days)
+    cal_days = cal_days[order]
+    cal_values = cal_values[order]
+
+    pos = np.searchsorted(cal_days, days)
+    pos_ = np.minimum(pos, len(cal_days) - 1)
+    found = cal_days[pos_] == days
+    if not found.all():
+        raise KeyError('日期在日历范围之外 %s' % str(days[~found][0]))
+    return cal_values[pos_]
+
+
+class NthWorkdayTable:
+    """
+    月份×N的工作日索引表
+
+    预先计算区间内每个月第N个工作日的日期，'t<N>'规则的判断和序列生成都变为数组查表。
+    N为负数时从月末倒数，例如't-1'表示当月最后一个工作日。
+    """
+
+    def __init__(self, first_month, last_month, vacation_calendar=None):
+        """
+        初始化工作日索引表
+
+        Args:
+            first_month: 起始月份
+            last_month: 结束月份（包含）
+            vacation_calendar: 假期日历，为空时以周末为非工作日
+        """
+        self.first_month = np.datetime64(first_month, 'M')
+        self.last_month = np.datetime64(last_month, 'M')
+
+        first = self.first_month.astype('datetime64[D]')
+        last = (self.last_month + 1).astype('datetime64[D]')
+        days, _, _, day, weekday = split_dt64(np.arange(first, last, dtype='datetime64[D]'))
+
+        if not vacation_calendar:
+            is_biz = weekday < 5
+        else:
+            is_biz = ~get_vacation_mask(days, vacation_calendar)
+
+        # 月内工作日序号
+        cum = np.cumsum(is_biz)
+        month_start = np.arange(len(days)) - (day - 1)
+        rank = cum - np.concatenate([[0], cum])[month_start]
+        month_idx = (days.astype('datetime64[M]') - self.first_month).astype('int64')
+
+        n_months = (self.last_month - self.first_month).astype('int64') + 1
+        self.table = np.full((n_months, 31), np.datetime64('NaT'), dtype='datetime64[D]')
+        self.table[month_idx[is_biz], rank[is_biz] - 1] = days[is_biz]
+        self.counts = np.bincount(month_idx[is_biz], minlength=n_months)
+
+    def __repr__(self):
+        return 'NthWorkdayTable(%s, %s)' % (self.first_month, self.last_month)
+
+    def get(self, months, n):
+        """
+        查询各月份的第N个工作日
+
+        Args:
+            months: 月份数组
+            n: 第几个工作日，负数表示倒数
+
+        Returns:
+            numpy.ndarray: datetime64[D]数组，不存在时为NaT
+        """
+        months = np.asarray(months, dtype='datetime64[M]')
+        month_idx = (months - self.first_month).astype('int64')
+        in_range = (month_idx >= 0) & (month_idx < len(self.counts)) & ~np.isnat(months)
+        month_idx = np.where(in_range, month_idx, 0)
+
+        counts = self.counts[month_idx]
+        col = n - 1 if n > 0 else counts + n
+        valid = in_range & (col >= 0) & (col < counts) & (n != 0)
+        col = np.clip(col, 0, 30)
+
+        res = self.table[month_idx, col]
+        res[~valid] = np.datetime64('NaT')
+        return res
+
+    def mask(self, days, ns):
+        """
+        判断日期是否为所在月份的第N个工作日之一
+
+        Args:
+            days: datetime64[D]数组
+            ns: N的列表
+
+        Returns:
+            numpy.ndarray: 布尔数组
+        """
+        days = np.asarray(days, dtype='datetime64[D]')
+        months = self.first_month + np.arange(len(self.counts))
+        targets = np.concatenate([self.get(months, n) for n in ns])
+        targets = np.sort(targets[~np.isnat(targets)])
+        if len(targets) == 0:
+            return np.zeros(len(days), dtype=bool)
+
+        pos = np.minimum(np.searchsorted(targets, days), len(targets) - 1)
+        return targets[pos] == days
+
+
+@lru_cache(maxsize=64)
+def _get_weekend_nth_workday_table(first_year, last_year):
+    """
+    获取仅以周末为非工作日的工作日索引表，按整年缓存
+
+    Args:
+        first_year: 起始年份
+        last_year: 结束年份（包含）
+
+    Returns:
+        NthWorkdayTable: 工作日索引表
+    """
+    return NthWorkdayTable(
+        np.datetime64('%04d-01' % first_year, 'M'),
+        np.datetime64('%04d-12' % last_year, 'M')
+    )
+
+
+def get_nth_workday_table(first_month, last_month, vacation_calendar=None):
+    """
+    获取覆盖指定月份区间的工作日索引表
+
+    Args:
+        first_month: 起始月份
+        last_month: 结束月份（包含）
+        vacation_calendar: 假期日历，为空时以周末为非工作日
+
+    Returns:
+        NthWorkdayTable: 工作日索引表
+    """
+    if not vacation_calendar:
+        first_year = np.datetime64(first_month, 'Y').astype('int64') + 1970
+        last_year = np.datetime64(last_month, 'Y').astype('int64') + 1970
+        return _get_weekend_nth_workday_table(int(first_year), int(last_year))
+    return NthWorkdayTable(first_month, last_month, vacation_calendar)
+
+
+class DateRule:
+    """
+    编译后的日期规则
+
+    将'年/月/日'格式的日期字符串解析一次，之后以numpy布尔掩码的方式对整个日期数组求值，
+    语义与is_satisfy_date_string一致。
+    """
+
+    def __init__(self, date_string):
+        """
+        初始化日期规则
+
+        Args:
+            date_string: 日期条件字符串，例如'2021/feb/sat'、'y/m/t3'
+        """
+        self.date_string = date_string
+        ys, ms, ds = date_string.split('/')
+
+        # None 表示任意值
+        self.years = None
+        self.months = None
+        self.day_any = False
+        self.days = []
+        self.weekdays = []
+        self.t_days = []
+
+        years = []
+        for s in ys.split(','):
+            if s == 'y':
+                years = None
+                break
+            elif s.isdigit() and str(int(s)) == s:
+                years.append(int(s))
+        self.years = years
+
+        months = []
+        for s in ms.split(','):
+            if s == 'm':
+                months = None
+                break
+            elif is_number(s):
+                months.append(int(s))
+            elif s in month_abbr.keys():
+                months.append(month_abbr[s] + 1)
+            else:
+                print('month param is not valid: %s' % s)
+        self.months = months
+
+        for s in ds.split(','):
+            if s == 'd':
+                self.day_any = True
+            elif is_number(s):
+                if s.isdigit() and str(int(s)) == s:
+                    self.days.append(int(s))
+            elif s in weekday_abbr.keys():
+                self.weekdays.append(weekday_abbr[s])
+            elif s[0] == 't' and is_number(s[1:]):
+                self.t_days.append(int(s[1:]))
+            else:
+                print('day param is not valid: %s' % s)
+
+    def __repr__(self):
+        return 'DateRule(%r)' % self.date_string
+
+    def mask(self, dates, vacation_calendar=None):
+        """
+        计算日期数组是否满足规则
+
+        Args:
+            dates: 日期数组
+            vacation_calendar: 假期日历
+
+        Returns:
+            numpy.ndarray: 布尔掩码
+        """
+        days, year, month, day, weekday = split_dt64(dates)
+        res = ~np.isnat(days)
+
+        if self.years is not None:
+            res &= isin_small(year, self.years)
+        if self.months is not None:
+            res &= isin_small(month, self.months)
+
+        if self.day_any:
+            return res
+
+        day_res = isin_small(day, self.days) | isin_small(weekday, self.weekdays)
+        if self.t_days and res.any():
+            t_days = days[res]
+            table = get_nth_workday_table(t_days.min(), t_days.max(), vacation_calendar)
+            day_res[res] |= table.mask(t_days, self.t_days)
+        res &= day_res
+
+        return res
+
+    def is_possible(self):
+        """
+        静态判断规则是否可能被满足，例如'y/2/30'永远不会满足
+
+        只含't<N>'的规则依赖假期日历，无法静态判断，视为可能满足。
+
+        Returns:
+            bool: 是否可能满足
+        """
+        if self.years == [] or self.months == []:
+            return False
+        if self.day_any or self.weekdays or self.t_days:
+            return True
+
+        months = range(1, 13) if self.months is None else self.months
+        # 年份不限时2月按闰年计
+        years = [2000] if self.years is None else self.years
+        for year in years:
+            for month in months:
+                if not 1 <= month <= 12:
+                    continue
+                n_days = monthrange(year, month)[1]
+                if any(1 <= d <= n_days for d in self.days):
+                    return True
+        return False
+
+    def is_satisfied(self, date, vacation_calendar=None):
+        """
+        检查单个日期是否满足规则
+
+        Args:
+            date: 要检查的日期
+            vacation_calendar: 假期日历
+
+        Returns:
+            bool: 是否满足条件
+        """
+        return bool(self.mask([date], vacation_calendar)[0])
+
+
+@lru_cache(maxsize=None)
+def compile_date_string(date_string):
+    """
+    编译日期字符串，按字符串缓存编译结果
+
+    Args:
+        date_string: 日期条件字符串
+
+    Returns:
+        DateRule: 编译后的日期规则
+    """
+    return DateRule(date_string)
+
+
+def gen_date_series(date_string, start, end, vacation_calendar=None):
+    """
+    生成区间内满足日期字符串条件的日期序列
+
+    Args:
+        date_string: 日期条件字符串
+        start: 开始日期
+        end: 结束日期
+        vacation_calendar: 假期日历
+
+    Returns:
+        list: 满足条件的日期列表
+    """
     res = pd.date_range(start=start, end=end, freq='D')
-    res = [item for item in res if is_satisfy_date_string(item, date_string)]
+    rule = compile_date_string(date_string)
+    res = res[rule.mask(res.values, vacation_calendar)].tolist()
 
     return res
 
 
-def read_calendar(path):
+def _gen_breakpoints(date_string, start, end, vacation_calendar=None):
+    """
+    生成日期规则在区间内的断点数组
+    """
+    days = np.arange(
+        np.datetime64(start, 'D'),
+        np.datetime64(end, 'D') + 1,
+        dtype='datetime64[D]'
+    )
+    res = days[compile_date_string(date_string).mask(days, vacation_calendar)]
+    res.setflags(write=False)
+    return res
+
+
+@lru_cache(maxsize=256)
+def _get_breakpoints_cached(date_string, start, end, vacation_calendar=None):
+    return _gen_breakpoints(date_string, start, end, vacation_calendar)
+
+
+def get_breakpoints(date_string, start, end, vacation_calendar=None):
+    """
+    按日期规则生成区间断点，按(规则, 开始, 结束, 日历)缓存
+
+    可以使用't<N>'等工作日规则，例如'y/m/t1'表示每月第一个工作日。
+    字典形式的假期日历不可哈希，此时不缓存。
+
+    Args:
+        date_string: 日期条件字符串
+        start: 开始日期
+        end: 结束日期（包含）
+        vacation_calendar: 假期日历
+
+    Returns:
+        numpy.ndarray: 只读的datetime64[D]断点数组
+    """
+    start = pd.Timestamp(start).to_datetime64()
+    end = pd.Timestamp(end).to_datetime64()
+    if isinstance(vacation_calendar, dict):
+        return _gen_breakpoints(date_string, start, end, vacation_calendar)
+    return _get_breakpoints_cached(date_string, start, end, vacation_calendar)
+
+
+def bucket_dates(dates, breakpoints, closed='left'):
+    """
+    将日期分配到断点划分的区间
+
+    断点b0 < b1 < ... < bk划分出k个区间，与hf_math.dates_to_sts_exps的区间一致。
+
+    Args:
+        dates: 日期数组或Series
+        breakpoints: 升序断点数组
+        closed: 'left'时区间为[b_i, b_i+1)，'right'时区间为(b_i, b_i+1]
+
+    Returns:
+        numpy.ndarray: 每个日期所在区间的序号，不在任何区间内或为NaT时为-1；输入为Series时返回同索引的Series
+    """
+    values = np.asarray(dates, dtype='datetime64[ns]')
+    bps = np.asarray(breakpoints, dtype='datetime64[ns]')
+
+    if closed == 'left':
+        res = np.searchsorted(bps, values, side='right') - 1
+    elif closed == 'right':
+        res = np.searchsorted(bps, values, side='left') - 1
+    else:
+        raise ValueError(f'unsupported closed: {closed}')
+
+    res[(res < 0) | (res >= len(bps) - 1) | np.isnat(values)] = -1
+
+    if isinstance(dates, pd.Series):
+        return pd.Series(res, index=dates.index, name=dates.name)
+    return res
+
+
+def bucket_aggregate(dates, values, breakpoints, agg='sum', closed='left'):
+    """
+    按断点划分的区间汇总数值
+
+    Args:
+        dates: 日期数组
+        values: 与日期等长的数值数组
+        breakpoints: 升序断点数组
+        agg: 汇总方式，'sum'、'count'、'mean'、'min'或'max'
+        closed: 区间闭合方向，见bucket_dates
+
+    Returns:
+        pd.Series: 以区间开始日期为索引的汇总结果，没有数据的区间sum和count为0，其余为NaN
+    """
+    idx = np.asarray(bucket_dates(dates, breakpoints, closed=closed))
+    values = np.asarray(values, dtype=np.float64)
+    bps = np.asarray(breakpoints, dtype='datetime64[ns]')
+    n = max(len(bps) - 1, 0)
+
+    valid = (idx >= 0) & ~np.isnan(values)
+    idx = idx[valid]
+    values = values[valid]
+
+    if agg == 'sum':
+        res = np.bincount(idx, weights=values, minlength=n)
+    elif agg == 'count':
+        res = np.bincount(idx, minlength=n).astype(np.float64)
+    elif agg == 'mean':
+        with np.errstate(invalid='ignore', divide='ignore'):
+            res = np.bincount(idx, weights=values, minlength=n) / np.bincount(idx, minlength=n)
+    elif agg == 'min':
+        res = np.full(n, np.inf)
+        np.minimum.at(res, idx, values)
+        res[np.isinf(res) & (np.bincount(idx, minlength=n) == 0)] = np.nan
+    elif agg == 'max':
+        res = np.full(n, -np.inf)
+        np.maximum.at(res, idx, values)
+        res[np.isinf(res) & (np.bincount(idx, minlength=n) == 0)] = np.nan
+    else:
+        raise ValueError(f'unsupported agg: {agg}')
+
+    return pd.Series(res, index=pd.DatetimeIndex(bps[:-1]), name=agg)
+
+
+class Schedule:
+    """
+    类似cron的触发计划
+
+    由日期规则（'年/月/日'）与小时、分钟、秒规则组合而成，各字段的语义与
+    is_satisfy_date_string、is_satisfy_hour_string、is_satisfy_minute_string、
+    is_satisfy_second_string一致，各部分可用逗号分隔表示多个选项。
+    下一次触发时间按日、时、分、秒逐字段跳转计算，不逐秒扫描。
+    """
+
+    # 年份不限时逐年查找匹配日期的最大年数；可满足的日期规则8年内（2月29日跨世纪年）必然出现
+    max_search_years = 8
+
+    def __init__(
+            self,
+            date_string,
+            hour_string='0',
+            minute_string='0',
+            second_string='0',
+            vacation_calendar=None
+    ):
+        """
+        初始化触发计划
+
+        Args:
+            date_string: 日期条件字符串，例如'y/m/t1'
+            hour_string: 小时条件字符串，例如'9'、'h'、'2h'
+            minute_string: 分钟条件字符串，例如'30'、'm'、'15m'
+            second_string: 秒条件字符串，例如'0'、's'、'10s'
+            vacation_calendar: 假期日历
+
+        Raises:
+            ValueError: 时、分、秒的间隔不是正整数时抛出，例如'0h'
+        """
+        for field_string, unit in [(hour_string, 'h'), (minute_string, 'm'), (second_string, 's')]:
+            for item in field_string.split(','):
+                if len(item) > 1 and item[-1] == unit and is_number(item[:-1]) and float(item[:-1]) < 1:
+                    print('invalid step in schedule: %s' % field_string)
+                    raise ValueError('step must be a positive integer: %s' % item)
+
+        self.date_string = date_string
+        self.hour_string = hour_string
+        self.minute_string = minute_string
+        self.second_string = second_string
+        self.vacation_calendar = vacation_calendar
+        self.rule = compile_date_string(date_string)
+        # 永远不会满足的日期规则在构建时识别，之后直接返回None
+        self.is_possible = self.rule.is_possible()
+        if not self.is_possible:
+            print('date rule can never be satisfied: %s' % date_string)
+
+        # 用各字段的检查函数预先求出允许的取值
+        self.hours = [
+            h for h in range(24)
+            if any(is_satisfy_hour_string(dt(2000, 1, 1, h), item) for item in hour_string.split(','))
+        ]
+        self.minutes = [
+            m for m in range(60)
+            if any(is_satisfy_minute_string(dt(2000, 1, 1, 0, m), item) for item in minute_string.split(','))
+        ]
+        self.seconds = [
+            sec for sec in range(60)
+            if any(is_satisfy_second_string(dt(2000, 1, 1, 0, 0, sec), item) for item in second_string.split(','))
+        ]
+
+        # 按年缓存的匹配日期
+        self._days_cache = {}
+
+    def __repr__(self):
+        return 'Schedule(%r, %r, %r, %r)' % (
+            self.date_string, self.hour_string, self.minute_string, self.second_string
+        )
+
+    def _get_days(self, year):
+        """
+        获取某一年内满足日期规则的日期，按年缓存
+
+        Args:
+            year: 年份
+
+        Returns:
+            numpy.ndarray: datetime64[D]数组
+        """
+        if year not in self._days_cache:
+            days = np.arange(
+                np.datetime64('%04d-01-01' % year, 'D'),
+                np.datetime64('%04d-01-01' % (year + 1), 'D'),
+                dtype='datetime64[D]'
+            )
+            self._days_cache[year] = days[self.rule.mask(days, self.vacation_calendar)]
+        return self._days_cache[year]
+
+    def _next_day(self, day):
+        """
+        查找晚于指定日期的下一个满足日期规则的日期
+
+        Args:
+            day: datetime64[D]日期
+
+        Returns:
+            numpy.datetime64或None: 下一个匹配日期，不存在时返回None
+        """
+        year = int(day.astype('datetime64[Y]').astype('int64')) + 1970
+        if self.rule.years is None:
+            years = range(year, year + self.max_search_years + 1)
+        else:
+            # 指定年份时只查找这些年份
+            years = sorted(y for y in set(self.rule.years) if y >= year)
+
+        for y in years:
+            days = self._get_days(y)
+            i = np.searchsorted(days, day, side='right')
+            if i < len(days):
+                return days[i]
+        return None
+
+    def _next_time(self, h, m, s):
+        """
+        查找当天严格晚于 (h, m, s) 的最早触发时间
+
+        Returns:
+            tuple或None: (时, 分, 秒)，当天已无触发时间时返回None
+        """
+        if h in self.hours:
+            if m in self.minutes:
+                i = bisect_right(self.seconds, s)
+                if i < len(self.seconds):
+                    return h, m, self.seconds[i]
+            i = bisect_right(self.minutes, m)
+            if i < len(self.minutes):
+                return h, self.minutes[i], self.seconds[0]
+        i = bisect_right(self.hours, h)
+        if i < len(self.hours):
+            return self.hours[i], self.minutes[0], self.seconds[0]
+        return None
+
+    def next_fire(self, after):
+        """
+        计算严格晚于指定时间的下一次触发时间
+
+        Args:
+            after: 起始时间
+
+        Returns:
+            datetime或None: 下一次触发时间，不存在时返回None
+        """
+        if not (self.is_possible and self.hours and self.minutes and self.seconds):
+            return None
+
+        after = pd.Timestamp(after).to_pydatetime()
+        day = np.datetime64(after.date(), 'D')
+
+        # 当天仍有剩余触发时间
+        days = self._get_days(after.year)
+        i = np.searchsorted(days, day)
+        if i < len(days) and days[i] == day:
+            hms = self._next_time(after.hour, after.minute, after.second)
+            if hms is not None:
+                return dt(after.year, after.month, after.day, *hms)
+
+        day = self._next_day(day)
+        if day is None:
+            return None
+        day = day.astype(dt)
+        return dt(day.year, day.month, day.day, self.hours[0], self.minutes[0], self.seconds[0])
+
+    def iter_fire_times(self, after, until=None):
+        """
+        惰性迭代之后的触发时间
+
+        Args:
+            after: 起始时间（不包含）
+            until: 结束时间（包含），为空时不限
+
+        Returns:
+            generator: 依次产出触发时间
+        """
+        runner = self.next_fire(after)
+        while runner is not None and (until is None or runner <= until):
+            yield runner
+            runner = self.next_fire(runner)
+
+
+def read_calendar(path, store_path=None):
+    """
+    读取日历文件为日期-是否工作日字典
+
+    Args:
+        path: Excel日历文件路径
+        store_path: 二进制日历存储文件路径，指定时从存储文件加载，源文件变化时才重新读取Excel
+
+    Returns:
+        dict: 日历字典，key为日期，value为是否工作日
+    """
+    if store_path is not None:
+        return open_calendar_store(path, store_path).to_dict()
+
     data = pd.read_excel(path)
     data = dict(zip(data['date'], data['workday'].apply(lambda x: True if x == 1 else False)))
     return data
 
 
+class BusinessCalendar:
+    """
+    数组形式的工作日日历
+
+    以连续的布尔数组保存从起始日开始每天是否为工作日，并保存累计工作日数，
+    工作日判断、工作日加减和区间工作日计数都是O(1)的数组下标运算，且支持整列向量化计算。
+    输入为Series时返回同索引的Series。
+    """
+
+    def __init__(self, first_day, workdays, cum=None, workday_pos=None):
+        """
+        初始化工作日日历
+
+        Args:
+            first_day: 日历起始日期
+            workdays: 从起始日期开始逐日的是否工作日数组
+            cum: 预先计算的累计工作日数，为空时重新计算
+            workday_pos: 预先计算的工作日下标，为空时重新计算
+        """
+        self.first_day = np.datetime64(pd.Timestamp(first_day), 'D')
+        if isinstance(workdays, np.ndarray) and workdays.dtype == np.uint8:
+            # 日历存储文件中的字节数组直接按布尔值解释，不复制
+            workdays = workdays.view(bool)
+        self.workdays = np.asarray(workdays, dtype=bool)
+        self.last_day = self.first_day + (len(self.workdays) - 1)
+        # cum[i] 为 [first_day, first_day + i) 内的工作日数
+        if cum is None:
+            cum = np.concatenate([[0], np.cumsum(self.workdays)])
+        self.cum = cum
+        # 按先后顺序排列的全部工作日下标
+        if workday_pos is None:
+            workday_pos = np.flatnonzero(self.workdays)
+        self.workday_pos = workday_pos
+
+    @classmethod
+    def from_dict(cls, calendar):
+        """
+        从read_calendar返回的日期-是否工作日字典构建日历
+
+        Args:
+            calendar: 日历字典，key为日期，value为是否工作日
+
+        Returns:
+            BusinessCalendar: 工作日日历
+
+        Raises:
+            ValueError: 日历日期不连续时
+        """
+        days = np.array(list(calendar.keys()), dtype='datetime64[D]')
+        values = np.array(list(calendar.values()), dtype=bool)
+        return cls.from_arrays(days, values)
+
+    @classmethod
+    def from_arrays(cls, days, workdays):
+        """
+        从日期数组和是否工作日数组构建日历
+
+        Args:
+            days: 日期数组
+            workdays: 是否工作日数组
+
+        Returns:
+            BusinessCalendar: 工作日日历
+
+        Raises:
+            ValueError: 日历日期不连续时
+        """
+        days = np.asarray(days, dtype='datetime64[D]')
+        workdays = np.asarray(workdays, dtype=bool)
+        order = np.argsort(days)
+        days = days[order]
+        workdays = workdays[order]
+
+        if len(days) == 0:
+            raise ValueError('无日历信息')
+        gaps = np.flatnonzero(np.diff(days).astype('int64') != 1)
+        if len(gaps) > 0:
+            raise ValueError('日历日期不连续 %s - %s' % (days[gaps[0]], days[gaps[0] + 1]))
+
+        return cls(days[0], workdays)
+
+    @classmethod
+    def from_excel(cls, path):
+        """
+        从Excel日历文件构建日历，文件格式与read_calendar一致
+
+        Args:
+            path: Excel文件路径
+
+        Returns:
+            BusinessCalendar: 工作日日历
+        """
+        data = pd.read_excel(path)
+        return cls.from_arrays(data['date'].values, (data['workday'] == 1).values)
+
+    @classmethod
+    def from_weekends(cls, start, end):
+        """
+        构建仅以周末为非工作日的日历
+
+        Args:
+            start: 开始日期
+            end: 结束日期（包含）
+
+        Returns:
+            BusinessCalendar: 工作日日历
+        """
+        days = np.arange(
+            np.datetime64(pd.Timestamp(start), 'D'),
+            np.datetime64(pd.Timestamp(end), 'D') + 1,
+            dtype='datetime64[D]'
+        )
+        return cls(days[0], (days.astype('int64') + 3) % 7 < 5)
+
+    def __len__(self):
+        return len(self.workdays)
+
+    def __repr__(self):
+        return 'BusinessCalendar(%s - %s)' % (self.first_day, self.last_day)
+
+    def __contains__(self, date):
+        day = np.datetime64(pd.Timestamp(date), 'D')
+        return bool(self.first_day <= day <= self.last_day)
+
+    def __getitem__(self, date):
+        # 与read_calendar返回的字典用法保持兼容
+        return self.is_workday(date)
+
+    def to_dict(self):
+        """
+        转换为read_calendar格式的日期-是否工作日字典
+
+        Returns:
+            dict: 日历字典
+        """
+        days = pd.DatetimeIndex(self.first_day + np.arange(len(self.workdays)))
+        return dict(zip(days, self.workdays.tolist()))
+
+    def _to_pos(self, dates):
+        """
+        将日期转换为日历下标
+
+        Args:
+            dates: 日期或日期数组
+
+        Returns:
+            tuple: (下标数组, 是否NaT数组, 是否标量)
+
+        Raises:
+            KeyError: 日期在日历范围之外时
+        """
+        is_scalar = np.ndim(dates) == 0 and not isinstance(dates, (list, tuple))
+        days = np.asarray([dates] if is_scalar else dates, dtype='datetime64[D]')
+        nat = np.isnat(days)
+        pos = np.where(nat, 0, (days - self.first_day).astype('int64'))
+        out_of_range = (pos < 0) | (pos >= len(self.workdays))
+        if out_of_range.any():
+            raise KeyError('日期在日历范围之外 %s，日历范围 %s - %s' % (
+                days[out_of_range][0], self.first_day, self.last_day
+            ))
+        return pos, nat, is_scalar
+
+    @staticmethod
+    def _wrap(res, dates, is_scalar):
+        """
+        按输入类型包装结果：标量返回标量，Series返回同索引的Series
+        """
+        if is_scalar:
+            return res[0]
+        if isinstance(dates, pd.Series):
+            return pd.Series(res, index=dates.index, name=dates.name)
+        return res
+
+    def _pos_to_days(self, pos, valid):
+        """
+        将工作日序号转换为日期，无效位置为NaT
+        """
+        n = len(self.workday_pos)
+        ok = valid & (pos >= 0) & (pos < n)
+        res = self.first_day + self.workday_pos[np.clip(pos, 0, max(n - 1, 0))]
+        res[~ok] = np.datetime64('NaT')
+        return res
+
+    def is_workday(self, dates):
+        """
+        判断日期是否为工作日
+
+        Args:
+            dates: 日期或日期数组
+
+        Returns:
+            bool或numpy.ndarray: 是否工作日，NaT为False
+        """
+        pos, nat, is_scalar = self._to_pos(dates)
+        res = self.workdays[pos] & ~nat
+        return self._wrap(res, dates, is_scalar)
+
+    def add_workdays(self, dates, n):
+        """
+        日期加减工作日
+
+        n>0 时返回日期之后的第n个工作日，n<0 时返回日期之前的第|n|个工作日，
+        n=0 时日期本身为工作日则返回本身，否则顺延到下一个工作日。
+        超出日历范围的结果为NaT。
+
+        Args:
+            dates: 日期或日期数组
+            n: 工作日数，可以是整数或与日期等长的数组
+
+        Returns:
+            numpy.datetime64或numpy.ndarray: 结果日期
+        """
+        pos, nat, is_scalar = self._to_pos(dates)
+        n = np.asarray(n, dtype='int64')
+        target = np.where(
+            n > 0,
+            self.cum[pos + 1] + n - 1,
+            np.where(n < 0, self.cum[pos] + n, self.cum[pos])
+        )
+        res = self._pos_to_days(target, ~nat)
+        return self._wrap(res, dates, is_scalar)
+
+    def count_workdays_between(self, sts, eds):
+        """
+        计算区间 [开始日期, 结束日期) 内的工作日数
+
+        Args:
+            sts: 开始日期或日期数组
+            eds: 结束日期或日期数组
+
+        Returns:
+            int或numpy.ndarray: 工作日数，结束日期早于开始日期时为负数；
+                含NaT时返回float数组，对应位置为NaN
+        """
+        pos_st, nat_st, is_scalar = self._to_pos(sts)
+        # 结束日期为开区间，允许等于日历最后一天的次日
+        is_scalar_ed = np.ndim(eds) == 0 and not isinstance(eds, (list, tuple))
+        days_ed = np.asarray([eds] if is_scalar_ed else eds, dtype='datetime64[D]')
+        nat_ed = np.isnat(days_ed)
+        pos_ed = np.where(nat_ed, 0, (days_ed - self.first_day).astype('int64'))
+        out_of_range = ~nat_ed & ((pos_ed < 0) | (pos_ed > len(self.workdays)))
+        if out_of_range.any():
+            raise KeyError('日期在日历范围之外 %s，日历范围 %s - %s' % (
+                days_ed[out_of_range][0], self.first_day, self.last_day
+            ))
+
+        res = self.cum[pos_ed] - self.cum[pos_st]
+        nat = nat_st | nat_ed
+        if nat.any():
+            res = np.where(nat, np.nan, res)
+        return self._wrap(res, sts, is_scalar and is_scalar_ed)
+
+    def get_work_day(self, dates, days):
+        """
+        向量化的get_work_day，语义与get_work_day一致：
+        从日期本身开始（包含）沿方向数第|days|+1个工作日，days>0 向后，否则向前
+
+        Args:
+            dates: 日期或日期数组
+            days: 工作日数
+
+        Returns:
+            numpy.datetime64或numpy.ndarray: 结果日期
+        """
+        pos, nat, is_scalar = self._to_pos(dates)
+        days = np.asarray(days, dtype='int64')
+        target = np.where(
+            days > 0,
+            self.cum[pos] + days,
+            self.cum[pos + 1] - np.abs(days) - 1
+        )
+        res = self._pos_to_days(target, ~nat)
+        return self._wrap(res, dates, is_scalar)
+
+
+def read_business_calendar(path, store_path=None):
+    """
+    读取Excel日历文件为工作日日历
+
+    指定store_path时使用二进制日历存储：源文件未变化时直接内存映射存储文件，
+    源文件变化时重新编译。
+
+    Args:
+        path: Excel文件路径，也可以是多个年度日历文件路径的列表
+        store_path: 二进制日历存储文件路径
+
+    Returns:
+        BusinessCalendar: 工作日日历
+    """
+    if store_path is not None:
+        return open_calendar_store(path, store_path)
+
+    if isinstance(path, (list, tuple)):
+        data = pd.concat([pd.read_excel(item) for item in path], ignore_index=True)
+        data = data.drop_duplicates(subset='date', keep='last')
+        return BusinessCalendar.from_arrays(data['date'].values, (data['workday'] == 1).values)
+    return BusinessCalendar.from_excel(path)
+
+
+# 日历存储文件格式：64字节文件头（魔数、起始日、天数、工作日数），
+# 之后依次为逐日是否工作日（uint8）、累计工作日数（int64）、工作日下标（int64），均按8字节对齐
+calendar_store_magic = b'HFCAL001'
+calendar_store_header_size = 64
+
+
+def _align8(n):
+    return (n + 7) // 8 * 8
+
+
+def write_calendar_store(calendar, store_path):
+    """
+    将工作日日历写入二进制日历存储文件
+
+    先写临时文件再替换，其他进程不会读到写了一半的文件。
+
+    Args:
+        calendar: 工作日日历
+        store_path: 存储文件路径
+    """
+    folder = os.path.dirname(os.path.abspath(store_path))
+    mkdir(folder)
+
+    n_days = len(calendar.workdays)
+    n_workdays = len(calendar.workday_pos)
+    header = np.zeros(calendar_store_header_size // 8, dtype='<i8')
+    header[1:4] = [calendar.first_day.astype('int64'), n_days, n_workdays]
+
+    tmp_path = '%s.%d.tmp' % (store_path, os.getpid())
+    with open(tmp_path, 'wb') as f:
+        header_bytes = bytearray(header.tobytes())
+        header_bytes[:8] = calendar_store_magic
+        f.write(header_bytes)
+        f.write(calendar.workdays.astype(np.uint8).tobytes())
+        f.write(b'\0' * (_align8(n_days) - n_days))
+        f.write(np.asarray(calendar.cum, dtype='<i8').tobytes())
+        f.write(np.asarray(calendar.workday_pos, dtype='<i8').tobytes())
+    os.replace(tmp_path, store_path)
+
+
+def load_calendar_store(store_path):
+    """
+    以内存映射方式加载二进制日历存储文件
+
+    文件按只读方式映射，多个进程加载同一文件时共享操作系统的页缓存。
+
+    Args:
+        store_path: 存储文件路径
+
+    Returns:
+        BusinessCalendar: 工作日日历
+
+    Raises:
+        ValueError: 文件不是日历存储文件时
+    """
+    mm = np.memmap(store_path, dtype=np.uint8, mode='r')
+    if bytes(mm[:8]) != calendar_store_magic:
+        raise ValueError('not a calendar store file: %s' % store_path)
+
+    first_day, n_days, n_workdays = mm[8:32].view('<i8').tolist()
+    offset = calendar_store_header_size
+    workdays = mm[offset: offset + n_days]
+    offset += _align8(n_days)
+    cum = mm[offset: offset + (n_days + 1) * 8].view('<i8')
+    offset += (n_days + 1) * 8
+    workday_pos = mm[offset: offset + n_workdays * 8].view('<i8')
+
+    return BusinessCalendar(
+        np.datetime64(first_day, 'D'),
+        workdays,
+        cum=cum,
+        workday_pos=workday_pos
+    )
+
+
+def get_file_signature(path, with_hash=False):
+    """
+    获取源文件签名，用于判断日历存储是否需要重建
+
+    Args:
+        path: 文件路径
+        with_hash: 是否计算文件内容的sha256
+
+    Returns:
+        dict: 包含路径、修改时间、大小和（可选）sha256的字典
+    """
+    res = {
+        'path': os.path.abspath(path),
+        'mtime': os.path.getmtime(path),
+        'size': os.path.getsize(path),
+    }
+    if with_hash:
+        h = hashlib.sha256()
+        with open(path, 'rb') as f:
+            for chunk in iter(lambda: f.read(2 ** 20), b''):
+                h.update(chunk)
+        res['sha256'] = h.hexdigest()
+    return res
+
+
+def compile_calendar_store(paths, store_path):
+    """
+    将一个或多个年度Excel日历编译为二进制日历存储文件
+
+    同时写入记录源文件签名的元数据文件（store_path + '.json'）。
+
+    Args:
+        paths: Excel日历文件路径或路径列表
+        store_path: 存储文件路径
+
+    Returns:
+        BusinessCalendar: 编译后的工作日日历
+    """
+    if isinstance(paths, str):
+        paths = [paths]
+
+    calendar = read_business_calendar(list(paths))
+    write_calendar_store(calendar, store_path)
+
+    meta = {'sources': [get_file_signature(path, with_hash=True) for path in paths]}
+    tmp_path = '%s.json.%d.tmp' % (store_path, os.getpid())
+    with open(tmp_path, 'w', encoding='utf-8') as f:
+        json.dump(meta, f, ensure_ascii=False, indent=4)
+    os.replace(tmp_path, store_path + '.json')
+
+    return calendar
+
+
+def is_calendar_store_stale(paths, store_path):
+    """
+    判断日历存储是否需要重建
+
+    先比较源文件的修改时间和大小，不一致时再比较内容的sha256，
+    内容未变时只更新元数据中的修改时间。
+
+    Args:
+        paths: Excel日历文件路径或路径列表
+        store_path: 存储文件路径
+
+    Returns:
+        bool: 是否需要重建
+    """
+    if isinstance(paths, str):
+        paths = [paths]
+
+    meta_path = store_path + '.json'
+    if not os.path.exists(store_path) or not os.path.exists(meta_path):
+        return True
+
+    with open(meta_path, encoding='utf-8') as f:
+        sources = json.load(f)['sources']
+    if [item['path'] for item in sources] != [os.path.abspath(path) for path in paths]:
+        return True
+
+    touched = False
+    for item, path in zip(sources, paths):
+        signature = get_file_signature(path)
+        if signature['mtime'] == item['mtime'] and signature['size'] == item['size']:
+            continue
+        signature = get_file_signature(path, with_hash=True)
+        if signature['sha256'] != item['sha256']:
+            return True
+        item.update(signature)
+        touched = True
+
+    if touched:
+        tmp_path = '%s.%d.tmp' % (meta_path, os.getpid())
+        with open(tmp_path, 'w', encoding='utf-8') as f:
+            json.dump({'sources': sources}, f, ensure_ascii=False, indent=4)
+        os.replace(tmp_path, meta_path)
+
+    return False
+
+
+def open_calendar_store(paths, store_path):
+    """
+    打开日历存储，源文件变化时先重新编译
+
+    Args:
+        paths: Excel日历文件路径或路径列表
+        store_path: 存储文件路径
+
+    Returns:
+        BusinessCalendar: 内存映射的工作日日历
+    """
+    if is_calendar_store_stale(paths, store_path):
+        compile_calendar_store(paths, store_path)
+    return load_calendar_store(store_path)
+
+
 def is_workday(date: dt, calendar=None):
     if not calendar:
         print('无日历信息')
         raise ValueError
 
+    if isinstance(calendar, BusinessCalendar):
+        if date not in calendar:
+            print('日期在日历范围之外 %s - %s' % (calendar.first_day, calendar.last_day))
+            return False
+        return bool(calendar.is_workday(date))
+
     try:
         return calendar[date]
     except KeyError:
         print('日期在日历范围之外 %s - %s' %
-              (min(calendar.keys().strftime('%Y%m%d'), max(calendar.keys().strftime('%Y%m%d')))))
+              (min(calendar.keys()).strftime('%Y%m%d'), max(calendar.keys()).strftime('%Y%m%d')))
         return False
 
 
 def get_work_day(date, calendar, days):
+    if isinstance(calendar, BusinessCalendar):
+        res = calendar.get_work_day(date, days)
+        if np.isnat(res):
+            raise KeyError('日期在日历范围之外 %s' % str(date))
+        return to_dt(res)
+
     date_runner = dt(date.year, date.month, date.day)
     work_day_count = 0
     while work_day_count <= abs(days):
@@ -394,33 +1748,284 @@ def get_date_range_str(date_range):
     return s
 
 
+def get_date_spans(dates):
+    """
+    将日期集合压缩为最少的连续日期段
+
+    Args:
+        dates: 日期集合，可以是列表、数组、DatetimeIndex或Series
+
+    Returns:
+        numpy.ndarray: datetime64[D]数组，形状为(n, 2)，每行为(开始日期, 结束日期)，两端都包含
+    """
+    days = np.asarray(dates, dtype='datetime64[D]')
+    days = np.unique(days[~np.isnat(days)])
+    if len(days) == 0:
+        return np.empty((0, 2), dtype='datetime64[D]')
+
+    # 相邻日期差不为1处断开
+    breaks = np.flatnonzero(np.diff(days).astype('int64') != 1)
+    starts = np.concatenate([[0], breaks + 1])
+    ends = np.concatenate([breaks, [len(days) - 1]])
+    return np.stack([days[starts], days[ends]], axis=1)
+
+
+def get_overlap_seconds_inputs(sts, exps, ranges, st_fillna, exp_fillna):
+    """
+    将区间开始、结束日期和统计区间转换为秒数，供交集长度计算使用
+
+    Args:
+        sts: 开始日期数组
+        exps: 结束日期数组
+        ranges: 统计区间列表，每个元素为(开始日期, 结束日期)
+        st_fillna: 开始日期缺失时的默认值
+        exp_fillna: 结束日期缺失时的默认值
+
+    Returns:
+        tuple: (开始秒数, 结束秒数, 统计区间秒数)
+    """
+    # 将缺失值替换为默认时间；按微秒换算，9999-12-31等超出纳秒范围的日期也不会溢出
+    sts_ = pd.to_datetime(pd.Series(sts), utc=False).fillna(st_fillna).values
+    sts_ = sts_.astype('datetime64[us]').astype('int64') / 10 ** 6
+    exps_ = pd.to_datetime(pd.Series(exps), utc=False).fillna(exp_fillna).values
+    exps_ = exps_.astype('datetime64[us]').astype('int64') / 10 ** 6
+    ranges_ = [(start.timestamp(), end.timestamp()) for start, end in ranges]
+    ranges_ = np.array(ranges_).astype('int64').reshape(-1, 2)
+    return sts_, exps_, ranges_
+
+
 def get_overlap_days(
         sts,
         exps,
         ranges,
         st_fillna=dt(1990, 1, 1),
-        exp_fillna=dt(2199, 1, 1)
+        exp_fillna=dt(2199, 1, 1),
+        dtype=None,
+        out=None,
+        memory_budget=None
 ):
-    # 将缺失值替换为默认时间
-    sts_ = pd.to_datetime(pd.Series(sts), utc=False).fillna(st_fillna).values.astype('int64') / 10 ** 9
-    exps_ = pd.to_datetime(pd.Series(exps), utc=False).fillna(exp_fillna).values.astype('int64') / 10 ** 9
-    ranges_ = [(start.timestamp(), end.timestamp()) for start, end in ranges]
-    ranges_ = np.array(ranges_).astype('int64')
+    """
+    计算每个区间与每个统计区间的重叠天数
+
+    按内存上限分块计算，结果写入预分配的输出数组。
+
+    Args:
+        sts: 开始日期数组
+        exps: 结束日期数组
+        ranges: 统计区间列表，每个元素为(开始日期, 结束日期)
+        st_fillna: 开始日期缺失时的默认值
+        exp_fillna: 结束日期缺失时的默认值
+        dtype: 输出类型，例如float32或int32，默认为float64
+        out: 预分配的输出数组，形状为(len(sts), len(ranges))
+        memory_budget: 工作内存上限（字节）
+
+    Returns:
+        numpy.ndarray: 重叠天数矩阵，形状为(len(sts), len(ranges))
+    """
+    sts_, exps_, ranges_ = get_overlap_seconds_inputs(sts, exps, ranges, st_fillna, exp_fillna)
     seconds_per_day = 86400
 
-    # 计算重叠天数
-    res = nd_array_crop(
+    # 计算重叠天数，分块内已保证结果不小于0
+    res = nd_array_crop_into(
         sts_,
         exps_,
-        ranges_
+        ranges_,
+        out=out,
+        dtype=np.float64 if dtype is None else dtype,
+        scale=seconds_per_day,
+        memory_budget=memory_budget
     )
 
-    res = res / seconds_per_day
-
-    res = np.maximum(res, 0)  # 确保结果不小于0
     return res
 
 
+def get_overlap_days_sum(
+        sts,
+        exps,
+        ranges,
+        by='range',
+        groups=None,
+        st_fillna=dt(1990, 1, 1),
+        exp_fillna=dt(2199, 1, 1),
+        memory_budget=None
+):
+    """
+    计算重叠天数并直接汇总，不生成完整的重叠天数矩阵
+
+    Args:
+        sts: 开始日期数组
+        exps: 结束日期数组
+        ranges: 统计区间列表，每个元素为(开始日期, 结束日期)
+        by: 汇总方式，'range'按统计区间、'contract'按区间、'group'按groups分组
+        groups: 分组键数组，by为'group'时必填
+        st_fillna: 开始日期缺失时的默认值
+        exp_fillna: 结束日期缺失时的默认值
+        memory_budget: 工作内存上限（字节）
+
+    Returns:
+        numpy.ndarray或pandas.DataFrame: 汇总的重叠天数
+    """
+    sts_, exps_, ranges_ = get_overlap_seconds_inputs(sts, exps, ranges, st_fillna, exp_fillna)
+    seconds_per_day = 86400
+
+    return nd_array_crop_reduce(
+        sts_,
+        exps_,
+        ranges_,
+        by=by,
+        groups=groups,
+        scale=seconds_per_day,
+        memory_budget=memory_budget
+    )
+
+
+# 支持的计息天数惯例
+day_count_conventions = ('ACT/360', 'ACT/365', '30/360', 'BUS/252')
+
+
+def get_day_count_fraction(sts, eds, convention='ACT/365', calendar=None):
+    """
+    按计息天数惯例计算区间 [开始日期, 结束日期) 的年化天数比例
+
+    Args:
+        sts: 开始日期，datetime64[D]数组
+        eds: 结束日期，datetime64[D]数组，不晚于开始日期时比例为0
+        convention: 计息天数惯例，见day_count_conventions
+        calendar: 工作日日历，'BUS/252'时必填
+
+    Returns:
+        numpy.ndarray: 年化天数比例
+    """
+    sts = np.asarray(sts, dtype='datetime64[D]')
+    eds = np.asarray(eds, dtype='datetime64[D]')
+    valid = eds > sts
+
+    if convention == 'ACT/360':
+        days = (eds - sts).astype('int64')
+        res = days / 360
+    elif convention == 'ACT/365':
+        days = (eds - sts).astype('int64')
+        res = days / 365
+    elif convention == '30/360':
+        # 30/360 US：起始日31号按30号计，起始日为30号以后时结束日31号也按30号计
+        _, y1, m1, d1, _ = split_dt64(sts.ravel())
+        _, y2, m2, d2, _ = split_dt64(eds.ravel())
+        d1 = np.minimum(d1.astype('int64'), 30)
+        d2 = d2.astype('int64')
+        d2 = np.where((d2 == 31) & (d1 >= 30), 30, d2)
+        days = (
+            360 * (y2.astype('int64') - y1) + 30 * (m2.astype('int64') - m1) + (d2 - d1)
+        ).reshape(sts.shape)
+        res = days / 360
+    elif convention == 'BUS/252':
+        if calendar is None:
+            raise ValueError('calendar is required for BUS/252')
+        if not isinstance(calendar, BusinessCalendar):
+            calendar = BusinessCalendar.from_dict(calendar)
+        # 无效区间的端点可能超出日历范围，先替换为日历起始日
+        sts_ = np.where(valid, sts, calendar.first_day)
+        eds_ = np.where(valid, eds, calendar.first_day)
+        days = calendar.count_workdays_between(sts_.ravel(), eds_.ravel()).reshape(sts.shape)
+        res = days / 252
+    else:
+        raise ValueError(f'unsupported convention: {convention}')
+
+    return np.where(valid, res, 0)
+
+
+def get_accrual(
+        sts,
+        exps,
+        notionals,
+        ranges,
+        rates=1,
+        convention='ACT/365',
+        calendar=None,
+        output='wide',
+        st_fillna=dt(1990, 1, 1),
+        exp_fillna=dt(2199, 1, 1),
+        memory_budget=None
+):
+    """
+    计算每个合约在每个统计区间内的计息比例和应计金额
+
+    合约区间与统计区间的重叠部分与get_overlap_days一致，按合约分块计算，内存受memory_budget限制。
+
+    Args:
+        sts: 合约开始日期数组
+        exps: 合约到期日期数组
+        notionals: 本金数组
+        ranges: 统计区间列表，每个元素为(开始日期, 结束日期)
+        rates: 年利率，标量或与合约等长的数组，默认为1即只计算本金×比例
+        convention: 计息天数惯例，见day_count_conventions
+        calendar: 工作日日历，'BUS/252'时必填
+        output: 'wide'返回(比例矩阵, 应计金额矩阵)，形状为(合约数, 区间数)；
+            'long'返回只包含有重叠部分的长表DataFrame
+        st_fillna: 开始日期缺失时的默认值
+        exp_fillna: 结束日期缺失时的默认值
+        memory_budget: 工作内存上限（字节）
+
+    Returns:
+        tuple或pd.DataFrame: 计息结果
+    """
+    if convention not in day_count_conventions:
+        raise ValueError(f'unsupported convention: {convention}')
+    if output not in ('wide', 'long'):
+        raise ValueError(f'unsupported output: {output}')
+    if convention == 'BUS/252' and calendar is not None and not isinstance(calendar, BusinessCalendar):
+        calendar = BusinessCalendar.from_dict(calendar)
+
+    sts_ = pd.to_datetime(pd.Series(sts)).fillna(st_fillna).values.astype('datetime64[D]')
+    exps_ = pd.to_datetime(pd.Series(exps)).fillna(exp_fillna).values.astype('datetime64[D]')
+    ranges_ = np.array(
+        [(pd.Timestamp(st).to_datetime64(), pd.Timestamp(ed).to_datetime64()) for st, ed in ranges],
+        dtype='datetime64[D]'
+    ).reshape(-1, 2)
+    notionals = np.broadcast_to(np.asarray(notionals, dtype=np.float64), sts_.shape)
+    rates = np.broadcast_to(np.asarray(rates, dtype=np.float64), sts_.shape)
+
+    n, m = len(sts_), len(ranges_)
+    if memory_budget is None:
+        memory_budget = crop_memory_budget
+    # 每块约使用6个 (块大小, 区间数) 的8字节临时矩阵
+    block_size = max(1, min(n, int(memory_budget // max(1, 6 * 8 * m))))
+
+    if output == 'wide':
+        fractions = np.zeros((n, m), dtype=np.float64)
+        amounts = np.zeros((n, m), dtype=np.float64)
+    else:
+        frames = []
+
+    for i in range(0, n, block_size):
+        j = min(i + block_size, n)
+        overlap_st = np.maximum(sts_[i:j, None], ranges_[None, :, 0])
+        overlap_ed = np.minimum(exps_[i:j, None], ranges_[None, :, 1])
+        fraction = get_day_count_fraction(overlap_st, overlap_ed, convention=convention, calendar=calendar)
+        amount = fraction * (notionals[i:j] * rates[i:j])[:, None]
+
+        if output == 'wide':
+            fractions[i:j] = fraction
+            amounts[i:j] = amount
+        else:
+            rows, cols = np.nonzero(overlap_ed > overlap_st)
+            frames.append(pd.DataFrame({
+                'contract': rows + i,
+                'period': cols,
+                'period_st': ranges_[cols, 0],
+                'period_exp': ranges_[cols, 1],
+                'days': (overlap_ed[rows, cols] - overlap_st[rows, cols]).astype('int64'),
+                'fraction': fraction[rows, cols],
+                'accrued': amount[rows, cols],
+            }))
+
+    if output == 'wide':
+        return fractions, amounts
+
+    if len(frames) == 0:
+        return pd.DataFrame(columns=['contract', 'period', 'period_st', 'period_exp', 'days', 'fraction', 'accrued'])
+    return pd.concat(frames, ignore_index=True)
+
+
 def test_read_state_council_vacation_info():
     f = open('e:\\2021_vacation.txt', encoding='utf-8')
     rs = f.readlines()
@@ -463,6 +2068,54 @@ def date_ext_to_date(s):
         return dt.strptime(s, '%Y%m%d'), dt.strptime(s, '%Y%m%d')
 
 
+def date_ext_to_date_array(s, return_report=False):
+    """
+    批量将单日'YYYYMMDD'或区间'YYYYMMDD-YYYYMMDD'字符串转换为开始、到期日期
+
+    用向量化的字符串操作拆分，再一次性解析，格式错误、日期非法或超出datetime64[ns]范围的值
+    置为NaT并汇总报告，不逐个抛出异常。
+
+    Args:
+        s: 日期或区间字符串的Series、列表或numpy数组
+        return_report: 是否同时返回错误报告
+
+    Returns:
+        tuple: (开始日期, 到期日期)两个datetime64[ns]数组；
+            return_report为True时再附加报告，报告包含错误数量、错误位置和错误样例
+    """
+    s = pd.Series(np.asarray(s.values if isinstance(s, pd.Series) else s, dtype=object))
+    # 区间字符串重复度高，只解析去重后的值
+    codes, uniques = pd.factorize(s, use_na_sentinel=True)
+    u = pd.Series(uniques, dtype=object)
+    length = u.str.len()
+    # 单日为8位，区间为'8位-8位'共17位；长度不符的值按非法处理
+    is_single = (length == 8).values
+    is_period = ((length == 17) & (u.str[8] == '-')).values
+    st_str = u.str[:8].where(is_single | is_period)
+    exp_str = u.str[9:].where(is_period, st_str)
+
+    # 超出datetime64[ns]范围的日期（如99991231）置为NaT，计入错误
+    st = _to_ns(pd.to_datetime(st_str, format='%Y%m%d', errors='coerce').values)[0]
+    exp = _to_ns(pd.to_datetime(exp_str, format='%Y%m%d', errors='coerce').values)[0]
+    st = np.append(st, np.datetime64('NaT'))[codes]
+    exp = np.append(exp, np.datetime64('NaT'))[codes]
+
+    invalid = (np.isnat(st) | np.isnat(exp)) & (codes >= 0)
+    report = {
+        'n_errors': int(invalid.sum()),
+        'index': np.flatnonzero(invalid),
+        'errors': s[invalid].head(10).tolist(),
+    }
+    if report['n_errors'] > 0:
+        print('date ext not recognizable or out of range: %d values, e.g. %s' % (
+            report['n_errors'], ', '.join([str(item) for item in report['errors']])
+        ))
+
+    if return_report:
+        return st, exp, report
+    return st, exp
+
+
 def test_read_calendar():
     pth = r'E:\projects\db\i_calendar_2022.xlsx'
     calendar = read_calendar(pth)
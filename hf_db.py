@@ -28,6 +28,7 @@ parent_dir = os.path.dirname(current_dir)
 if parent_dir not in sys.path:
     sys.path.append(parent_dir)
 
+from helper_function.hf_date import get_date_spans
 from helper_function.hf_file import mkdir
 from helper_function.hf_string import get_col_sql_str
 
@@ -301,4 +302,90 @@ def get_data_df(con, table_name, cols=None):
         sql=sql,
         con=con
     )
-    return data
\ No newline at end of file
+    return data
+
+
+def create_date_span_table(con, spans, table_name='tmp_date_spans'):
+    """
+    创建存放日期段的临时表
+
+    临时表只在当前连接内可见，需与后续查询使用同一个连接。
+    列名使用带前缀的hf_span_st、hf_span_ed，避免与外层查询的日期列（如st、ed）同名时
+    在EXISTS子查询中被解析为临时表的列。
+
+    Args:
+        con: 数据库连接对象
+        spans: 日期段数组，每行为(开始日期, 结束日期的次日)
+        table_name: 临时表名
+    """
+    con.execute(text(f'DROP TEMPORARY TABLE IF EXISTS `{table_name}`'))
+    con.execute(text(
+        f'CREATE TEMPORARY TABLE `{table_name}` '
+        f'(`hf_span_st` DATETIME NOT NULL, `hf_span_ed` DATETIME NOT NULL, PRIMARY KEY (`hf_span_st`))'
+    ))
+    rows = [
+        {'st': pd.Timestamp(st).to_pydatetime(), 'ed': pd.Timestamp(ed).to_pydatetime()}
+        for st, ed in spans
+    ]
+    if len(rows) > 0:
+        con.execute(text(
+            f'INSERT INTO `{table_name}` (`hf_span_st`, `hf_span_ed`) VALUES (:st, :ed)'
+        ), rows)
+
+
+def get_date_range_predicate(
+        col,
+        dates,
+        half_open=True,
+        param_prefix='date',
+        max_spans=100,
+        con=None,
+        temp_table='tmp_date_spans'
+):
+    """
+    构建日期集合的SQL过滤条件
+
+    将日期集合压缩为最少的连续日期段，每段生成一个带绑定参数的范围条件，替代逐个日期的IN列表。
+    日期段数超过max_spans且提供了连接时，把日期段写入临时表，改用EXISTS关联临时表。
+
+    Args:
+        col: 日期列名，会原样写入SQL，多表查询时应带表别名，例如't.`date`'
+        dates: 日期集合
+        half_open: 为True时生成'col >= 开始 AND col < 结束次日'，适用于DATETIME列；
+            为False时生成'col BETWEEN 开始 AND 结束'，适用于DATE列
+        param_prefix: 绑定参数名前缀
+        max_spans: 直接生成范围条件的最大日期段数
+        con: 数据库连接对象，日期段过多时用于创建临时表
+        temp_table: 临时表名
+
+    Returns:
+        tuple: (SQL条件字符串, 绑定参数字典)，可配合sqlalchemy.text使用
+    """
+    spans = get_date_spans(dates)
+    if len(spans) == 0:
+        return '1 = 0', {}
+
+    if len(spans) > max_spans and con is not None:
+        # 临时表统一按半开区间存储
+        create_date_span_table(con, [(st, ed + 1) for st, ed in spans], table_name=temp_table)
+        sql = (
+            f'EXISTS (SELECT 1 FROM `{temp_table}` AS `hf_spans` '
+            f'WHERE {col} >= `hf_spans`.`hf_span_st` AND {col} < `hf_spans`.`hf_span_ed`)'
+        )
+        return sql, {}
+
+    clauses = []
+    params = {}
+    for i, (st, ed) in enumerate(spans):
+        st_name = f'{param_prefix}_{i}_st'
+        ed_name = f'{param_prefix}_{i}_ed'
+        if half_open:
+            clauses.append(f'({col} >= :{st_name} AND {col} < :{ed_name})')
+            params[ed_name] = pd.Timestamp(ed + 1).to_pydatetime()
+        else:
+            clauses.append(f'({col} BETWEEN :{st_name} AND :{ed_name})')
+            params[ed_name] = pd.Timestamp(ed).to_pydatetime()
+        params[st_name] = pd.Timestamp(st).to_pydatetime()
+
+    sql = '(%s)' % ' OR '.join(clauses)
+    return sql, params
@@ -0,0 +1,771 @@
+"""
+区间索引辅助函数模块
+
+该模块提供基于排序端点的区间结构和区间集合运算，全部基于NumPy数组向量化实现。
+主要功能包括：
+1. 查询与窗口 [a, b) 有重叠的区间
+2. 计算区间与窗口 [a, b) 的重叠总长度
+3. 批量查询与追加区间
+4. 区间集合的合并、交集、差集和覆盖长度（支持分组）
+"""
+
+import numpy as np
+import pandas as pd
+
+
+def _to_numeric(values, unit=None, origin=0):
+    """
+    将端点转换为数值数组
+
+    datetime64端点按给定单位转换为int64后减去原点，比较和长度计算都是精确的整数运算；
+    其他端点转换为float64。
+
+    Args:
+        values: 端点数组，可以是数值或datetime64
+        unit: datetime64单位，为None时从values推断
+        origin: 原点，datetime64端点减去该整数值
+
+    Returns:
+        tuple: (int64或float64数组, datetime64单位)，非日期时单位为None
+    """
+    values = np.asarray(values)
+    if values.dtype.kind == 'M' or unit is not None:
+        if unit is None:
+            unit = np.datetime_data(values.dtype)[0]
+        values = values.astype('datetime64[%s]' % unit)
+        if np.isnat(values).any():
+            raise ValueError('interval endpoints contain NaT')
+        return values.astype('int64') - np.int64(origin), unit
+    values = values.astype(np.float64)
+    if np.isnan(values).any():
+        raise ValueError('interval endpoints contain NaN')
+    return values, None
+
+
+def _expand_ranges(starts, lengths):
+    """
+    将多段连续下标 [starts[k], starts[k] + lengths[k]) 展开为一维数组
+
+    Args:
+        starts: 各段开始下标
+        lengths: 各段长度，负数按0处理
+
+    Returns:
+        tuple: (各元素所属段编号, 元素下标)
+    """
+    lengths = np.maximum(np.asarray(lengths, dtype=np.int64), 0)
+    owner = np.repeat(np.arange(len(lengths), dtype=np.int64), lengths)
+    ends = np.cumsum(lengths)
+    pos = np.arange(ends[-1] if len(ends) > 0 else 0, dtype=np.int64) - np.repeat(ends - lengths, lengths)
+    return owner, pos + np.repeat(np.asarray(starts, dtype=np.int64), lengths)
+
+
+class SortedIntervalIndex:
+    """
+    排序区间索引
+
+    对一批半开区间 [start, end) 建立两类结构：
+    - 按开始、结束端点排序的数组及其前缀和，用于O(log n)计算窗口内的区间数和重叠总长度；
+    - 中心区间树（centered interval tree），用于O(log n + k)列出与窗口重叠的区间。
+    追加的区间先放入缓冲区，查询时与索引结果合并，缓冲区过大时重建索引。
+    """
+
+    # 缓冲区超过已建索引区间数的该比例时重建
+    rebuild_ratio = 0.125
+
+    def __init__(self, sts, exps):
+        """
+        初始化区间索引
+
+        Args:
+            sts: 区间开始值数组，数值或datetime64
+            exps: 区间结束值数组，与开始值类型一致
+        """
+        sts = np.asarray(sts)
+        self.unit = np.datetime_data(sts.dtype)[0] if sts.dtype.kind == 'M' else None
+        self.origin = 0
+        if self.unit is not None and len(sts) > 0:
+            self.origin = int(sts.astype('datetime64[%s]' % self.unit).astype('int64').min())
+        sts, _ = _to_numeric(sts, self.unit, self.origin)
+        exps, _ = _to_numeric(exps, self.unit, self.origin)
+        if len(sts) != len(exps):
+            raise ValueError(f'sts length {len(sts)} is not equal to exps length {len(exps)}')
+
+        self.sts = sts
+        # 结束早于开始的区间按空区间处理
+        self.exps = np.maximum(exps, sts)
+        self._pending = 0
+        self._build()
+
+    def __len__(self):
+        return len(self.sts)
+
+    def __repr__(self):
+        return 'SortedIntervalIndex(%d intervals)' % len(self.sts)
+
+    def _build(self):
+        """
+        重建排序端点数组和中心区间树
+        """
+        n = len(self.sts)
+        self._n_built = n
+        self._pending = 0
+
+        # 排序端点和前缀和
+        self._sorted_sts = np.sort(self.sts)
+        self._sorted_exps = np.sort(self.exps)
+        if self.unit is None:
+            # 浮点端点先减去基准值，减小前缀和的舍入误差
+            self._base = self._sorted_sts[0] if n > 0 else 0.0
+            self._cum_sts = np.concatenate([[0], np.cumsum(self._sorted_sts - self._base)])
+            self._cum_exps = np.concatenate([[0], np.cumsum(self._sorted_exps - self._base)])
+        else:
+            # 整数前缀和按2^64取模回绕，只要最终结果在int64范围内就是精确值；
+            # 另存一份浮点前缀和，用于判断结果是否超出范围
+            self._base = np.int64(0)
+            with np.errstate(over='ignore'):
+                self._cum_sts = np.concatenate([[0], np.cumsum(self._sorted_sts)]).astype(np.int64)
+                self._cum_exps = np.concatenate([[0], np.cumsum(self._sorted_exps)]).astype(np.int64)
+            self._cum_sts_float = np.concatenate([[0], np.cumsum(self._sorted_sts.astype(np.float64))])
+            self._cum_exps_float = np.concatenate([[0], np.cumsum(self._sorted_exps.astype(np.float64))])
+
+        # 中心区间树：每个节点保存包含中心点的区间（start <= center < end），
+        # 分别按开始升序和结束降序存放在 _by_st、_by_ed 的同一段内
+        centers, lefts, rights, offsets, sizes = [], [], [], [], []
+        by_st_parts, by_ed_parts = [], []
+        offset = 0
+
+        ids = np.flatnonzero(self.exps > self.sts)
+        stack = [(ids, -1, 0)] if len(ids) > 0 else []
+        while stack:
+            node_ids, parent, side = stack.pop()
+            node = len(centers)
+            if parent >= 0:
+                (lefts if side < 0 else rights)[parent] = node
+
+            points = np.concatenate([self.sts[node_ids], self.exps[node_ids]])
+            if self.unit is None:
+                center = np.median(points)
+            else:
+                # 整数端点取下中位数，保证每个节点至少分出一个区间
+                k = len(points) // 2 - 1
+                center = np.partition(points, k)[k]
+            st = self.sts[node_ids]
+            ed = self.exps[node_ids]
+            here = (st <= center) & (ed > center)
+            here_ids = node_ids[here]
+
+            centers.append(center)
+            lefts.append(-1)
+            rights.append(-1)
+            offsets.append(offset)
+            sizes.append(len(here_ids))
+            by_st_parts.append(here_ids[np.argsort(self.sts[here_ids], kind='stable')])
+            by_ed_parts.append(here_ids[np.argsort(-self.exps[here_ids], kind='stable')])
+            offset += len(here_ids)
+
+            left_ids = node_ids[ed <= center]
+            right_ids = node_ids[st > center]
+            if len(left_ids) > 0:
+                stack.append((left_ids, node, -1))
+            if len(right_ids) > 0:
+                stack.append((right_ids, node, 1))
+
+        self._centers = np.array(centers, dtype=np.float64 if self.unit is None else np.int64)
+        self._lefts = np.array(lefts, dtype=np.int64)
+        self._rights = np.array(rights, dtype=np.int64)
+        self._offsets = np.array(offsets, dtype=np.int64)
+        self._sizes = np.array(sizes, dtype=np.int64)
+        self._by_st = np.concatenate(by_st_parts) if by_st_parts else np.zeros(0, dtype=np.int64)
+        self._by_ed = np.concatenate(by_ed_parts) if by_ed_parts else np.zeros(0, dtype=np.int64)
+        self._by_st_values = self.sts[self._by_st]
+        self._by_ed_values = self.exps[self._by_ed]
+
+        # 按开始值排序的区间编号，用于列出开始值落在窗口内的区间
+        self._order_st = np.argsort(self.sts, kind='stable')
+        nonempty = self.exps[self._order_st] > self.sts[self._order_st]
+        self._order_st_nonempty = self._order_st[nonempty]
+        self._sorted_sts_nonempty = self.sts[self._order_st_nonempty]
+
+        # 批量点查询用的复合键：节点编号 * (m + 1) + 端点在全部端点中的排名，
+        # 每个节点内的端点有序，因此全局一次二分查找即可得到所有查询在各自节点内的位置
+        self._points = np.sort(np.concatenate([self.sts, self.exps]))
+        self._key_width = len(self._points) + 1
+        node_of = np.repeat(np.arange(len(self._sizes), dtype=np.int64), self._sizes)
+        self._st_keys = node_of * self._key_width + np.searchsorted(
+            self._points, self._by_st_values, side='left'
+        )
+        self._ed_keys = node_of * self._key_width + np.searchsorted(
+            -self._points[::-1], -self._by_ed_values, side='left'
+        )
+        # 空区间的位置，计数时扣除
+        self._empty_sts = np.sort(self.sts[self.exps <= self.sts])
+
+    def append(self, sts, exps):
+        """
+        追加区间，新区间编号接在已有区间之后
+
+        Args:
+            sts: 区间开始值数组
+            exps: 区间结束值数组
+        """
+        sts, _ = _to_numeric(sts, self.unit, self.origin)
+        exps, _ = _to_numeric(exps, self.unit, self.origin)
+        if len(sts) != len(exps):
+            raise ValueError(f'sts length {len(sts)} is not equal to exps length {len(exps)}')
+        self.sts = np.concatenate([self.sts, sts])
+        self.exps = np.concatenate([self.exps, np.maximum(exps, sts)])
+        self._pending += len(sts)
+        if self._pending > max(64, self.rebuild_ratio * self._n_built):
+            self._build()
+
+    def _to_query(self, values):
+        return _to_numeric(values, self.unit, self.origin)[0]
+
+    def _cover(self, x, exact=True):
+        """
+        计算所有已建索引区间在 (-inf, x) 上的覆盖长度之和
+
+        exact为False时用datetime区间的浮点前缀和计算近似值，用于判断精确结果是否溢出
+        """
+        n_st = np.searchsorted(self._sorted_sts, x, side='left')
+        n_ed = np.searchsorted(self._sorted_exps, x, side='left')
+        if exact:
+            cum_sts, cum_exps, x = self._cum_sts, self._cum_exps, x - self._base
+        else:
+            cum_sts, cum_exps, x = self._cum_sts_float, self._cum_exps_float, np.asarray(x, dtype=np.float64)
+        with np.errstate(over='ignore'):
+            return (n_st * x - cum_sts[n_st]) - (n_ed * x - cum_exps[n_ed])
+
+    def _pending_overlap(self, a, b, dtype):
+        """
+        计算缓冲区中的区间与窗口 [a, b) 的重叠总长度
+        """
+        n = self._n_built
+        pend_st = self.sts[n:].astype(dtype)
+        pend_ed = self.exps[n:].astype(dtype)
+        a = np.atleast_1d(a).astype(dtype)
+        b = np.atleast_1d(b).astype(dtype)
+        with np.errstate(over='ignore'):
+            return np.maximum(
+                np.minimum(pend_ed[None, :], b[:, None]) - np.maximum(pend_st[None, :], a[:, None]),
+                0
+            ).sum(axis=1)
+
+    def _stab(self, x):
+        """
+        中心区间树的点查询：返回满足 start < x < end 的已建索引区间编号
+        """
+        res = []
+        node = 0 if len(self._centers) > 0 else -1
+        while node >= 0:
+            c = self._centers[node]
+            o = self._offsets[node]
+            k = self._sizes[node]
+            if x <= c:
+                # 节点区间的结束都大于中心点，只需开始小于x
+                n = np.searchsorted(self._by_st_values[o: o + k], x, side='left')
+                res.append(self._by_st[o: o + n])
+                node = self._lefts[node] if x < c else -1
+            else:
+                # 节点区间的开始都不大于中心点，只需结束大于x
+                n = np.searchsorted(-self._by_ed_values[o: o + k], -x, side='left')
+                res.append(self._by_ed[o: o + n])
+                node = self._rights[node]
+        return np.concatenate(res) if res else np.zeros(0, dtype=np.int64)
+
+    def overlap(self, a, b):
+        """
+        查询与窗口 [a, b) 有重叠（start < b 且 end > a）的非空区间
+
+        Args:
+            a: 窗口开始值
+            b: 窗口结束值
+
+        Returns:
+            numpy.ndarray: 升序排列的区间编号
+        """
+        a, b = self._to_query([a, b])
+        if b <= a:
+            return np.zeros(0, dtype=np.int64)
+
+        n = self._n_built
+        # 开始值落在 [a, b) 内的区间是按开始值排序后的一段
+        i = np.searchsorted(self._sorted_sts, a, side='left')
+        j = np.searchsorted(self._sorted_sts, b, side='left')
+        starts_in = self._order_st[i:j]
+        starts_in = starts_in[self.exps[starts_in] > self.sts[starts_in]]
+
+        # 开始值早于a且跨过a的区间
+        res = [starts_in, self._stab(a)]
+
+        if self._pending > 0:
+            pend_st = self.sts[n:]
+            pend_ed = self.exps[n:]
+            hit = (pend_st < b) & (pend_ed > a) & (pend_ed > pend_st)
+            res.append(np.flatnonzero(hit) + n)
+
+        return np.sort(np.concatenate(res))
+
+    def _stab_batch(self, x):
+        """
+        中心区间树的批量点查询，逐层对所有查询向量化下降
+
+        Args:
+            x: 查询点数组
+
+        Returns:
+            tuple: (查询编号, 区间编号)
+        """
+        queries, ids = [], []
+        if len(self._centers) == 0 or len(x) == 0:
+            return np.zeros(0, dtype=np.int64), np.zeros(0, dtype=np.int64)
+
+        width = self._key_width
+        rank_st = np.searchsorted(self._points, x, side='left')
+        rank_ed = np.searchsorted(-self._points[::-1], -x, side='left')
+        q = np.arange(len(x), dtype=np.int64)
+        node = np.zeros(len(x), dtype=np.int64)
+        while len(q) > 0:
+            c = self._centers[node]
+            o = self._offsets[node]
+            xq = x[q]
+            go_left = xq <= c
+
+            # 节点区间的结束都大于中心点，只需开始小于x
+            n_st = np.searchsorted(self._st_keys, node * width + rank_st[q], side='left') - o
+            # 节点区间的开始都不大于中心点，只需结束大于x
+            n_ed = np.searchsorted(self._ed_keys, node * width + rank_ed[q], side='left') - o
+
+            lengths = np.where(go_left, n_st, n_ed)
+            owner, pos = _expand_ranges(o, lengths)
+            source = np.where(go_left[owner], self._by_st[pos], self._by_ed[pos])
+            queries.append(q[owner])
+            ids.append(source)
+
+            node = np.where(go_left, np.where(xq < c, self._lefts[node], -1), self._rights[node])
+            keep = node >= 0
+            q = q[keep]
+            node = node[keep]
+
+        return np.concatenate(queries), np.concatenate(ids)
+
+    def overlap_batch(self, a, b):
+        """
+        批量查询与多个窗口有重叠的区间
+
+        开始值落在窗口内的区间由排序开始值数组上的二分查找得到，跨过窗口开始的区间由
+        中心区间树逐层批量下降得到，全程没有逐窗口的Python循环。
+
+        Args:
+            a: 窗口开始值数组
+            b: 窗口结束值数组
+
+        Returns:
+            tuple: (offsets, ids)，第q个窗口的结果为 ids[offsets[q]: offsets[q + 1]]，各段内升序
+        """
+        a = np.atleast_1d(self._to_query(a))
+        b = np.atleast_1d(self._to_query(b))
+        valid = b > a
+        q_all = np.flatnonzero(valid)
+        a_valid = a[q_all]
+        b_valid = b[q_all]
+
+        # 开始值落在 [a, b) 内的非空区间
+        i = np.searchsorted(self._sorted_sts_nonempty, a_valid, side='left')
+        j = np.searchsorted(self._sorted_sts_nonempty, b_valid, side='left')
+        owner, pos = _expand_ranges(i, j - i)
+        queries = [q_all[owner]]
+        ids = [self._order_st_nonempty[pos]]
+
+        # 开始值早于a且跨过a的区间
+        stab_q, stab_ids = self._stab_batch(a_valid)
+        queries.append(q_all[stab_q])
+        ids.append(stab_ids)
+
+        n = self._n_built
+        if self._pending > 0:
+            pend_st = self.sts[n:]
+            pend_ed = self.exps[n:]
+            hit = (
+                (pend_st[None, :] < b_valid[:, None])
+                & (pend_ed[None, :] > a_valid[:, None])
+                & (pend_ed > pend_st)[None, :]
+            )
+            pend_q, pend_ids = np.nonzero(hit)
+            queries.append(q_all[pend_q])
+            ids.append(pend_ids + n)
+
+        queries = np.concatenate(queries)
+        ids = np.concatenate(ids).astype(np.int64)
+        # 按(窗口, 区间编号)排序，合成一个整数键只需一次排序
+        n_total = max(len(self.sts), 1)
+        ids = np.sort(queries * n_total + ids) % n_total
+        offsets = np.concatenate([[0], np.cumsum(np.bincount(queries, minlength=len(a)))]).astype(np.int64)
+        return offsets, ids
+
+    def count(self, a, b):
+        """
+        计算与窗口 [a, b) 有重叠的区间数，支持批量窗口
+
+        Args:
+            a: 窗口开始值或数组
+            b: 窗口结束值或数组
+
+        Returns:
+            numpy.ndarray: 区间数
+        """
+        a = self._to_query(a)
+        b = self._to_query(b)
+        # 有重叠 = 开始 < b 的区间 - 结束 <= a 的区间（非空窗口时后者是前者的子集）
+        # 空区间在开始、结束数组中各计一次，按同样方式扣除
+        n = self._n_built
+        empty = self._empty_sts
+        res = (
+            np.searchsorted(self._sorted_sts, b, side='left')
+            - np.searchsorted(self._sorted_exps, a, side='right')
+            - (np.searchsorted(empty, b, side='left') - np.searchsorted(empty, a, side='right'))
+        )
+
+        if self._pending > 0:
+            pend_st = self.sts[n:]
+            pend_ed = self.exps[n:]
+            hit = (
+                (pend_st[None, :] < np.atleast_1d(b)[:, None])
+                & (pend_ed[None, :] > np.atleast_1d(a)[:, None])
+                & (pend_ed > pend_st)[None, :]
+            )
+            res = res + hit.sum(axis=1).reshape(np.shape(res))
+
+        return np.where(b > a, res, 0)
+
+    def total_overlap(self, a, b, unit=None):
+        """
+        计算全部区间与窗口 [a, b) 的重叠总长度，支持批量窗口
+
+        重叠总长度等于覆盖函数在b与a处的差，每个窗口只需两次二分查找。
+        纳秒精度的timedelta64只能表示约292年，大量长期区间的总长度会超出范围，
+        此时应指定unit得到浮点结果。
+
+        Args:
+            a: 窗口开始值或数组
+            b: 窗口结束值或数组
+            unit: datetime区间的结果单位，例如'D'、'h'、's'，指定时返回该单位的float64；
+                为None时返回timedelta64
+
+        Returns:
+            numpy.ndarray: 重叠总长度
+
+        Raises:
+            ValueError: 数值区间指定了unit时抛出
+            OverflowError: 未指定unit且结果超出timedelta64范围时抛出
+        """
+        if unit is not None and self.unit is None:
+            raise ValueError('unit is only supported for datetime intervals')
+
+        a = self._to_query(a)
+        b = self._to_query(b)
+        with np.errstate(over='ignore'):
+            res = self._cover(b) - self._cover(a)
+            if self._pending > 0:
+                res = res + self._pending_overlap(a, b, self.sts.dtype).reshape(np.shape(res))
+        res = np.where(b > a, res, 0)
+        if self.unit is None:
+            return res
+
+        # 整数结果按2^64取模，用浮点近似值判断是否在int64范围内
+        approx = self._cover(b, exact=False) - self._cover(a, exact=False)
+        if self._pending > 0:
+            approx = approx + self._pending_overlap(a, b, np.float64).reshape(np.shape(approx))
+        approx = np.where(b > a, approx, 0)
+        fits = np.abs(approx) < 2.0 ** 62
+
+        if unit is not None:
+            return np.where(fits, res, approx) * (np.timedelta64(1, self.unit) / np.timedelta64(1, unit))
+
+        if not fits.all():
+            print('total overlap exceeds timedelta64[%s] range, max %.6g' % (self.unit, np.abs(approx).max()))
+            raise OverflowError('total overlap out of timedelta64[%s] range, pass unit= to get a float' % self.unit)
+        return res.astype('int64').astype('timedelta64[%s]' % self.unit)
+
+
+def _to_bounds(values, open_value):
+    """
+    将区间端点转换为可排序的数组，NaN/None/NaT视为开放端点
+
+    Args:
+        values: 端点数组，数值、datetime64或包含None的对象数组
+        open_value: 开放端点的取值方向，-1表示负无穷，1表示正无穷
+
+    Returns:
+        tuple: (端点数组, 是否为datetime)
+    """
+    values = pd.Series(np.asarray(values)).infer_objects()
+    if values.dtype.kind == 'O':
+        values = pd.to_numeric(values)
+    if values.dtype.kind == 'M' or isinstance(values.dtype, pd.DatetimeTZDtype):
+        values = values.to_numpy(dtype='datetime64[ns]', copy=True)
+        na = np.isnat(values)
+        values = values.astype('int64')
+        bound = np.iinfo(np.int64)
+        values[na] = bound.min + 1 if open_value < 0 else bound.max
+        return values, True
+    values = values.to_numpy(dtype=np.float64, copy=True)
+    values[np.isnan(values)] = -np.inf if open_value < 0 else np.inf
+    return values, False
+
+
+def _from_bounds(values, is_date):
+    """
+    将内部端点还原为输出格式，开放端点还原为NaN或NaT
+    """
+    if is_date:
+        bound = np.iinfo(np.int64)
+        res = values.astype('datetime64[ns]')
+        res[(values <= bound.min + 1) | (values == bound.max)] = np.datetime64('NaT')
+        return res
+    res = values.astype(np.float64)
+    res[np.isinf(res)] = np.nan
+    return res
+
+
+def _prepare_sets(*sets):
+    """
+    统一多个区间集合的端点和分组编码
+
+    Args:
+        *sets: 若干(sts, exps, groups)元组，groups可以为None
+
+    Returns:
+        tuple: (各集合的(开始, 结束, 分组编码)列表, 分组唯一值或None, 是否为datetime)
+    """
+    converted = []
+    is_dates = set()
+    for sts, exps, groups in sets:
+        sts, is_date_st = _to_bounds(sts, -1)
+        exps, is_date_ed = _to_bounds(exps, 1)
+        if len(sts) != len(exps):
+            raise ValueError(f'sts length {len(sts)} is not equal to exps length {len(exps)}')
+        is_dates.update([is_date_st, is_date_ed])
+        converted.append((sts, exps, groups))
+
+    if len(is_dates) > 1:
+        raise TypeError('interval endpoints mix datetime and numeric values')
+    is_date = is_dates.pop() if is_dates else False
+
+    with_groups = [groups is not None for _, _, groups in converted]
+    if any(with_groups) and not all(with_groups):
+        raise ValueError('groups must be given for every interval set or for none')
+
+    if not any(with_groups):
+        res = [(sts, exps, np.zeros(len(sts), dtype=np.int64)) for sts, exps, _ in converted]
+        return res, None, is_date
+
+    codes, uniques = pd.factorize(np.concatenate([np.asarray(groups) for _, _, groups in converted]))
+    res = []
+    pos = 0
+    for sts, exps, _ in converted:
+        res.append((sts, exps, codes[pos: pos + len(sts)].astype(np.int64)))
+        pos += len(sts)
+    return res, uniques, is_date
+
+
+def _merge_sorted(sts, exps, codes):
+    """
+    合并区间集合，返回按(分组, 开始)排序且互不重叠的区间
+
+    相邻（首尾相接）的区间也会合并。组内结束值的累计最大值通过把
+    (分组编码, 结束值排名)组合成整数键后做一次maximum.accumulate得到。
+    """
+    valid = exps > sts
+    sts, exps, codes = sts[valid], exps[valid], codes[valid]
+    n = len(sts)
+    if n == 0:
+        return sts, exps, codes
+
+    order = np.lexsort((sts, codes))
+    sts, exps, codes = sts[order], exps[order], codes[order]
+
+    uniques, ranks = np.unique(exps, return_inverse=True)
+    width = len(uniques)
+    run_max = np.maximum.accumulate(codes * width + ranks.reshape(-1)) - codes * width
+    run_max = uniques[run_max]
+
+    new = np.ones(n, dtype=bool)
+    new[1:] = (codes[1:] != codes[:-1]) | (sts[1:] > run_max[:-1])
+    first = np.flatnonzero(new)
+    last = np.r_[first[1:] - 1, n - 1]
+    return sts[first], run_max[last], codes[first]
+
+
+def _intersect_merged(a_sts, a_exps, a_codes, b_sts, b_exps, b_codes):
+    """
+    计算两个已合并区间集合的交集
+
+    对A中每个区间，B中与之重叠的区间在(分组, 端点)排序下是连续的一段，
+    用searchsorted确定范围后一次性展开所有区间对。
+    """
+    if len(a_sts) == 0 or len(b_sts) == 0:
+        empty = a_sts[:0]
+        return empty, empty, a_codes[:0]
+
+    # 端点统一编为排名，再与分组编码组合成可全局二分查找的整数键
+    values, ranks = np.unique(np.concatenate([a_sts, a_exps, b_sts, b_exps]), return_inverse=True)
+    ranks = ranks.reshape(-1)
+    width = len(values)
+    na, nb = len(a_sts), len(b_sts)
+    a_st_key = a_codes * width + ranks[:na]
+    a_ed_key = a_codes * width + ranks[na: 2 * na]
+    b_st_key = b_codes * width + ranks[2 * na: 2 * na + nb]
+    b_ed_key = b_codes * width + ranks[2 * na + nb:]
+
+    # B中结束值大于A开始值、且开始值小于A结束值的区间
+    j0 = np.searchsorted(b_ed_key, a_st_key, side='right')
+    j1 = np.searchsorted(b_st_key, a_ed_key, side='left')
+    counts = np.maximum(j1 - j0, 0)
+
+    a_idx = np.repeat(np.arange(na), counts)
+    offsets = np.cumsum(counts) - counts
+    b_idx = np.arange(counts.sum()) - np.repeat(offsets, counts) + np.repeat(j0, counts)
+
+    sts = np.maximum(a_sts[a_idx], b_sts[b_idx])
+    exps = np.minimum(a_exps[a_idx], b_exps[b_idx])
+    valid = exps > sts
+    return sts[valid], exps[valid], a_codes[a_idx][valid]
+
+
+def _complement_merged(sts, exps, codes, all_codes, is_date):
+    """
+    计算已合并区间集合在各分组内的补集
+    """
+    if is_date:
+        bound = np.iinfo(np.int64)
+        lower, upper = np.int64(bound.min + 1), np.int64(bound.max)
+    else:
+        lower, upper = -np.inf, np.inf
+
+    n = len(sts)
+    first = np.ones(n, dtype=bool)
+    first[1:] = codes[1:] != codes[:-1]
+    last = np.ones(n, dtype=bool)
+    last[:-1] = codes[1:] != codes[:-1]
+
+    # 每个区间之后的空隙：(结束值, 组内下一区间开始值或正无穷)
+    next_sts = np.empty_like(sts)
+    next_sts[:-1] = sts[1:]
+    next_sts[last] = upper
+    # 每组第一个区间之前的空隙：(负无穷, 开始值)
+    missing = np.setdiff1d(all_codes, codes)
+
+    res_sts = np.concatenate([np.full(first.sum(), lower, dtype=sts.dtype), exps,
+                              np.full(len(missing), lower, dtype=sts.dtype)])
+    res_exps = np.concatenate([sts[first], next_sts, np.full(len(missing), upper, dtype=sts.dtype)])
+    res_codes = np.concatenate([codes[first], codes, missing])
+
+    valid = res_exps > res_sts
+    res_sts, res_exps, res_codes = res_sts[valid], res_exps[valid], res_codes[valid]
+    order = np.lexsort((res_sts, res_codes))
+    return res_sts[order], res_exps[order], res_codes[order]
+
+
+def _format_result(sts, exps, codes, uniques, is_date):
+    sts = _from_bounds(sts, is_date)
+    exps = _from_bounds(exps, is_date)
+    if uniques is None:
+        return sts, exps
+    return np.asarray(uniques)[codes], sts, exps
+
+
+def interval_merge(sts, exps, groups=None):
+    """
+    合并重叠或首尾相接的区间
+
+    区间按半开区间 [start, end) 处理，NaN/None/NaT表示该端开放（与crop一致），
+    结束值不大于开始值的空区间会被丢弃。
+
+    Args:
+        sts: 开始值数组
+        exps: 结束值数组
+        groups: 分组键数组，为None时不分组
+
+    Returns:
+        tuple: 不分组时为(开始值数组, 结束值数组)，分组时为(分组数组, 开始值数组, 结束值数组)，
+            按(分组, 开始值)排序
+    """
+    ((sts, exps, codes),), uniques, is_date = _prepare_sets((sts, exps, groups))
+    return _format_result(*_merge_sorted(sts, exps, codes), uniques, is_date)
+
+
+def interval_intersect(a_sts, a_exps, b_sts, b_exps, a_groups=None, b_groups=None):
+    """
+    计算两个区间集合的交集，分组时只在相同分组内求交
+
+    Args:
+        a_sts: 集合A的开始值数组
+        a_exps: 集合A的结束值数组
+        b_sts: 集合B的开始值数组
+        b_exps: 集合B的结束值数组
+        a_groups: 集合A的分组键数组
+        b_groups: 集合B的分组键数组
+
+    Returns:
+        tuple: 同interval_merge
+    """
+    (a, b), uniques, is_date = _prepare_sets((a_sts, a_exps, a_groups), (b_sts, b_exps, b_groups))
+    res = _intersect_merged(*_merge_sorted(*a), *_merge_sorted(*b))
+    return _format_result(*res, uniques, is_date)
+
+
+def interval_subtract(a_sts, a_exps, b_sts, b_exps, a_groups=None, b_groups=None):
+    """
+    计算区间集合A减去区间集合B，分组时只减去相同分组内的区间
+
+    Args:
+        a_sts: 集合A的开始值数组
+        a_exps: 集合A的结束值数组
+        b_sts: 集合B的开始值数组
+        b_exps: 集合B的结束值数组
+        a_groups: 集合A的分组键数组
+        b_groups: 集合B的分组键数组
+
+    Returns:
+        tuple: 同interval_merge
+    """
+    (a, b), uniques, is_date = _prepare_sets((a_sts, a_exps, a_groups), (b_sts, b_exps, b_groups))
+    a = _merge_sorted(*a)
+    b = _complement_merged(*_merge_sorted(*b), np.unique(a[2]), is_date)
+    res = _intersect_merged(*a, *b)
+    return _format_result(*res, uniques, is_date)
+
+
+def interval_coverage(sts, exps, groups=None):
+    """
+    计算区间集合的覆盖长度（重叠部分只计一次）
+
+    Args:
+        sts: 开始值数组
+        exps: 结束值数组
+        groups: 分组键数组，为None时不分组
+
+    Returns:
+        float或pandas.Series: 覆盖长度，分组时为以分组键为索引的Series；
+            含开放端点的覆盖长度为inf（datetime为NaT），datetime区间返回timedelta64
+    """
+    ((sts, exps, codes),), uniques, is_date = _prepare_sets((sts, exps, groups))
+    n_groups = 1 if uniques is None else len(uniques)
+    m_sts, m_exps, m_codes = _merge_sorted(sts, exps, codes)
+
+    if is_date:
+        bound = np.iinfo(np.int64)
+        unbounded = (m_sts <= bound.min + 1) | (m_exps == bound.max)
+        lengths = np.where(unbounded, 0, m_exps - m_sts)
+        res = np.bincount(m_codes, weights=lengths, minlength=n_groups)
+        res = np.round(res).astype('int64').astype('timedelta64[ns]')
+        res[np.bincount(m_codes, weights=unbounded, minlength=n_groups) > 0] = np.timedelta64('NaT')
+    else:
+        res = np.zeros(n_groups, dtype=np.float64)
+        np.add.at(res, m_codes, m_exps - m_sts)
+
+    if uniques is None:
+        return res[0]
+    return pd.Series(res, index=uniques)
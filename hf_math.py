@@ -17,6 +17,7 @@ import pandas as pd
 import itertools
 from copy import copy, deepcopy
 from functools import reduce
+from concurrent.futures import ThreadPoolExecutor
 
 import sys
 import os
@@ -30,8 +31,7 @@ if parent_dir not in sys.path:
     sys.path.append(parent_dir)
 
 # 导入自定义模块
-from helper_function.hf_func import profile_line_by_line
-from helper_function.hf_array import merge_timeseries
+from helper_function.hf_array import align_timeseries, group_ffill_index, apply_partitioned
 
 def grid_pos(n, width):
     """
@@ -154,7 +154,7 @@ def dir_crop(st1, ed1, st2, ed2):
             return min([st1, st2]), max([ed1, ed2])
 
 
-def array_crop(sts, exps, st, exp):
+def array_crop(sts, exps, st, exp, n_jobs=1):
     """
     计算数组中的区间与指定区间的交集长度
     
@@ -163,9 +163,23 @@ def array_crop(sts, exps, st, exp):
         exps: 结束值数组
         st: 指定区间的开始值
         exp: 指定区间的结束值
+        n_jobs: 线程数，大于1时按区间方向分块并行计算，-1表示使用全部CPU核心
     Returns:
         numpy.ndarray: 每个区间与指定区间的交集长度
     """
+    n_jobs = get_n_jobs(n_jobs)
+    if n_jobs > 1 and np.ndim(sts) == 1 and len(sts) >= 2 * n_jobs:
+        sts = np.asarray(sts)
+        exps = np.asarray(exps)
+        # 用首个元素确定结果类型，各线程把结果写入同一个预分配数组
+        res = np.empty(len(sts), dtype=array_crop(sts[:1], exps[:1], st, exp).dtype)
+
+        def run(i, j):
+            res[i:j] = array_crop(sts[i:j], exps[i:j], st, exp)
+
+        run_row_blocks(run, len(sts), n_jobs)
+        return res
+
     # 使用向量化操作计算交集长度
     res = (exps > st) * (  # 确保结束值大于开始值
         (
@@ -187,7 +201,48 @@ def array_crop(sts, exps, st, exp):
     return res
 
 
-def nd_array_crop(sts, exps, sts_exps):
+# 分块计算时默认的工作内存上限（字节）
+crop_memory_budget = 64 * 2 ** 20
+
+
+def get_n_jobs(n_jobs):
+    """
+    解析线程数参数
+
+    Args:
+        n_jobs: 线程数，None或1表示单线程，-1表示使用全部CPU核心，-2表示保留一个核心，以此类推
+    Returns:
+        int: 实际线程数
+    """
+    if n_jobs is None:
+        return 1
+    if n_jobs < 0:
+        return max(1, (os.cpu_count() or 1) + 1 + n_jobs)
+    return max(1, int(n_jobs))
+
+
+def run_row_blocks(func, n, n_jobs):
+    """
+    把 [0, n) 按行均分为n_jobs块，在线程池中执行func(i, j)
+
+    NumPy的ufunc运算会释放GIL，各线程写入同一输出数组的不同行块即可并行。
+
+    Args:
+        func: 处理一个行块的函数，参数为(起始行, 结束行)
+        n: 总行数
+        n_jobs: 线程数
+    """
+    bounds = np.linspace(0, n, n_jobs + 1).astype(int)
+    with ThreadPoolExecutor(max_workers=n_jobs) as executor:
+        futures = [
+            executor.submit(func, i, j)
+            for i, j in zip(bounds[:-1], bounds[1:]) if j > i
+        ]
+        for future in futures:
+            future.result()
+
+
+def nd_array_crop(sts, exps, sts_exps, n_jobs=1):
     """
     计算多个区间与多个指定区间的交集长度（多维数组版本）
     
@@ -195,26 +250,151 @@ def nd_array_crop(sts, exps, sts_exps):
         sts: 开始值数组
         exps: 结束值数组
         sts_exps: 指定区间数组，形状为(n, 2)，每行为(start, end)
+        n_jobs: 线程数，大于1时按合约方向分块并行计算，-1表示使用全部CPU核心
     Returns:
         numpy.ndarray: 交集长度矩阵，形状为(len(sts), len(sts_exps))
     """
-    # 广播指定区间到所需形状
-    bc_sts_exps = np.broadcast_to(sts_exps, (len(sts), len(sts_exps), 2)).T
+    return nd_array_crop_into(sts, exps, sts_exps, n_jobs=n_jobs)
 
-    # 提取上下界
-    lower_bound = bc_sts_exps[0, :, :]  # 下界矩阵
-    upper_bound = bc_sts_exps[1, :, :]  # 上界矩阵
-    # 广播开始值和结束值数组
-    a_sts = np.broadcast_to(sts, (len(sts_exps), len(sts)))
-    a_exps = np.broadcast_to(exps, (len(sts_exps), len(exps)))
 
-    # 计算交集长度：min(上界, 结束值) - max(下界, 开始值)
-    res = np.maximum(
-        np.minimum(upper_bound, a_exps) -
-        np.maximum(lower_bound, a_sts),
-        np.zeros_like(lower_bound)  # 确保结果非负
-    ).T
+def iter_crop_blocks(sts, exps, sts_exps, memory_budget=None):
+    """
+    按内存上限分块计算区间交集长度
 
+    按合约（行）方向分块，每块的结果写入同一块复用的缓冲区，避免一次性广播出完整矩阵。
+
+    Args:
+        sts: 开始值数组
+        exps: 结束值数组
+        sts_exps: 指定区间数组，形状为(n, 2)
+        memory_budget: 工作内存上限（字节），默认为crop_memory_budget
+    Returns:
+        generator: 依次产出(起始行, 结束行, 交集长度块)，交集长度块在下次迭代时会被覆盖
+    """
+    sts = np.asarray(sts)
+    exps = np.asarray(exps)
+    sts_exps = np.asarray(sts_exps).reshape(-1, 2)
+    if memory_budget is None:
+        memory_budget = crop_memory_budget
+
+    dtype = np.result_type(sts, exps, sts_exps)
+    lower_bound = sts_exps[:, 0].astype(dtype)
+    upper_bound = sts_exps[:, 1].astype(dtype)
+
+    n, m = len(sts), len(sts_exps)
+    # 两块缓冲区：交集上界和交集下界
+    block_size = max(1, int(memory_budget // max(1, 2 * m * dtype.itemsize)))
+    block_size = min(block_size, max(n, 1))
+    buf_upper = np.empty((block_size, m), dtype=dtype)
+    buf_lower = np.empty((block_size, m), dtype=dtype)
+
+    for i in range(0, n, block_size):
+        j = min(i + block_size, n)
+        upper = buf_upper[:j - i]
+        lower = buf_lower[:j - i]
+        # 交集长度：max(min(上界, 结束值) - max(下界, 开始值), 0)
+        np.minimum(upper_bound, exps[i:j, None], out=upper)
+        np.maximum(lower_bound, sts[i:j, None], out=lower)
+        np.subtract(upper, lower, out=upper)
+        np.maximum(upper, 0, out=upper)
+        yield i, j, upper
+
+
+def nd_array_crop_into(sts, exps, sts_exps, out=None, dtype=None, scale=None, memory_budget=None, n_jobs=1):
+    """
+    分块计算交集长度矩阵并写入预分配的输出数组
+
+    Args:
+        sts: 开始值数组
+        exps: 结束值数组
+        sts_exps: 指定区间数组，形状为(n, 2)
+        out: 预分配的输出数组，形状为(len(sts), len(sts_exps))，为空时新建
+        dtype: 新建输出数组的类型，例如float32或int32，默认与输入一致
+        scale: 结果除以的单位长度，例如秒转换为天时为86400
+        memory_budget: 工作内存上限（字节），多线程时由各线程平分
+        n_jobs: 线程数，大于1时按合约方向分块，各线程写入同一个输出数组，-1表示使用全部CPU核心
+    Returns:
+        numpy.ndarray: 交集长度矩阵
+    """
+    sts = np.asarray(sts)
+    exps = np.asarray(exps)
+    sts_exps = np.asarray(sts_exps).reshape(-1, 2)
+    if out is None:
+        if dtype is None:
+            dtype = np.result_type(sts, exps, sts_exps)
+            if scale is not None:
+                dtype = np.result_type(dtype, np.float64)
+        out = np.empty((len(sts), len(sts_exps)), dtype=dtype)
+
+    n_jobs = min(get_n_jobs(n_jobs), max(len(sts), 1))
+    if memory_budget is None:
+        memory_budget = crop_memory_budget
+    memory_budget = memory_budget / n_jobs
+
+    def run(i0, j0):
+        for i, j, block in iter_crop_blocks(sts[i0:j0], exps[i0:j0], sts_exps, memory_budget=memory_budget):
+            if scale is not None:
+                np.divide(block, scale, out=out[i0 + i:i0 + j], casting='unsafe')
+            else:
+                out[i0 + i:i0 + j] = block
+
+    if n_jobs > 1:
+        run_row_blocks(run, len(sts), n_jobs)
+    else:
+        run(0, len(sts))
+
+    return out
+
+
+def nd_array_crop_reduce(sts, exps, sts_exps, by='range', groups=None, scale=None, memory_budget=None):
+    """
+    分块计算交集长度并直接汇总，不生成完整的交集长度矩阵
+
+    Args:
+        sts: 开始值数组
+        exps: 结束值数组
+        sts_exps: 指定区间数组，形状为(n, 2)
+        by: 汇总方式
+            - 'range': 按指定区间汇总，返回长度为len(sts_exps)的数组
+            - 'contract': 按区间（行）汇总，返回长度为len(sts)的数组
+            - 'group': 按groups分组汇总，返回以分组键为索引、指定区间序号为列的DataFrame
+        groups: 分组键数组，by为'group'时必填
+        scale: 结果除以的单位长度
+        memory_budget: 工作内存上限（字节）
+    Returns:
+        numpy.ndarray或pandas.DataFrame: 汇总结果
+    """
+    sts = np.asarray(sts)
+    exps = np.asarray(exps)
+    sts_exps = np.asarray(sts_exps).reshape(-1, 2)
+    m = len(sts_exps)
+
+    if by == 'range':
+        res = np.zeros(m, dtype=np.float64)
+        for i, j, block in iter_crop_blocks(sts, exps, sts_exps, memory_budget=memory_budget):
+            res += block.sum(axis=0)
+    elif by == 'contract':
+        res = np.zeros(len(sts), dtype=np.float64)
+        for i, j, block in iter_crop_blocks(sts, exps, sts_exps, memory_budget=memory_budget):
+            res[i:j] = block.sum(axis=1)
+    elif by == 'group':
+        if groups is None:
+            raise ValueError('groups is required when by is "group"')
+        codes, uniques = pd.factorize(np.asarray(groups), use_na_sentinel=False)
+        # 按分组排序后，每块内同组的行是连续的，可以用reduceat汇总
+        order = np.argsort(codes, kind='stable')
+        codes = codes[order]
+        res = np.zeros((len(uniques), m), dtype=np.float64)
+        for i, j, block in iter_crop_blocks(sts[order], exps[order], sts_exps, memory_budget=memory_budget):
+            block_codes = codes[i:j]
+            starts = np.flatnonzero(np.r_[True, block_codes[1:] != block_codes[:-1]])
+            res[block_codes[starts]] += np.add.reduceat(block, starts, axis=0)
+        res = pd.DataFrame(res, index=pd.Index(uniques))
+    else:
+        raise ValueError(f'unsupported by: {by}')
+
+    if scale is not None:
+        res = res / scale
     return res
 
 
@@ -235,42 +415,175 @@ def array_minus(a, v):
     return res
 
 
-@profile_line_by_line
+def _take_order(order, n, k):
+    """
+    将优先级顺序整理为(n, k)的列序号矩阵
+
+    Args:
+        order: None、长度为k的列序号数组（所有行共用）或形状为(n, k)的逐行列序号矩阵
+        n: 行数
+        k: 列数
+    Returns:
+        numpy.ndarray或None: 列序号矩阵，order为None时返回None
+    """
+    if order is None:
+        return None
+    order = np.asarray(order, dtype=np.intp)
+    if order.ndim == 1:
+        order = np.broadcast_to(order, (n, k))
+    if order.shape != (n, k):
+        raise ValueError(f'order shape {order.shape} does not match buckets shape {(n, k)}')
+    return order
+
+
+def nd_array_minus(a, v, order=None):
+    """
+    按行从矩阵的累积和中减去指定值（array_minus的二维批量版本）
+
+    每行的结果与array_minus(a[i], v[i])一致：按顺序扣减各桶，
+    不足或多余的部分记入第一个剩余非零的桶。
+
+    Args:
+        a: 桶余额矩阵，形状为(n, k)
+        v: 每行要减去的值，形状为(n,)或标量
+        order: 扣减顺序，None表示按列顺序，长度为k的数组表示所有行共用的列顺序，
+            形状为(n, k)的矩阵表示逐行的列顺序
+    Returns:
+        numpy.ndarray: 扣减后的余额矩阵，形状为(n, k)
+    """
+    a = np.asarray(a)
+    if a.ndim != 2:
+        raise ValueError(f'a must be 2-D, got {a.ndim}-D')
+    n, k = a.shape
+    v = np.broadcast_to(np.asarray(v), (n,))
+
+    order = _take_order(order, n, k)
+    if order is not None:
+        a = np.take_along_axis(a, order, axis=1)
+
+    ca = np.cumsum(a, axis=1)
+    hit = ca > v[:, None]
+    res = hit * a
+    rows = np.arange(n)
+    first = (res != 0).argmax(axis=1)
+    res[rows, first] += (~hit * a).sum(axis=1) - v
+
+    if order is not None:
+        out = np.empty_like(res)
+        np.put_along_axis(out, order, res, axis=1)
+        res = out
+    return res
+
+
+def nd_array_waterfall(a, amounts, order=None):
+    """
+    按行对桶余额依次执行多档扣减（例如先还款后核销）
+
+    Args:
+        a: 桶余额矩阵，形状为(n, k)
+        amounts: 各档扣减金额，形状为(n,)表示一档，形状为(n, t)表示t档依次扣减
+        order: 扣减顺序，格式同nd_array_minus，所有档共用；
+            也可以是长度为t的列表，逐档给出顺序（元素为None、一维或二维数组）
+    Returns:
+        tuple: (扣减后的余额矩阵(n, k), 各档分配到各桶的金额(t, n, k))
+    """
+    a = np.asarray(a)
+    amounts = np.asarray(amounts)
+    if amounts.ndim == 1:
+        amounts = amounts[:, None]
+    n_tranches = amounts.shape[1]
+
+    # 逐档顺序：列表中的元素为None或数组；元素为整数的列表视为共用顺序
+    if isinstance(order, (list, tuple)) and any(item is None or np.ndim(item) > 0 for item in order):
+        if len(order) != n_tranches:
+            raise ValueError(f'got {len(order)} orders for {n_tranches} tranches')
+        orders = list(order)
+    else:
+        orders = [order] * n_tranches
+
+    res = a
+    allocations = []
+    for t in range(n_tranches):
+        remaining = nd_array_minus(res, amounts[:, t], order=orders[t])
+        allocations.append(res - remaining)
+        res = remaining
+
+    if allocations:
+        allocations = np.stack(allocations)
+    else:
+        allocations = np.zeros((0,) + a.shape, dtype=a.dtype)
+    return res, allocations
+
+
 def get_group_last_row_before_line(
         data: pd.DataFrame,
         index: str | list,
         line_col_name: str,
         line_values,
-        lines
+        lines,
+        sparse=False
 ):
     """
     获取分组数据中每个分组在指定线值之前的最后一行
-    
+
+    按(分组, 线值, 行号)排序一次后，把线值编码为排名并与分组编码组合成整数键，
+    每个(分组, 线值)只需一次searchsorted即可定位组内最后一个小于线值的行。
+
     Args:
         data: 输入数据框
-        index: 分组列名或列名列表
-        line_col_name: 用于比较的列名
-        line_values: 当前行的线值
+        index: 分组列名或列名列表，分组键为空的行不参与计算
+        line_col_name: 用于比较的列名，始终用data[line_col_name]与各线值比较
+        line_values: 兼容旧接口保留，不参与计算
         lines: 要检查的线值列表
+        sparse: 为True时返回标记位置的(行号数组, 线值序号数组)，否则返回稠密矩阵
     Returns:
-        numpy.ndarray: 布尔矩阵，标识每个分组在每个线值之前的最后一行
+        numpy.ndarray或tuple: 形状为(len(data), len(lines))的0/1矩阵，标识每个分组在每个线值之前的最后一行；
+            sparse为True时返回(行号数组, 线值序号数组)
     """
     # 确保index是列表格式
     if isinstance(index, str):
         index = [index]
-    # 按分组列和线值列排序
-    data_ = data.sort_values(index + [line_col_name]).reset_index()
-    lines_array = np.array(lines)
-    # 创建比较矩阵
-    a = line_values < lines_array
-    data_[lines] = a
-    # 获取每个分组在每个线值之前的最后一行索引
-    idxs = [data_[data_[line_col_name] < line].groupby(index).idxmax() for line in lines]
-    res = np.zeros(shape=a.shape)
-    # 标记结果
-    for c, idx in enumerate(idxs):
-        res[idx['index'], c] = 1
 
+    n = len(data)
+    x = data[line_col_name].to_numpy()
+    if x.dtype.kind == 'M':
+        x = x.astype('datetime64[ns]')
+        lines_array = pd.to_datetime(np.asarray(lines)).to_numpy().astype('datetime64[ns]')
+        valid = ~np.isnat(x)
+    else:
+        x = x.astype(np.float64)
+        lines_array = np.asarray(lines, dtype=np.float64)
+        valid = ~np.isnan(x)
+
+    # 分组编码，分组键为空的行编码为-1
+    codes = data.groupby(index, sort=False).ngroup().to_numpy()
+    valid &= codes >= 0
+    rows = np.flatnonzero(valid)
+    x = x[rows]
+    codes = codes[rows]
+    n_groups = codes.max() + 1 if len(codes) > 0 else 0
+
+    # 线值编码为排名，与分组编码组合成整数键
+    uniques, ranks = np.unique(x, return_inverse=True)
+    width = len(uniques) + 1
+    order = np.lexsort((rows, ranks.reshape(-1), codes))
+    keys = codes[order].astype(np.int64) * width + ranks.reshape(-1)[order]
+    rows = rows[order]
+    group_starts = np.searchsorted(keys, np.arange(n_groups, dtype=np.int64) * width)
+
+    # 每个(分组, 线值)：组内最后一个线值小于该线值的行
+    line_ranks = np.searchsorted(uniques, lines_array, side='left')
+    targets = np.arange(n_groups, dtype=np.int64)[:, None] * width + line_ranks[None, :]
+    pos = np.searchsorted(keys, targets, side='left') - 1
+    hit = pos >= group_starts[:, None]
+
+    row_idx = rows[pos[hit]]
+    line_idx = np.nonzero(hit)[1]
+    if sparse:
+        return row_idx, line_idx
+
+    res = np.zeros(shape=(n, len(lines_array)))
+    res[row_idx, line_idx] = 1
     return res
 
 
@@ -284,16 +597,21 @@ def sumprod_timeseries(
 ):
     """
     计算多个时间序列的乘积和
-    
+
+    先按(索引, 轴)对齐全部序列，再在组内向前填充每列的取值：
+    组内第一次观测之前的值列取0，原始缺失值保持为NaN并继续向后填充。
+    重复的(索引, 轴)键与逐对外连接一致，各序列的重复行做笛卡尔积。
+    取值和乘积均按float64列计算。
+
     Args:
         dfs: 数据框列表
         axis_cols: 轴列名列表
         value_cols: 值列名列表
         output_col: 输出列名
         index: 索引列名或列名列表
-        output_axis_col: 输出轴列名
+        output_axis_col: 输出轴列名，默认为'_axis_col'
     Returns:
-        pandas.DataFrame: 包含乘积和的结果数据框
+        pandas.DataFrame: 包含乘积和的结果数据框，列为索引列、其他列和输出列，按(索引, 轴)排序
     """
     # 处理索引参数
     if index is None:
@@ -303,29 +621,82 @@ def sumprod_timeseries(
     else:
         index_ = list(index)
 
-    # 合并时间序列
-    res = merge_timeseries(
+    if output_axis_col is None:
+        output_axis_col = '_axis_col'
+
+    # 对齐时间序列，保持轴列的原始类型
+    union_keys, indexers, frames = align_timeseries(
         dfs=dfs,
-        index=index,
+        index=index_,
         axis_cols=axis_cols,
-        mask_original_na='[na_mask]',
-        output_axis_col=output_axis_col
+        output_axis_col=output_axis_col,
+        duplicates='product'
     )
-
-    # 排序并设置索引
-    res = res.sort_values([*index_, output_axis_col]).set_index(index_)
-    res = res.groupby(index_)
-    # 前向填充缺失值
-    res = res.ffill().reset_index()
-
-    # 填充数值列为0
-    res[[*index_, *value_cols, output_axis_col]] = res[[*index_, *value_cols, output_axis_col]].fillna(0)
-
-    # 恢复原始缺失值标记
-    res.replace('[na_mask]', np.nan, inplace=True)
+    n = len(union_keys)
+    if index_:
+        group_ids = union_keys.groupby(index_, sort=False, dropna=False).ngroup().to_numpy()
+    else:
+        group_ids = np.zeros(n, dtype=np.int64)
+
+    # 组内向前填充：每个数据框的每行取组内最近一次观测的行号
+    key_cols = [*index_, output_axis_col]
+    res = {col: union_keys[col].to_numpy() for col in index_}
+    for df, indexer in zip(frames, indexers):
+        rows = group_ffill_index(indexer >= 0, group_ids)
+        source = np.where(rows >= 0, indexer[np.maximum(rows, 0)], -1)
+        for col in df.columns:
+            if col in key_cols:
+                if col not in res:
+                    res[col] = union_keys[col].to_numpy()
+                continue
+            if col in value_cols:
+                values = np.append(df[col].to_numpy(dtype=np.float64, na_value=np.nan), 0.)
+                res[col] = values[source]
+            else:
+                res[col] = pd.api.extensions.take(df[col].to_numpy(), source, allow_fill=True)
+    res = pd.DataFrame(res)
+    for col in key_cols:
+        res[col] = res[col].astype(union_keys[col].dtype)
 
     # 计算乘积
-    res[output_col] = np.prod(res[value_cols].values, axis=1)
+    res[output_col] = np.prod(res[value_cols].to_numpy(dtype=np.float64), axis=1)
 
     return res
 
+
+def sumprod_timeseries_partitioned(
+        dfs,
+        axis_cols,
+        value_cols,
+        output_col,
+        index,
+        output_axis_col=None,
+        n_partitions=16,
+        n_jobs=1,
+        folder=None,
+        output_folder=None,
+        chunk_size=1000000
+):
+    """
+    按索引列分片计算多个时间序列的乘积和，用于超出内存的数据
+
+    Args:
+        dfs: 输入列表，元素为数据框、parquet文件路径或产出数据框块的可迭代对象
+        axis_cols: 轴列名列表
+        value_cols: 值列名列表
+        output_col: 输出列名
+        index: 索引列名或列名列表，不能为空
+        output_axis_col: 输出轴列名
+        n_partitions: 分片数
+        n_jobs: 进程数
+        folder: 分片文件目录，为None时使用临时目录
+        output_folder: 结果目录，不为None时返回各分片结果文件的路径列表
+        chunk_size: 分片时每块读取的行数
+    Returns:
+        pandas.DataFrame或list: 包含乘积和的结果数据框，或各分片结果文件的路径列表
+    """
+    return apply_partitioned(
+        sumprod_timeseries, dfs, index=index, n_partitions=n_partitions, n_jobs=n_jobs,
+        folder=folder, output_folder=output_folder, chunk_size=chunk_size, axis_cols=axis_cols,
+        value_cols=value_cols, output_col=output_col, output_axis_col=output_axis_col
+    )
@@ -0,0 +1,53 @@
+"""
+nd_array_crop / array_crop 多线程性能测试
+
+运行方式：python bench_hf_math.py [合约数] [区间数]
+输出单线程与不同线程数下的耗时和加速比。
+"""
+
+import os
+import sys
+import time
+import numpy as np
+from mint.helper_function.hf_math import *
+
+
+def bench(func, repeat=3):
+    """
+    返回多次运行中的最短耗时（秒）
+    """
+    best = np.inf
+    for _ in range(repeat):
+        t0 = time.perf_counter()
+        func()
+        best = min(best, time.perf_counter() - t0)
+    return best
+
+
+def bench_crop_scaling(n=200000, m=120, seed=0):
+    rng = np.random.default_rng(seed)
+    sts = rng.integers(0, 3650, n).astype(np.float64)
+    exps = sts + rng.integers(1, 3650, n)
+    bounds = np.arange(m + 1) * 30.0
+    sts_exps = np.stack([bounds[:-1], bounds[1:]], axis=1)
+    out = np.empty((n, m))
+
+    base_nd = bench(lambda: nd_array_crop(sts, exps, sts_exps))
+    base_1d = bench(lambda: array_crop(sts, exps, 300.0, 900.0))
+    expected = nd_array_crop(sts, exps, sts_exps)
+
+    print(f'contracts={n} ranges={m} cpus={os.cpu_count()}')
+    print('%8s %14s %8s %14s %8s' % ('n_jobs', 'nd_crop(s)', 'speedup', 'array_crop(s)', 'speedup'))
+    print('%8s %14.4f %8s %14.4f %8s' % ('base', base_nd, '1.00', base_1d, '1.00'))
+
+    n_jobs_list = sorted({1, 2, 4, 8, 16, 32, os.cpu_count() or 1})
+    for n_jobs in n_jobs_list:
+        t_nd = bench(lambda: nd_array_crop_into(sts, exps, sts_exps, out=out, n_jobs=n_jobs))
+        assert np.array_equal(out, expected)
+        t_1d = bench(lambda: array_crop(sts, exps, 300.0, 900.0, n_jobs=n_jobs))
+        print('%8d %14.4f %8.2f %14.4f %8.2f' % (n_jobs, t_nd, base_nd / t_nd, t_1d, base_1d / t_1d))
+
+
+if __name__ == '__main__':
+    args = [int(item) for item in sys.argv[1:3]]
+    bench_crop_scaling(*args)
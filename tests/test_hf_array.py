@@ -0,0 +1,176 @@
+import numpy as np
+import pandas as pd
+from mint.helper_function.hf_array import *
+
+
+def test_value_change_and_change_to_merge_by_group():
+    a_change = [10, np.nan, 5, 1, np.nan, 2, 3]
+    a_change_to = [np.nan, 100, np.nan, np.nan, 50, 7, np.nan]
+    groups = ['a', 'a', 'b', 'a', 'b', 'b', 'a']
+    res_change, res_change_to = value_change_and_change_to_merge_by_group(
+        a_change, a_change_to, groups, init_value={'a': 1, 'b': 0}
+    )
+    print(res_change, res_change_to)
+    for key, init in [('a', 1), ('b', 0)]:
+        mask = np.array(groups) == key
+        expected = value_change_and_change_to_merge(
+            list(np.array(a_change)[mask]), list(np.array(a_change_to)[mask]), init
+        )
+        assert np.array_equal(res_change[mask], expected[0])
+        assert np.array_equal(res_change_to[mask], expected[1])
+
+    try:
+        value_change_and_change_to_merge_by_group([np.nan, 1, np.nan], [np.nan, 1, np.nan])
+    except ValueError as e:
+        print(e)
+        assert str(e) == 'missing value at index 0, 2'
+    else:
+        raise AssertionError('missing values are not detected')
+
+
+def test_group_cumprod():
+    values = np.array([1.1, 1.2, 0.9, 1.05, 1.3, 2.0])
+    groups = np.array(['a', 'b', 'a', 'b', 'a', 'a'])
+    resets = np.array([False, False, False, False, True, False])
+    res = group_cumprod(values, groups, resets)
+    print(res)
+    assert np.array_equal(res, [1.1, 1.2, prod([1.1, 0.9]), prod([1.2, 1.05]), 1.3, prod([1.3, 2.0])])
+    assert np.allclose(group_cumprod(values, groups, resets, log_space=True), res)
+
+    res, flags = group_cumprod([1e200, 1e200, 0.5], errors='ignore', return_flags=True)
+    print(res, flags)
+    assert list(flags['overflow']) == [False, True, True]
+    try:
+        group_cumprod([1e-200, 1e-200])
+    except OverflowError as e:
+        print(e)
+    else:
+        raise AssertionError('underflow is not detected')
+
+
+def test_group_ffill_index():
+    present = np.array([False, True, False, True, False, False, True])
+    group_ids = np.array([0, 0, 0, 0, 1, 1, 1])
+    res = group_ffill_index(present, group_ids)
+    print(res)
+    assert list(res) == [-1, 1, 1, 3, -1, -1, 6]
+
+
+def test_merge_timeseries_kway():
+    df1 = pd.DataFrame(
+        data={
+            'n': ['b', 'a', 'a', 'b', 'b'],
+            'v1': [1, 2, 3, 4, np.nan],
+            't': [1., 4., 6., 8., 10.]
+        }
+    )
+    df2 = pd.DataFrame(
+        data={
+            'n': ['a', 'b', 'b'],
+            'v2': [1, 2, 3],
+            's': [1., 4., 10.]
+        }
+    )
+    res = merge_timeseries([df1, df2], index='n', axis_cols=['t', 's'], engine='kway')
+    print(res)
+    assert list(res.columns) == ['n', 'v1', '_axis_col', 'v2']
+    assert res['_axis_col'].dtype == np.float64
+    assert list(res['n']) == ['a', 'a', 'a', 'b', 'b', 'b', 'b']
+    assert list(res['_axis_col']) == [1., 4., 6., 1., 4., 8., 10.]
+
+    old = merge_timeseries([df1, df2], index='n', axis_cols=['t', 's'])
+    old['_axis_col'] = old['_axis_col'].astype(float)
+    old = old.sort_values(['n', '_axis_col']).reset_index(drop=True)
+    pd.testing.assert_frame_equal(old[res.columns], res, check_dtype=False)
+
+
+def test_merge_timeseries_partitioned(tmp_path):
+    rng = np.random.default_rng(0)
+    df1 = pd.DataFrame({'n': rng.integers(0, 50, 500), 't': rng.integers(0, 30, 500).astype(float)})
+    df1 = df1.drop_duplicates(['n', 't'])
+    df1['v1'] = rng.random(len(df1))
+    df2 = pd.DataFrame({'n': rng.integers(0, 50, 300), 't': rng.integers(0, 30, 300).astype(float)})
+    df2 = df2.drop_duplicates(['n', 't'])
+    df2['v2'] = rng.random(len(df2))
+
+    path = str(tmp_path / 'df1.parquet')
+    df1.to_parquet(path, index=False)
+    # 第二个输入按块产出，模拟无法一次读入内存的数据
+    chunks = (df2.iloc[i: i + 100] for i in range(0, len(df2), 100))
+    res = merge_timeseries_partitioned(
+        [path, chunks], index='n', axis_cols=['t', 't'], n_partitions=4, engine='kway', chunk_size=200
+    )
+    res = res.sort_values(['n', '_axis_col']).reset_index(drop=True)
+    print(res)
+    expected = merge_timeseries([df1, df2], index='n', axis_cols=['t', 't'], engine='kway')
+    pd.testing.assert_frame_equal(res, expected)
+
+    # 同一索引在不同输入中的dtype不同（int64与float64）时仍落在同一分片
+    df2['n'] = df2['n'].astype(float)
+    res = merge_timeseries_partitioned([df1, df2], index='n', axis_cols=['t', 't'], n_partitions=4, engine='kway')
+    res = res.sort_values(['n', '_axis_col']).reset_index(drop=True)
+    expected = merge_timeseries([df1, df2], index='n', axis_cols=['t', 't'], engine='kway')
+    print(len(res), len(expected))
+    pd.testing.assert_frame_equal(res, expected)
+
+    # 空输入保留列和dtype，结果与整体计算一致
+    path = str(tmp_path / 'empty.parquet')
+    df2.iloc[:0].to_parquet(path, index=False)
+    res = merge_timeseries_partitioned(
+        [df1.iloc[:0], path], index='n', axis_cols=['t', 't'], n_partitions=4, engine='kway'
+    )
+    print(res.dtypes)
+    expected = merge_timeseries([df1.iloc[:0], df2.iloc[:0]], index='n', axis_cols=['t', 't'], engine='kway')
+    pd.testing.assert_frame_equal(res, expected)
+
+
+def test_asof_join():
+    events = pd.DataFrame({
+        'contract': ['a', 'b', 'a', 'a', 'c'],
+        'date': pd.to_datetime(['2024-01-15', '2024-01-15', '2024-03-01', '2023-12-01', '2024-01-15']),
+    })
+    rates = pd.DataFrame({
+        'contract': ['a', 'a', 'b'],
+        'rate_date': pd.to_datetime(['2024-01-01', '2024-02-01', '2024-01-20']),
+        'rate': [0.1, 0.2, 0.3],
+    })
+    status = pd.DataFrame({
+        'contract': ['a', 'b'],
+        'date': pd.to_datetime(['2024-01-15', '2024-01-01']),
+        'status': ['open', 'closed'],
+    })
+    res = asof_join(events, [rates, status], 'contract', 'date', right_ons=['rate_date', 'date'])
+    print(res)
+    assert np.allclose(res['rate'], [0.1, np.nan, 0.2, np.nan, np.nan], equal_nan=True)
+    assert list(res['status'].fillna('')) == ['open', 'closed', 'open', '', '']
+
+    res = asof_join(events, rates, 'contract', 'date', right_ons='rate_date', direction='forward', tolerance='10D')
+    print(res)
+    assert np.allclose(res['rate'], [np.nan, 0.3, np.nan, np.nan, np.nan], equal_nan=True)
+
+
+def test_find_blocks():
+    sheet = pd.DataFrame(np.full((12, 10), None, dtype=object))
+    sheet.iloc[1:4, 1:4] = [['a', 'b', 'c'], [1, 2, 3], [4, 5, 6]]
+    sheet.iloc[1:3, 6:8] = [['x', 'y'], [7, 8]]
+    sheet.iloc[6:10, 2:5] = [['p', 'q', 'r'], [1, None, 2], [3, 4, 5], [6, 7, 8]]
+    blocks = find_blocks(sheet)
+    print(blocks)
+    assert blocks == [(1, 4, 1, 4), (1, 3, 6, 8), (6, 10, 2, 5)]
+
+    res = get_blocks_from_df(sheet)
+    print(res[2])
+    assert list(res[2].columns) == ['p', 'q', 'r'] and res[2].shape == (3, 3)
+
+    crop = get_crop_from_df(sheet, anchor_x=3, anchor_y=2, col_offset=-1)
+    print(crop)
+    assert list(crop.columns) == ['b', 'c'] and crop.shape == (2, 2)
+
+    # 负锚点超出行数时与原先的numpy切片一样截断到第0行
+    df = pd.DataFrame([['a', 'b'], [1, 2], [3, 4], [None, None]])
+    for anchor_x, expected in [(-4, [['a', 'b'], [1, 2]]), (-5, [['a', 'b']]), (-7, [])]:
+        crop = get_crop_from_df(df, anchor_x=anchor_x, anchor_y=0, col_offset=1 - anchor_x)
+        print(anchor_x, crop.values.tolist())
+        assert list(crop.columns) == ['a', 'b'] and crop.values.tolist() == expected
+        crop = get_crop_from_df(df.T, anchor_x=1, anchor_y=anchor_x - 1, vertical=True, col_offset=1 - anchor_x)
+        assert list(crop.columns) == ['a', 'b'] and crop.values.tolist() == expected
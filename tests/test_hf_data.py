@@ -0,0 +1,64 @@
+from mint.helper_function.hf_data import *
+
+
+def test_topological_sort():
+    relation_info = [
+        ['loan', 'contract'],
+        ['repayment', 'loan'],
+        ['contract', None],
+        ['customer', None],
+        ['loan', 'customer'],
+        ['collateral', 'contract'],
+    ]
+    levels = topological_levels(relation_info)
+    print(levels)
+    assert levels == [['contract', 'customer'], ['collateral', 'loan'], ['repayment']]
+
+    res = topological_sort(relation_info)
+    print(res)
+    assert res == ['contract', 'customer', 'collateral', 'loan', 'repayment']
+    assert topological_sort(relation_info, reverse=True) == res[::-1]
+
+    # 深链不受递归深度限制
+    chain = [['n%06d' % (i + 1), 'n%06d' % i] for i in range(20000)]
+    res = topological_sort(chain)
+    assert res[0] == 'n000000' and res[-1] == 'n020000'
+
+    try:
+        topological_sort([['a', 'b'], ['b', 'c'], ['c', 'a'], ['d', 'a']])
+    except ValueError as e:
+        print(e)
+        assert "['a', 'b', 'c', 'a']" in str(e)
+    else:
+        raise AssertionError('cycle not detected')
+
+
+def test_graph():
+    relation_info = [
+        ['loan', 'contract'],
+        ['repayment', 'loan'],
+        ['contract', None],
+        ['customer', None],
+        ['loan', 'customer'],
+        ['collateral', 'contract'],
+        ['calendar', None],
+    ]
+    graph = Graph(relation_info)
+    print(graph.nodes)
+    assert graph.ancestors('repayment') == ['contract', 'customer', 'loan']
+    assert graph.descendants('contract') == ['collateral', 'loan', 'repayment']
+    assert graph.related('contract') == get_related_nodes(get_graph(relation_info), 'contract')
+    assert graph.related('loan') == ['contract', 'customer', 'loan', 'repayment']
+    assert graph.connected_components() == [
+        ['calendar'], ['collateral', 'contract', 'customer', 'loan', 'repayment']
+    ]
+
+    sub = graph.subgraph(['loan', 'repayment', 'customer'])
+    print(sub.to_relation_info())
+    assert sub.to_relation_info() == [['customer', None], ['loan', 'customer'], ['repayment', 'loan']]
+    assert sub.topological_sort() == ['customer', 'loan', 'repayment']
+
+
+if __name__ == '__main__':
+    test_topological_sort()
+    test_graph()
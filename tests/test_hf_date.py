@@ -1,3 +1,4 @@
+import itertools
 from mint.helper_function.hf_date import *
 from mint.settings import *
 
@@ -19,5 +20,178 @@ def test_get_overlap_days():
     print(res)
 
 
+def test_gen_date_series():
+    start = dt(2019, 1, 1)
+    end = dt(2023, 12, 31)
+    for date_string in ['2021/feb/sat', 'y/m/t3', 'y/m/t1,15', '2020,2022/1,jun,dec/mon,fri,t2']:
+        res = gen_date_series(date_string, start, end)
+        expected = [
+            item for item in pd.date_range(start, end, freq='D')
+            if is_satisfy_date_string(item, date_string)
+        ]
+        assert res == expected
+        print(date_string, len(res))
+
+
+def test_nth_workday_table():
+    table = get_nth_workday_table(dt(2022, 1, 1), dt(2022, 12, 1))
+    months = pd.date_range(dt(2022, 1, 1), dt(2022, 12, 1), freq='MS').values
+    print(table.get(months, 1))
+    print(table.get(months, -1))
+
+    res = gen_date_series('y/m/t-1', dt(2022, 1, 1), dt(2022, 12, 31))
+    assert res == list(pd.date_range(dt(2022, 1, 1), dt(2022, 12, 31), freq='BME'))
+
+
+def test_business_calendar():
+    calendar = {
+        d: d.weekday() < 5 and not (d.month == 1 and d.day < 4)
+        for d in pd.date_range(dt(2022, 1, 1), dt(2022, 12, 31), freq='D')
+    }
+    bc = BusinessCalendar.from_dict(calendar)
+    print(bc)
+
+    dates = pd.Series(pd.date_range(dt(2022, 1, 1), dt(2022, 1, 31), freq='D'))
+    print(bc.is_workday(dates))
+    print(bc.add_workdays(dates, 2))
+    print(bc.count_workdays_between(dates, dates + pd.Timedelta(days=7)))
+
+    for date in dates[10:]:
+        for days in [-1, 0, 1, 3]:
+            assert get_work_day(date, bc, days) == get_work_day(date, calendar, days)
+
+
+def test_to_dt_array():
+    dates = pd.Series(['2021/1/5', '2021-01-06', '20210107', dt(2021, 1, 8), None, 'nan', '2021/2/30', 'abc'])
+    res, report = to_dt_array(dates, return_report=True)
+    print(res)
+    print(report)
+    assert report['n_errors'] == 2
+
+    # 超出datetime64[ns]范围的日期置为NaT并计入错误，而不是溢出成错误的日期
+    dates = [dt(9999, 12, 31), '9999/12/31', np.datetime64('9999-12-31'), dt(2300, 1, 1), '2021/1/5']
+    res, report = to_dt_array(dates, return_report=True)
+    print(res)
+    assert np.isnat(res[:4]).all() and res[4] == np.datetime64('2021-01-05')
+    assert report['n_errors'] == 4
+    res, report = to_dt_array(np.array(['9999-12-31', '2021-01-05'], dtype='datetime64[D]'), return_report=True)
+    assert np.isnat(res[0]) and res[1] == np.datetime64('2021-01-05') and report['n_errors'] == 1
+
+    # 带时区的值转换为UTC后去掉时区，可以与不带时区的值混合
+    dates = ['2021/1/5', pd.Timestamp('2021-01-05 08:00', tz='Asia/Shanghai')]
+    res, report = to_dt_array(dates, return_report=True)
+    print(res)
+    assert (res == np.datetime64('2021-01-05')).all() and report['n_errors'] == 0
+
+
+def test_get_overlap_days_sum():
+    sts = pd.date_range(dt(2024, 1, 1), dt(2025, 1, 1), freq='MS')
+    exps = pd.date_range(dt(2024, 2, 1), dt(2025, 2, 1), freq='MS')
+    groups = np.arange(len(sts)) % 3
+
+    dates = pd.date_range(dt(2024, 1, 1), dt(2025, 1, 1), freq='MS')
+    ranges = list(zip(dates[:-1], dates[1:]))
+
+    res = get_overlap_days(sts=sts, exps=exps, ranges=ranges, dtype=np.int32, memory_budget=1024)
+    print(res)
+    assert (get_overlap_days_sum(sts, exps, ranges, by='range') == res.sum(axis=0)).all()
+    assert (get_overlap_days_sum(sts, exps, ranges, by='contract') == res.sum(axis=1)).all()
+    print(get_overlap_days_sum(sts, exps, ranges, by='group', groups=groups))
+
+    # 超出datetime64[ns]范围的结束日期（如9999-12-31）不能溢出
+    ranges = [(dt(2020, 1, 1), dt(2021, 1, 1))]
+    assert get_overlap_days([dt(2020, 1, 1)], [dt(9999, 12, 31)], ranges)[0, 0] == 366
+    assert get_overlap_days([dt(2020, 1, 1)], [None], ranges, exp_fillna=dt(2300, 1, 1))[0, 0] == 366
+    res = get_overlap_days([dt(2020, 1, 1)], [dt(9999, 12, 31)], ranges, dtype=np.int32, memory_budget=64)
+    assert res.dtype == np.int32 and res[0, 0] == 366
+
+
+def test_calendar_store(tmp_path):
+    folder = str(tmp_path)
+    path = os.path.join(folder, 'i_calendar_2022.xlsx')
+    days = pd.date_range(dt(2022, 1, 1), dt(2022, 12, 31), freq='D')
+    pd.DataFrame({'date': days, 'workday': (days.weekday < 5).astype(int)}).to_excel(path, index=False)
+
+    store_path = os.path.join(folder, 'calendar.hfcal')
+    calendar = read_business_calendar(path, store_path=store_path)
+    assert not is_calendar_store_stale(path, store_path)
+    calendar_loaded = load_calendar_store(store_path)
+    print(calendar_loaded)
+    assert (calendar_loaded.workdays == calendar.workdays).all()
+    assert read_calendar(path, store_path=store_path) == read_calendar(path)
+
+
+def test_schedule():
+    schedule = Schedule('y/m/mon,fri', hour_string='9,14', minute_string='30', second_string='0')
+    res = list(itertools.islice(schedule.iter_fire_times(dt(2022, 1, 3, 9, 30)), 4))
+    print(res)
+    assert res == [dt(2022, 1, 3, 14, 30), dt(2022, 1, 7, 9, 30), dt(2022, 1, 7, 14, 30), dt(2022, 1, 10, 9, 30)]
+
+    schedule = Schedule('y/m/d', hour_string='h', minute_string='15m', second_string='0')
+    assert schedule.next_fire(dt(2022, 1, 1, 23, 50)) == dt(2022, 1, 2)
+    assert Schedule('y/2/30').next_fire(dt(2022, 1, 1)) is None
+    assert not Schedule('y/4/31').is_possible
+    assert Schedule('y/2/29').next_fire(dt(2096, 3, 1)) == dt(2104, 2, 29)
+    assert Schedule('2050/1/1').next_fire(dt(2022, 1, 1)) == dt(2050, 1, 1)
+
+    try:
+        Schedule('y/m/d', hour_string='0h')
+    except ValueError as e:
+        print(e)
+    else:
+        raise AssertionError('zero step not rejected')
+
+
+def test_date_ext_to_date_array():
+    s = pd.Series(['20210101-20211231', '20210505', '2021-01-01', '20210230', None])
+    st, exp, report = date_ext_to_date_array(s, return_report=True)
+    print(st)
+    print(exp)
+    print(report)
+    assert st[0] == np.datetime64('2021-01-01') and exp[0] == np.datetime64('2021-12-31')
+    assert st[1] == exp[1] == np.datetime64('2021-05-05')
+    assert list(report['index']) == [2, 3]
+
+    # 超出datetime64[ns]范围的到期日不能溢出成错误的日期
+    st, exp, report = date_ext_to_date_array(['20200101-99991231', '20200101-20201231'], return_report=True)
+    print(report)
+    assert st[0] == np.datetime64('2020-01-01') and np.isnat(exp[0]) and exp[1] == np.datetime64('2020-12-31')
+    assert report['n_errors'] == 1 and list(report['index']) == [0]
+    assert report['errors'] == ['20200101-99991231']
+
+
+def test_get_date_spans():
+    dates = [item for item in pd.date_range(dt(2022, 1, 1), dt(2022, 12, 31), freq='D') if item.day != 15]
+    spans = get_date_spans(dates)
+    print(spans)
+    assert len(spans) == 13
+
+
+def test_bucket_dates():
+    breakpoints = get_breakpoints('y/m/t1', dt(2022, 1, 1), dt(2022, 12, 31))
+    dates = pd.Series(pd.to_datetime(['2022-01-02', '2022-01-03', '2022-02-01', '2022-02-02', None]))
+    res = bucket_dates(dates, breakpoints)
+    print(res)
+    assert res.tolist() == [-1, 0, 1, 1, -1]
+    print(bucket_aggregate(dates, [1, 2, 3, 4, 5], breakpoints, agg='sum'))
+
+
+def test_get_accrual():
+    sts = [dt(2024, 1, 15), dt(2024, 2, 1), None]
+    exps = [dt(2024, 3, 15), dt(2024, 12, 31), dt(2024, 2, 10)]
+    notionals = [1000000, 500000, 200000]
+    dates = pd.date_range(dt(2024, 1, 1), dt(2024, 7, 1), freq='MS')
+    ranges = list(zip(dates[:-1], dates[1:]))
+
+    fractions, amounts = get_accrual(sts, exps, notionals, ranges, rates=0.05, convention='ACT/360')
+    assert np.allclose(fractions * 360, get_overlap_days(sts, exps, ranges))
+    print(amounts)
+
+    calendar = BusinessCalendar.from_weekends(dt(2024, 1, 1), dt(2024, 12, 31))
+    for convention in ['ACT/365', '30/360']:
+        print(get_accrual(sts, exps, notionals, ranges, rates=0.05, convention=convention, output='long'))
+    print(get_accrual(sts, exps, notionals, ranges, convention='BUS/252', calendar=calendar, output='long'))
+
+
 if __name__ == '__main__':
     test_get_overlap_days()
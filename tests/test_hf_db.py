@@ -0,0 +1,56 @@
+from datetime import datetime as dt
+from mint.helper_function.hf_db import *
+
+
+class RecordingConnection:
+    """记录执行的SQL语句和参数，用于检查生成的临时表语句"""
+
+    def __init__(self):
+        self.statements = []
+
+    def execute(self, statement, params=None):
+        self.statements.append((str(statement), params))
+
+
+def test_get_date_range_predicate():
+    dates = list(pd.date_range(dt(2024, 1, 1), dt(2024, 1, 3))) + [dt(2024, 1, 10)]
+    sql, params = get_date_range_predicate('`st`', dates)
+    print(sql, params)
+    assert sql == (
+        '((`st` >= :date_0_st AND `st` < :date_0_ed) OR (`st` >= :date_1_st AND `st` < :date_1_ed))'
+    )
+    assert params == {
+        'date_0_st': dt(2024, 1, 1), 'date_0_ed': dt(2024, 1, 4),
+        'date_1_st': dt(2024, 1, 10), 'date_1_ed': dt(2024, 1, 11),
+    }
+
+    sql, params = get_date_range_predicate('t.`date`', dates, half_open=False, param_prefix='d')
+    assert sql == '((t.`date` BETWEEN :d_0_st AND :d_0_ed) OR (t.`date` BETWEEN :d_1_st AND :d_1_ed))'
+    assert params['d_0_ed'] == dt(2024, 1, 3)
+
+    assert get_date_range_predicate('`st`', []) == ('1 = 0', {})
+
+
+def test_get_date_range_predicate_temp_table():
+    # 外层日期列名为st时，EXISTS子查询中不能被解析为临时表的列
+    dates = pd.date_range(dt(2024, 1, 1), dt(2024, 1, 31), freq='2D')
+    con = RecordingConnection()
+    sql, params = get_date_range_predicate('`st`', dates, max_spans=3, con=con)
+    print(sql)
+    assert params == {}
+    assert sql == (
+        'EXISTS (SELECT 1 FROM `tmp_date_spans` AS `hf_spans` '
+        'WHERE `st` >= `hf_spans`.`hf_span_st` AND `st` < `hf_spans`.`hf_span_ed`)'
+    )
+
+    create_sql = con.statements[1][0]
+    insert_sql, rows = con.statements[2]
+    print(create_sql)
+    assert '`st`' not in create_sql and '`ed`' not in create_sql
+    assert insert_sql == 'INSERT INTO `tmp_date_spans` (`hf_span_st`, `hf_span_ed`) VALUES (:st, :ed)'
+    assert len(rows) == len(dates)
+    assert rows[0] == {'st': dt(2024, 1, 1), 'ed': dt(2024, 1, 2)}
+
+
+if __name__ == '__main__':
+    test_get_date_range_predicate()
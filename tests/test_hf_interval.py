@@ -0,0 +1,90 @@
+import numpy as np
+from mint.helper_function.hf_interval import *
+
+
+def test_sorted_interval_index():
+    sts = np.array([0, 2, 5, 7, 9], dtype=float)
+    exps = np.array([4, 3, 8, 7, 12], dtype=float)
+    index = SortedIntervalIndex(sts, exps)
+    print(index)
+
+    ids = index.overlap(3, 8)
+    print(ids)
+    assert list(ids) == [0, 2]
+
+    a = np.array([0, 3, 6, 10])
+    b = np.array([1, 8, 10, 20])
+    counts = index.count(a, b)
+    totals = index.total_overlap(a, b)
+    print(counts, totals)
+    for i in range(len(a)):
+        overlap = np.maximum(np.minimum(exps, b[i]) - np.maximum(sts, a[i]), 0)
+        assert counts[i] == (overlap > 0).sum()
+        assert totals[i] == overlap.sum()
+
+    index.append([1], [10])
+    offsets, ids = index.overlap_batch(a, b)
+    print(offsets, ids)
+    assert list(ids[offsets[1]: offsets[2]]) == [0, 2, 5]
+
+    # 批量查询与逐个窗口查询一致
+    rng = np.random.default_rng(0)
+    sts = rng.integers(0, 1000, 500).astype(float)
+    index = SortedIntervalIndex(sts, sts + rng.integers(-5, 50, 500))
+    a = rng.integers(-10, 1010, 200).astype(float)
+    b = a + rng.integers(-5, 60, 200)
+    offsets, ids = index.overlap_batch(a, b)
+    for i in range(len(a)):
+        assert np.array_equal(ids[offsets[i]: offsets[i + 1]], index.overlap(a[i], b[i]))
+
+
+def test_sorted_interval_index_dates():
+    sts = np.array(['2024-01-01', '2024-03-01'], dtype='datetime64[D]')
+    exps = np.array(['2024-02-01', '2025-01-01'], dtype='datetime64[D]')
+    index = SortedIntervalIndex(sts, exps)
+    total = index.total_overlap(np.datetime64('2024-01-15'), np.datetime64('2024-04-01'))
+    print(total)
+    assert total == np.timedelta64(48, 'D')
+    assert index.total_overlap(np.datetime64('2024-01-15'), np.datetime64('2024-04-01'), unit='h') == 48 * 24
+
+    # 约1000个一年期区间的纳秒总长度超出timedelta64范围
+    sts = np.datetime64('2000-01-01', 'ns') + np.arange(1000).astype('timedelta64[D]')
+    index = SortedIntervalIndex(sts, sts + np.timedelta64(365, 'D'))
+    a, b = np.datetime64('1990-01-01', 'ns'), np.datetime64('2010-01-01', 'ns')
+    assert index.total_overlap(a, b, unit='D') == 365000
+    try:
+        index.total_overlap(a, b)
+    except OverflowError as e:
+        print(e)
+    else:
+        raise AssertionError('overflow not detected')
+
+    # 纳秒端点的前缀和不能有舍入误差
+    sts = np.datetime64('2000-01-01', 'ns') + np.arange(1000) * np.timedelta64(3, 'D')
+    index = SortedIntervalIndex(sts, sts + np.timedelta64(1, 'ns'))
+    assert index.total_overlap(a, np.datetime64('2030-01-01', 'ns')) == np.timedelta64(1000, 'ns')
+
+
+def test_interval_algebra():
+    sts = np.array([1, 3, 10, np.nan, 20])
+    exps = np.array([4, 6, 12, 0, np.nan])
+    print(interval_merge(sts, exps))
+    m_sts, m_exps = interval_merge(sts, exps)
+    assert np.isnan(m_sts[0]) and list(m_exps[:2]) == [0, 6]
+    assert np.isnan(m_exps[-1])
+
+    i_sts, i_exps = interval_intersect(sts, exps, [5, 11], [21, 30])
+    print(i_sts, i_exps)
+    assert list(i_sts) == [5, 10, 20] and list(i_exps) == [6, 12, 30]
+
+    s_sts, s_exps = interval_subtract([0], [10], [2, 5], [3, 7])
+    print(s_sts, s_exps)
+    assert list(s_sts) == [0, 3, 7] and list(s_exps) == [2, 5, 10]
+
+    print(interval_coverage(sts[:3], exps[:3]))
+    assert interval_coverage(sts[:3], exps[:3]) == 7
+
+    groups = np.array(['a', 'a', 'b', 'b', 'b'])
+    coverage = interval_coverage([1, 2, 0, 5, 5], [3, 4, 1, 6, 9], groups)
+    print(coverage)
+    assert coverage['a'] == 3 and coverage['b'] == 5
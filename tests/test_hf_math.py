@@ -30,6 +30,26 @@ def test_array_minus():
     print(array_minus(a, v))
 
 
+def test_nd_array_minus():
+    a = np.array([[550, 150, 200, 0, 100], [100, 0, 0, 0, 0], [10, 20, 30, 40, 50]])
+    v = np.array([750, 50, 200])
+    res = nd_array_minus(a, v)
+    print(res)
+    for i in range(len(a)):
+        assert np.array_equal(res[i], array_minus(a[i].copy(), v[i]))
+
+    order = [4, 3, 2, 1, 0]
+    res = nd_array_minus(a, v, order=order)
+    print(res)
+    for i in range(len(a)):
+        assert np.array_equal(res[i][order], array_minus(a[i][order].copy(), v[i]))
+
+    remaining, allocations = nd_array_waterfall(a, np.stack([v, v // 2], axis=1), order=[None, order])
+    print(remaining)
+    print(allocations)
+    assert np.array_equal(remaining + allocations.sum(axis=0), a)
+
+
 def test_nd_array_op():
     a = np.array([1, 2, 3, 4, 5])
     b = np.array([6, 7, 8, 9, 10])
@@ -89,6 +109,61 @@ def test_sumprod_timeseries():
     print(a)
 
 
+def test_sumprod_timeseries_na():
+    rates = pd.DataFrame({'n': ['a', 'a', 'a'], 'rate': [0.1, np.nan, 0.3], 't': [1., 3., 5.]})
+    balances = pd.DataFrame({'n': ['a', 'a'], 'balance': [100., 200.], 't': [2., 5.]})
+    res = sumprod_timeseries(
+        dfs=[rates, balances],
+        axis_cols=['t', 't'],
+        value_cols=['rate', 'balance'],
+        output_col='res',
+        index='n'
+    )
+    print(res)
+    assert list(res['_axis_col']) == [1., 2., 3., 5.]
+    assert list(res['balance']) == [0., 100., 100., 200.]
+    # 原始缺失值向后填充后仍为缺失，不会被填为0
+    assert np.isnan(res['rate'][2]) and np.isnan(res['res'][2])
+    assert np.allclose(res['res'][[0, 1, 3]], [0., 10., 60.])
+
+
+def test_sumprod_timeseries_duplicates():
+    # 重复的(索引, 轴)键与逐对外连接一致，各序列的重复行做笛卡尔积
+    rates = pd.DataFrame({'k': [1, 1, 1], 't': [1, 1, 2], 'rate': [3., 6., 7.]})
+    balances = pd.DataFrame({'k': [1, 1, 1], 't': [1, 1, 3], 'balance': [1., 2., 5.]})
+    res = sumprod_timeseries(
+        dfs=[rates], axis_cols=['t'], value_cols=['rate'], output_col='res', index='k'
+    )
+    print(res)
+    assert list(res['res']) == [3., 6., 7.]
+
+    res = sumprod_timeseries(
+        dfs=[rates, balances],
+        axis_cols=['t', 't'],
+        value_cols=['rate', 'balance'],
+        output_col='res',
+        index='k'
+    )
+    print(res)
+    assert list(res['_axis_col']) == [1, 1, 1, 1, 2, 3]
+    assert list(res['res']) == [3., 6., 6., 12., 14., 35.]
+
+
+def test_sumprod_timeseries_partitioned(tmp_path):
+    rng = np.random.default_rng(0)
+    rates = pd.DataFrame({'n': rng.integers(0, 20, 200), 't': rng.random(200), 'rate': rng.random(200)})
+    balances = pd.DataFrame({'n': rng.integers(0, 20, 100), 't': rng.random(100), 'balance': rng.random(100)})
+    kwargs = dict(axis_cols=['t', 't'], value_cols=['rate', 'balance'], output_col='res', index='n')
+    expected = sumprod_timeseries([rates, balances], **kwargs)
+    # 按小块读取输入，结果与整体计算一致
+    res = sumprod_timeseries_partitioned(
+        [rates, balances], n_partitions=4, folder=str(tmp_path), chunk_size=30, **kwargs
+    )
+    res = res.sort_values(['n', '_axis_col']).reset_index(drop=True)
+    print(res)
+    assert np.allclose(res['res'], expected['res'])
+
+
 def test_outer():
     df1 = pd.DataFrame(
         {
@@ -105,5 +180,41 @@ def test_outer():
     print(pd.merge(df1, df2, on='a', how='left'))
 
 
+def test_nd_array_crop_n_jobs():
+    rng = np.random.default_rng(0)
+    sts = rng.integers(0, 1000, 1001).astype(float)
+    exps = sts + rng.integers(1, 500, 1001)
+    sts_exps = np.array([[0, 100], [100, 400], [400, 1200]], dtype=float)
+    expected = nd_array_crop(sts, exps, sts_exps)
+    res = nd_array_crop(sts, exps, sts_exps, n_jobs=4)
+    print(res[:5])
+    assert np.array_equal(res, expected)
+    assert np.array_equal(array_crop(sts, exps, 100, 400, n_jobs=3), array_crop(sts, exps, 100, 400))
+
+
+def test_get_group_last_row_before_line():
+    data = pd.DataFrame({
+        'contract': ['a', 'a', 'a', 'b', 'b'],
+        'date': pd.to_datetime(['2024-01-01', '2024-02-01', '2024-03-01', '2024-01-15', '2024-03-15']),
+    })
+    lines = pd.to_datetime(['2024-01-10', '2024-02-01', '2024-04-01'])
+    res = get_group_last_row_before_line(data, 'contract', 'date', data[['date']].values, lines)
+    print(res)
+    assert np.array_equal(res, [
+        [1, 1, 0],
+        [0, 0, 0],
+        [0, 0, 1],
+        [0, 1, 0],
+        [0, 0, 1],
+    ])
+    rows, cols = get_group_last_row_before_line(data, 'contract', 'date', None, lines, sparse=True)
+    assert np.array_equal(res[rows, cols], np.ones(len(rows)))
+    assert res.sum() == len(rows)
+
+    # 只用data[line_col_name]比较，line_values不影响结果
+    shifted = data[['date']].values + np.timedelta64(30, 'D')
+    assert np.array_equal(get_group_last_row_before_line(data, 'contract', 'date', shifted, lines), res)
+
+
 if __name__ == '__main__':
-    test_sumprod_timeseries()
\ No newline at end of file
+    test_sumprod_timeseries()